@@ -7,6 +7,7 @@ Main application file for the fashion recommender system
 import os
 import sys
 import logging
+import threading
 from datetime import datetime
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
@@ -18,9 +19,9 @@ sys.path.append(os.path.dirname(__file__))
 # Import configuration and services
 from core.config import get_settings
 from database import get_database_connection
-from models.fashion_classifier import FashionClassifier
 from utils.image_processor import ImageProcessor
 from utils.model_loader import ModelLoader
+from utils.batching import DynamicBatcher
 
 # Get settings
 settings = get_settings()
@@ -42,30 +43,51 @@ CORS(app)
 
 # Initialize services
 db = get_database_connection()
-model_loader = ModelLoader()
+model_loader = ModelLoader(
+    classifier_runtime=settings.classifier_runtime,
+    num_threads=settings.classifier_num_threads
+)
 image_processor = ImageProcessor()
 
-# Global variables for loaded models
-fashion_classifier = None
-recommendation_model = None
+# Models load on background threads; these handles give them out once warmed up
+fashion_classifier_handle = model_loader.lazy("fashion_classifier")
+recommendation_model_handle = model_loader.lazy("recommendation_model")
+classify_batcher = None
+_batcher_lock = threading.Lock()
+
+# Models the API cannot serve without; /ready waits for all of them
+REQUIRED_MODELS = ("fashion_classifier", "recommendation_model")
 
 def load_models():
-    """Load ML models on startup"""
-    global fashion_classifier, recommendation_model
+    """Start loading ML models in the background (returns immediately)"""
+    model_loader.preload(*REQUIRED_MODELS)
+
+def get_classify_batcher():
+    """Batcher over the fashion classifier, or None while the model is not ready"""
+    global classify_batcher
     
-    try:
-        # Load fashion classification model
-        fashion_classifier = model_loader.load_fashion_classifier()
-        logger.info("✅ Fashion classifier loaded successfully")
-        
-        # Load recommendation model
-        recommendation_model = model_loader.load_recommendation_model()
-        logger.info("✅ Recommendation model loaded successfully")
-        
-    except Exception as e:
-        logger.error(f"❌ Error loading models: {e}")
-        fashion_classifier = None
-        recommendation_model = None
+    fashion_classifier = fashion_classifier_handle.get()
+    if fashion_classifier is None:
+        return None
+    
+    # Concurrent classify requests share one batched forward pass
+    with _batcher_lock:
+        if classify_batcher is None:
+            classify_batcher = DynamicBatcher(
+                fashion_classifier.predict_batch,
+                max_batch_size=settings.classify_max_batch_size,
+                max_wait_ms=settings.classify_batch_wait_ms,
+                name="classify-batcher"
+            )
+    return classify_batcher
+
+def model_unavailable_response(handle, label: str):
+    """503 telling the client whether to retry (still loading) or not"""
+    if handle.state in (handle.IDLE, handle.LOADING):
+        response = jsonify({"error": f"{label} is still loading", "state": handle.state})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    return jsonify({"error": f"{label} not available", "state": handle.state}), 503
 
 # Application state
 app_start_time = datetime.now()
@@ -90,20 +112,18 @@ def home():
             "recommend": "POST /api/recommend",
             "analyze_colors": "POST /api/analyze-colors",
             "similar_items": "POST /api/similar-items",
-            "health": "GET /health"
+            "health": "GET /health",
+            "ready": "GET /ready"
         }
     })
 
 @app.route('/health')
 def health_check():
-    """Health check endpoint"""
+    """Liveness check: the process is up and serving requests (models may still be loading)"""
     try:
         # Check database connection
         db_status = "connected" if db else "disconnected"
         
-        # Check model availability
-        model_status = "loaded" if fashion_classifier else "not_loaded"
-        
         # Calculate uptime
         uptime = str(datetime.now() - app_start_time)
         
@@ -113,8 +133,9 @@ def health_check():
             "uptime": uptime,
             "services": {
                 "database": db_status,
-                "ml_models": model_status
-            }
+                "ml_models": model_loader.readiness()
+            },
+            "classify_batching": classify_batcher.get_stats() if classify_batcher else None
         })
     except Exception as e:
         logger.error(f"Health check error: {e}")
@@ -123,6 +144,24 @@ def health_check():
             "message": str(e)
         }), 500
 
+@app.route('/ready')
+def readiness_check():
+    """Readiness check: 200 only once every required model is loaded and warmed up"""
+    models = model_loader.readiness()
+    states = {name: models.get(name, {}).get("state", "idle") for name in REQUIRED_MODELS}
+    loading = [name for name, state in states.items() if state in ("idle", "loading")]
+    # A model that failed or has no file will not become ready without operator action
+    failed = [name for name, state in states.items() if state in ("failed", "unavailable")]
+    ready = all(state == "ready" for state in states.values())
+    
+    return jsonify({
+        "ready": ready,
+        "timestamp": datetime.now().isoformat(),
+        "loading": loading,
+        "failed": failed,
+        "models": models
+    }), 200 if ready else 503
+
 @app.route('/api/classify', methods=['POST'])
 def classify_fashion():
     """Classify fashion items from uploaded images"""
@@ -134,14 +173,15 @@ def classify_fashion():
         if file.filename == '':
             return jsonify({"error": "No image file selected"}), 400
         
-        if not fashion_classifier:
-            return jsonify({"error": "Fashion classifier not available"}), 503
+        batcher = get_classify_batcher()
+        if not batcher:
+            return model_unavailable_response(fashion_classifier_handle, "Fashion classifier")
         
         # Process image
         image_data = image_processor.process_uploaded_image(file)
         
-        # Classify
-        predictions = fashion_classifier.predict(image_data)
+        # Classify, batched together with any concurrent requests
+        predictions = batcher(image_data[0], timeout=settings.classify_timeout)
         
         return jsonify({
             "predictions": predictions,
@@ -167,8 +207,9 @@ def recommend_items():
         current_items = data.get('current_items', [])
         style_type = data.get('style_type', 'casual')
         
+        recommendation_model = recommendation_model_handle.get()
         if not recommendation_model:
-            return jsonify({"error": "Recommendation model not available"}), 503
+            return model_unavailable_response(recommendation_model_handle, "Recommendation model")
         
         # Generate recommendations
         recommendations = recommendation_model.recommend(
@@ -252,18 +293,11 @@ def internal_error(error):
         "message": "An unexpected error occurred"
     }), 500
 
-# Startup event
-@app.before_first_request
-def startup():
-    """Initialize the application"""
-    logger.info("🚀 Starting Fashion Recommender API")
-    load_models()
-    logger.info("✅ Application startup complete")
+# Startup: models load in the background so the process can accept requests immediately
+logger.info("🚀 Starting Fashion Recommender API")
+load_models()
 
 if __name__ == '__main__':
-    # Load models before starting
-    load_models()
-    
     # Start Flask app
     app.run(
         host=settings.get('HOST', '0.0.0.0'),
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Fashion classifier runtime benchmark for ManVue
+Compares latency, throughput, memory and top-1 agreement of the Keras model
+against its TFLite / ONNX exports on CPU
+
+Usage:
+    python benchmark_classifier.py --models-dir ../models --export dynamic
+    python benchmark_classifier.py --runtimes keras tflite --batch-sizes 1 8 32 --images ./samples
+"""
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+import numpy as np
+
+sys.path.append(os.path.dirname(__file__))
+
+from utils.model_loader import ModelLoader
+from utils.image_context import ImageContext
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MB (Linux)"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1e6
+    except ImportError:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+def load_inputs(images_dir: str, count: int, input_shape) -> np.ndarray:
+    """Real images from a directory if given, otherwise a fixed random batch"""
+    height, width = input_shape[:2]
+    if images_dir:
+        paths = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp"))[:count]
+        if paths:
+            return np.concatenate([ImageContext(p.read_bytes()).normalized((width, height)) for p in paths])
+    rng = np.random.default_rng(0)
+    return rng.random((count,) + tuple(input_shape), dtype=np.float32)
+
+def top1(predictions) -> np.ndarray:
+    return np.array([max(p, key=p.get) for p in predictions])
+
+def benchmark(classifier, inputs: np.ndarray, batch_sizes, iterations: int) -> dict:
+    """Latency percentiles and throughput per batch size"""
+    results = {}
+    for batch_size in batch_sizes:
+        batch = np.resize(inputs, (batch_size,) + inputs.shape[1:])
+        classifier.predict_batch(batch)  # warm-up / trace
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            classifier.predict_batch(batch)
+            timings.append(time.perf_counter() - start)
+        timings = np.array(timings) * 1000
+        results[batch_size] = {
+            "p50_ms": float(np.percentile(timings, 50)),
+            "p95_ms": float(np.percentile(timings, 95)),
+            "images_per_s": batch_size / (np.median(timings) / 1000)
+        }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fashion classifier runtimes")
+    parser.add_argument("--models-dir", default="../models")
+    parser.add_argument("--runtimes", nargs="+", default=["keras", "tflite", "onnx"])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--images", default=None, help="Directory of sample images for the agreement check")
+    parser.add_argument("--samples", type=int, default=64, help="Images used for the agreement check")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--export", choices=["none", "dynamic", "int8"], default=None,
+                        help="Export the Keras model to TFLite/ONNX with this quantization before benchmarking")
+    args = parser.parse_args()
+
+    loader = ModelLoader(models_dir=args.models_dir, num_threads=args.threads)
+
+    baseline_rss = rss_mb()
+    reference = loader.load_fashion_classifier(runtime="keras")
+    if reference is None:
+        print(f"❌ Keras model fashion_classifier.h5 not found in {args.models_dir}")
+        return 1
+    keras_rss = rss_mb() - baseline_rss
+
+    inputs = load_inputs(args.images, args.samples, reference.input_shape)
+
+    if args.export:
+        representative = [inputs[i:i + 1] for i in range(min(len(inputs), 100))]
+        loader.save_model(reference, "fashion_classifier", "tflite",
+                          quantization=args.export, representative_data=representative)
+        loader.save_model(reference, "fashion_classifier", "onnx")
+
+    reference_top1 = top1(reference.predict_batch(inputs))
+
+    print(f"{'runtime':<8} {'batch':>5} {'p50 ms':>9} {'p95 ms':>9} {'img/s':>9} {'mem MB':>8} {'top-1 agree':>11}")
+    for runtime in args.runtimes:
+        if runtime == "keras":
+            classifier, memory = reference, keras_rss
+        else:
+            before = rss_mb()
+            classifier = loader.load_fashion_classifier(runtime=runtime)
+            memory = rss_mb() - before
+            if classifier is None:
+                print(f"{runtime:<8} skipped (no fashion_classifier export or runtime not installed)")
+                continue
+
+        agreement = float(np.mean(top1(classifier.predict_batch(inputs)) == reference_top1))
+        for batch_size, stats in benchmark(classifier, inputs, args.batch_sizes, args.iterations).items():
+            print(f"{runtime:<8} {batch_size:>5} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+                  f"{stats['images_per_s']:>9.1f} {memory:>8.0f} {agreement:>11.1%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
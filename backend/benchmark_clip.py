@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+CLIP image encoder benchmark for ManVue visual search
+Compares the float32 encoder against its dynamically quantized int8 version on CPU:
+latency, throughput, model size, embedding cosine agreement and catalog recall@k
+
+Also checks that the vectorized preprocessing produces the same tensors as CLIPProcessor
+
+Usage:
+    python benchmark_clip.py --images ./samples --index fashion.index
+    python benchmark_clip.py --images ./samples --threads 4 --batch-sizes 1 8 32
+    python benchmark_clip.py --images ./samples --preprocessing-only
+"""
+import os
+import sys
+import argparse
+from pathlib import Path
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.dirname(__file__))
+
+from transformers import CLIPProcessor
+from utils.clip_encoder import (
+    CLIP_MODEL_NAME, configure_torch_threads, load_clip_model, encode_images,
+    model_size_mb, time_encoder, encoder_agreement, preprocess_clip_images, verify_preprocessing
+)
+
+def load_images(images_dir: str, count: int):
+    """Real images from a directory if given, otherwise fixed random noise images"""
+    if images_dir:
+        paths = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp"))[:count]
+        if paths:
+            return [Image.open(p).convert("RGB") for p in paths]
+    print("⚠️ No sample images given; agreement on random noise says little about catalog recall")
+    rng = np.random.default_rng(0)
+    # Varied sizes and aspect ratios exercise the resize/crop rules
+    sizes = [(256, 256), (640, 480), (300, 800), (1200, 1600), (225, 224)]
+    return [
+        Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8))
+        for w, h in (sizes[i % len(sizes)] for i in range(count))
+    ]
+
+def load_catalog(index_path: str):
+    """The visual search FAISS index, if present"""
+    if index_path and os.path.exists(index_path):
+        import faiss
+        return faiss.read_index(index_path)
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark float32 vs int8 CLIP image encoders")
+    parser.add_argument("--images", default=None, help="Directory of sample images (catalog photos or user uploads)")
+    parser.add_argument("--samples", type=int, default=64, help="Images used for the agreement check")
+    parser.add_argument("--index", default="fashion.index", help="FAISS catalog index for recall@k")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--interop-threads", type=int, default=1)
+    parser.add_argument("--preprocessing-only", action="store_true",
+                        help="Only compare vectorized preprocessing against CLIPProcessor")
+    args = parser.parse_args()
+
+    threads = configure_torch_threads(args.threads, args.interop_threads)
+    print(f"torch threads: {threads}")
+
+    processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+    images = load_images(args.images, args.samples)
+
+    check = verify_preprocessing(processor, images)
+    print(f"preprocessing: {'identical' if check['identical'] else 'MISMATCH'} to CLIPProcessor "
+          f"(max abs diff {check['max_abs_diff']}), {check['processor_ms']:.1f} ms -> "
+          f"{check['vectorized_ms']:.1f} ms for {len(images)} images ({check['speedup']:.1f}x)")
+    if args.preprocessing_only:
+        return 0 if check["identical"] else 1
+
+    pixel_values = preprocess_clip_images(images)
+
+    encoders = {
+        "float32": load_clip_model(CLIP_MODEL_NAME, "cpu"),
+        "int8": load_clip_model(CLIP_MODEL_NAME, "cpu", quantize=True),
+    }
+
+    catalog = load_catalog(args.index)
+    print(f"catalog: {f'{catalog.ntotal} items from {args.index}' if catalog is not None else 'sample images (no FAISS index)'}")
+
+    reference = encode_images(encoders["float32"], pixel_values)
+    reference_p50 = {}
+
+    print(f"{'encoder':<8} {'batch':>5} {'p50 ms':>9} {'p95 ms':>9} {'img/s':>9} {'speedup':>8} {'size MB':>8} "
+          f"{'cos mean':>9} {'cos min':>8} {f'recall@{args.k}':>10}")
+    for name, model in encoders.items():
+        embeddings = reference if name == "float32" else encode_images(model, pixel_values)
+        agreement = encoder_agreement(reference, embeddings, catalog, k=args.k)
+        size = model_size_mb(model)
+
+        for batch_size in args.batch_sizes:
+            batch = pixel_values[np.arange(batch_size) % len(pixel_values)]
+            stats = time_encoder(model, batch, args.iterations)
+            reference_p50.setdefault(batch_size, stats["p50_ms"])
+            print(f"{name:<8} {batch_size:>5} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+                  f"{stats['images_per_s']:>9.1f} {reference_p50[batch_size] / stats['p50_ms']:>7.2f}x {size:>8.0f} "
+                  f"{agreement['cosine_mean']:>9.4f} {agreement['cosine_min']:>8.4f} {agreement['recall_at_k']:>10.1%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
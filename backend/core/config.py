@@ -4,6 +4,7 @@ Configuration settings for the API
 
 import os
 from functools import lru_cache
+from typing import Optional
 from pydantic import BaseSettings
 
 class Settings(BaseSettings):
@@ -37,10 +38,48 @@ class Settings(BaseSettings):
     # File Upload Configuration
     max_file_size: int = 16 * 1024 * 1024  # 16MB
     allowed_image_types: list = ["image/jpeg", "image/png", "image/gif", "image/webp"]
+    batch_upload_max_files: int = 500
+    batch_upload_concurrency: int = 8
+    image_decode_max_pixels: int = 40_000_000  # Larger images are rejected before decoding
+    image_stats_cache_ttl: int = 30  # Seconds the per-category storage stats are reused
+    
+    # Image Variant Configuration
+    image_variant_presets: list = [150, 300, 600]  # Square bounding boxes generated at upload
+    image_variant_max_dimension: int = 2048
+    image_variant_quality: int = 80
+    image_variant_cache_bytes: int = 64 * 1024 * 1024  # In-process LRU of hot variants
+    
+    # Image Cache Configuration (memory -> local disk -> GridFS)
+    image_memory_cache_bytes: int = 128 * 1024 * 1024
+    image_memory_cache_max_object: int = 512 * 1024  # Larger images skip the memory tier
+    image_disk_cache_dir: str = "cache/images"
+    # Per worker: workers share the directory but each evicts against its own budget,
+    # so the directory can reach workers x this
+    image_disk_cache_bytes: int = 512 * 1024 * 1024
+    image_disk_cache_max_object: int = 2 * 1024 * 1024  # Larger images stream from GridFS
+    
+    # Retention Configuration
+    query_log_ttl_days: int = 30
+    user_upload_ttl_days: int = 7
+    store_full_user_uploads: bool = False  # Otherwise keep a thumbnail plus content hash
+    user_upload_thumbnail_size: int = 256
+    retention_sweep_interval: int = 3600  # seconds
+    retention_sweep_batch_size: int = 500
     
     # ML Configuration
     ml_enabled: bool = True
     ml_api_url: str = "http://localhost:5000"
+    classify_max_batch_size: int = 16  # Concurrent /api/classify requests coalesced per forward pass
+    classify_batch_wait_ms: float = 5.0  # Longest a request waits for others to join its batch
+    classify_timeout: float = 30.0  # Seconds a /api/classify request waits for its batch result
+    classifier_runtime: str = "auto"  # keras, tflite, onnx, or auto (first export found)
+    classifier_num_threads: Optional[int] = None  # CPU threads for TFLite/ONNX; None uses all cores
+    ml_classifier_backend: str = "auto"  # fashion_classifier, clip (zero-shot), or auto (classifier file if present)
+    ml_models_dir: str = "../models"
+    ml_predict_timeout: float = 30.0  # Seconds a prediction waits, including a model load in progress
+    clip_quantize: bool = False  # Dynamic int8 quantization of CLIP's Linear layers (CPU only)
+    clip_num_threads: Optional[int] = None  # Torch intra-op threads per worker; None uses all cores
+    clip_interop_threads: int = 1  # Torch inter-op threads; single requests gain nothing from more
     
     # API Configuration
     api_base_url: str = "http://localhost:5001"
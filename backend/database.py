@@ -4,16 +4,302 @@ MongoDB integration with GridFS for image storage
 """
 
 import os
+import time
+import base64
+import atexit
+import asyncio
+import hashlib
+import functools
 import logging
-from typing import List, Dict, Any, Optional
-from pymongo import MongoClient
-from gridfs import GridFS
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, AsyncIterator
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import BulkWriteError
+from gridfs import GridFS, GridOut
+from gridfs.errors import FileExists, NoFile
 from bson import ObjectId
 import numpy as np
 from datetime import datetime
 
+try:
+    from .invalidation import EventType, InvalidationBus, get_invalidation_bus
+except ImportError:
+    from invalidation import EventType, InvalidationBus, get_invalidation_bus
+
 logger = logging.getLogger(__name__)
 
+# fs.files fields needed to describe an image in listings (skips chunkSize, aliases, ...)
+IMAGE_LISTING_PROJECTION = {
+    "filename": 1,
+    "contentType": 1,
+    "uploadDate": 1,
+    "length": 1,
+    "md5": 1,
+    "sha256": 1,
+    "metadata": 1
+}
+
+# Metadata that image listings filter on: uploads only share a stored file when these match
+IMAGE_DEDUP_SCOPE = ("category", "product_id")
+
+def image_dedup_key(sha256: str, metadata: Optional[Dict[str, Any]] = None) -> str:
+    """Content hash scoped to the filterable metadata of one upload"""
+    metadata = metadata or {}
+    scope = "\x1f".join(str(metadata.get(field) or "") for field in IMAGE_DEDUP_SCOPE)
+    return hashlib.sha256(f"{sha256}\x1f{scope}".encode()).hexdigest()
+
+class ProductVectorIndex:
+    """
+    In-process cosine similarity index over product feature vectors
+    
+    Rows live in a preallocated matrix that doubles when full, so appending a
+    product is amortised O(1) rather than a copy of the whole index.
+    """
+    
+    MIN_CAPACITY = 64
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self.loaded = False
+    
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> Optional[np.ndarray]:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        if vector.size == 0 or norm == 0:
+            return None
+        return vector / norm
+    
+    def build(self, items: List[tuple]):
+        """Replace the index contents with (product_id, features) pairs"""
+        ids, rows = [], []
+        for product_id, features in items:
+            vector = self._normalize(features)
+            if vector is None or (rows and vector.shape != rows[0].shape):
+                continue
+            ids.append(product_id)
+            rows.append(vector)
+        
+        with self._lock:
+            self._ids = ids
+            self._positions = {product_id: i for i, product_id in enumerate(ids)}
+            self._matrix = np.vstack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+            self.loaded = True
+    
+    def _reserve(self, rows: int, dim: int):
+        """Grow the matrix (geometrically) to hold at least ``rows`` rows; caller holds the lock"""
+        capacity = self._matrix.shape[0]
+        if rows <= capacity and self._matrix.shape[1] == dim:
+            return
+        new_capacity = max(rows, 2 * capacity, self.MIN_CAPACITY)
+        matrix = np.zeros((new_capacity, dim), dtype=np.float32)
+        if self._ids:
+            matrix[:len(self._ids)] = self._matrix[:len(self._ids)]
+        self._matrix = matrix
+    
+    def _dimension(self) -> Optional[int]:
+        return self._matrix.shape[1] if self._ids else None
+    
+    def upsert(self, product_id: str, features: np.ndarray):
+        """Add or replace a single product vector"""
+        self.upsert_many([(product_id, features)])
+    
+    def upsert_many(self, items: List[tuple]):
+        """Add or replace (product_id, features) pairs, growing the matrix at most once"""
+        vectors = []
+        for product_id, features in items:
+            vector = self._normalize(features)
+            if vector is not None:
+                vectors.append((product_id, vector))
+        if not vectors:
+            return
+        
+        with self._lock:
+            dim = self._dimension() or vectors[0][1].shape[0]
+            new_ids = {
+                product_id for product_id, vector in vectors
+                if vector.shape[0] == dim and product_id not in self._positions
+            }
+            self._reserve(len(self._ids) + len(new_ids), dim)
+            
+            for product_id, vector in vectors:
+                if vector.shape[0] != dim:
+                    logger.warning(f"⚠️ Feature size mismatch for product {product_id}, not indexed")
+                    continue
+                position = self._positions.get(product_id)
+                if position is None:
+                    position = self._positions[product_id] = len(self._ids)
+                    self._ids.append(product_id)
+                self._matrix[position] = vector
+    
+    def remove(self, product_id: str):
+        """Drop a product vector from the index (the last row takes its place)"""
+        with self._lock:
+            position = self._positions.pop(product_id, None)
+            if position is None:
+                return
+            last = len(self._ids) - 1
+            if position != last:
+                moved_id = self._ids[last]
+                self._matrix[position] = self._matrix[last]
+                self._ids[position] = moved_id
+                self._positions[moved_id] = position
+            self._ids.pop()
+    
+    def search(self, features: np.ndarray, limit: int = 10) -> List[tuple]:
+        """Return up to ``limit`` (product_id, cosine similarity) pairs, best first"""
+        query = self._normalize(features)
+        with self._lock:
+            count = len(self._ids)
+            if query is None or not count or query.shape[0] != self._matrix.shape[1]:
+                return []
+            # Scored under the lock: upserts and removals rewrite rows in place
+            scores = self._matrix[:count] @ query
+            ids = self._ids[:]
+        
+        k = min(limit, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[i], float(scores[i])) for i in top]
+    
+    def __len__(self) -> int:
+        return len(self._ids)
+
+class WriteBehindBuffer:
+    """
+    Background buffer for analytics writes that callers should not wait on
+    
+    Documents are grouped per collection and written with ``insert_many`` once
+    ``max_batch_size`` documents are pending or ``flush_interval`` seconds have
+    passed. Deferred callables (e.g. GridFS uploads) run on the same thread.
+    At most ``max_pending`` items and ``max_pending_bytes`` of declared payload
+    are held; beyond that new items are dropped and counted rather than growing
+    memory without bound.
+    """
+    
+    def __init__(
+        self,
+        db,
+        max_batch_size: int = 500,
+        flush_interval: float = 2.0,
+        max_pending: int = 10000,
+        max_pending_bytes: int = 64 * 1024 * 1024
+    ):
+        self.db = db
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_pending_bytes = max_pending_bytes
+        self._pending: Dict[str, List[Dict[str, Any]]] = {}
+        self._tasks = deque()
+        self._pending_count = 0
+        self._pending_bytes = 0
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self.stats = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0}
+        
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def _accept(self, nbytes: int) -> bool:
+        if (
+            self._closed
+            or self._pending_count >= self.max_pending
+            or self._pending_bytes + nbytes > self.max_pending_bytes
+        ):
+            self.stats["dropped"] += 1
+            return False
+        self._pending_count += 1
+        self._pending_bytes += nbytes
+        self.stats["enqueued"] += 1
+        return True
+    
+    def enqueue(self, collection_name: str, document: Dict[str, Any], nbytes: int = 0) -> bool:
+        """Queue a document for insertion; returns False if it was dropped"""
+        with self._condition:
+            if not self._accept(nbytes):
+                return False
+            self._pending.setdefault(collection_name, []).append(document)
+            if self._pending_count >= self.max_batch_size:
+                self._condition.notify()
+        return True
+    
+    def submit(self, func, *args, nbytes: int = 0, **kwargs) -> bool:
+        """
+        Queue a write callable to run on the background thread
+        
+        Args:
+            func: Callable run with ``args`` and ``kwargs``
+            nbytes: Size of the payload the queued call keeps alive (e.g. encoded image bytes),
+                counted against ``max_pending_bytes``
+        
+        Returns:
+            False if the call was dropped and will never run
+        """
+        with self._condition:
+            if not self._accept(nbytes):
+                return False
+            self._tasks.append((func, args, kwargs))
+            if self._pending_count >= self.max_batch_size:
+                self._condition.notify()
+        return True
+    
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._closed and self._pending_count < self.max_batch_size:
+                    self._condition.wait(self.flush_interval)
+                if self._closed:
+                    return
+            self.flush()
+    
+    def flush(self):
+        """Write everything currently pending"""
+        with self._flush_lock:
+            with self._condition:
+                pending, self._pending = self._pending, {}
+                tasks, self._tasks = self._tasks, deque()
+                self._pending_count = 0
+                self._pending_bytes = 0
+            
+            for func, args, kwargs in tasks:
+                try:
+                    func(*args, **kwargs)
+                    self.stats["written"] += 1
+                except Exception as e:
+                    self.stats["failed"] += 1
+                    logger.error(f"❌ Deferred write failed: {e}")
+            
+            for collection_name, documents in pending.items():
+                try:
+                    self.db[collection_name].insert_many(documents, ordered=False)
+                    self.stats["written"] += len(documents)
+                except BulkWriteError as e:
+                    failed_count = len(e.details.get('writeErrors', []))
+                    self.stats["written"] += len(documents) - failed_count
+                    self.stats["failed"] += failed_count
+                    logger.error(f"❌ {failed_count} buffered writes to {collection_name} failed")
+                except Exception as e:
+                    self.stats["failed"] += len(documents)
+                    logger.error(f"❌ Error flushing {len(documents)} writes to {collection_name}: {e}")
+    
+    def close(self):
+        """Stop the background thread and flush remaining writes"""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
 class DatabaseManager:
     """MongoDB database manager for fashion recommender"""
     
@@ -23,7 +309,10 @@ class DatabaseManager:
         self.client = None
         self.db = None
         self.fs = None
+        self.vector_index = ProductVectorIndex()
+        self.invalidation_bus = None
         self._connect()
+        self.write_buffer = WriteBehindBuffer(self.db)
     
     def _connect(self):
         """Establish database connection"""
@@ -40,24 +329,171 @@ class DatabaseManager:
             logger.error(f"❌ Failed to connect to MongoDB: {e}")
             raise
     
+    def enable_cache_invalidation(self, bus: Optional[InvalidationBus] = None):
+        """Keep in-process caches coherent with writes made by other workers"""
+        if self.invalidation_bus is not None:
+            return
+        self.invalidation_bus = bus or get_invalidation_bus(self.db)
+        self.invalidation_bus.subscribe(self._on_product_changed, EventType.PRODUCT_CHANGED)
+    
+    def _on_product_changed(self, event):
+        """Refresh a product's vector after a write seen on the invalidation bus"""
+        if not self.vector_index.loaded or event.document_id is None:
+            return
+        
+        if event.operation == "delete":
+            self.vector_index.remove(event.document_id)
+            return
+        
+        product = self.get_collection('products').find_one(
+            {"_id": ObjectId(event.document_id)},
+            {"image_features": 1}
+        )
+        if product and product.get('image_features') is not None:
+            self.vector_index.upsert(event.document_id, np.asarray(product['image_features']))
+        else:
+            self.vector_index.remove(event.document_id)
+    
     def get_collection(self, collection_name: str):
         """Get a collection from the database"""
         return self.db[collection_name]
     
-    def save_image(self, image_data: bytes, filename: str, metadata: Dict[str, Any] = None) -> str:
-        """Save image to GridFS and return file ID"""
+    def _ensure_image_hash_index(self):
+        """Unique dedup-key index that makes deduplication race-safe"""
+        if getattr(self, '_image_hash_index_ready', False):
+            return
+        self.get_collection('fs.files').create_index(
+            "dedup_key",
+            unique=True,
+            partialFilterExpression={"dedup_key": {"$exists": True}}
+        )
+        self._image_hash_index_ready = True
+    
+    def acquire_image_by_hash(self, sha256: str, metadata: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """
+        Add a reference to an existing image with this content and filter metadata
+        
+        Args:
+            sha256: Content hash of the image bytes
+            metadata: Metadata of the new upload (only IMAGE_DEDUP_SCOPE fields count)
+        
+        Returns:
+            ID of the shared file, or None if there is no match
+        """
+        self._ensure_image_hash_index()
+        file_doc = self.get_collection('fs.files').find_one_and_update(
+            {"dedup_key": image_dedup_key(sha256, metadata)},
+            {"$inc": {"ref_count": 1}},
+            projection={"_id": 1}
+        )
+        return str(file_doc['_id']) if file_doc else None
+    
+    def discard_orphan_chunks(self, file_id: ObjectId):
+        """Remove chunks whose files document was never written"""
+        self.get_collection('fs.chunks').delete_many({"files_id": file_id})
+    
+    def save_image(
+        self,
+        image_data: bytes,
+        filename: str,
+        metadata: Dict[str, Any] = None,
+        deduplicate: bool = True
+    ) -> str:
+        """
+        Save image to GridFS, reusing an identical stored file if there is one
+        
+        A file is only shared between uploads with the same IMAGE_DEDUP_SCOPE
+        metadata, so it stays visible to every listing filter it was uploaded under.
+        
+        Args:
+            deduplicate: False always writes a new file that no other save can share
+                (for derived files looked up by their own metadata)
+        """
         try:
-            file_id = self.fs.put(
-                image_data,
-                filename=filename,
-                metadata=metadata or {}
-            )
+            sha256 = hashlib.sha256(image_data).hexdigest()
+            if not deduplicate:
+                file_id = self.fs.put(
+                    image_data,
+                    filename=filename,
+                    metadata=metadata or {},
+                    sha256=sha256,
+                    ref_count=1
+                )
+                logger.info(f"✅ Image saved with ID: {file_id}")
+                return str(file_id)
+            
+            existing_id = self.acquire_image_by_hash(sha256, metadata)
+            if existing_id:
+                logger.info(f"✅ Image deduplicated to existing ID: {existing_id}")
+                return existing_id
+            
+            file_id = ObjectId()
+            try:
+                self.fs.put(
+                    image_data,
+                    _id=file_id,
+                    filename=filename,
+                    metadata=metadata or {},
+                    sha256=sha256,
+                    dedup_key=image_dedup_key(sha256, metadata),
+                    ref_count=1
+                )
+            except FileExists:
+                # Lost a race with an identical concurrent upload; GridIn leaves its chunks behind
+                self.discard_orphan_chunks(file_id)
+                existing_id = self.acquire_image_by_hash(sha256, metadata)
+                if existing_id is None:
+                    raise
+                return existing_id
+            
             logger.info(f"✅ Image saved with ID: {file_id}")
             return str(file_id)
         except Exception as e:
             logger.error(f"❌ Error saving image: {e}")
             raise
     
+    def save_images_bulk(self, images: List[Dict[str, Any]], max_workers: int = 8) -> Dict[str, Any]:
+        """
+        Save many images to GridFS concurrently
+        
+        Each entry needs ``image_data`` and ``filename`` and may carry ``metadata``.
+        Uploads run on a bounded thread pool so a catalog import is limited by
+        network bandwidth rather than one round trip per file.
+        
+        Returns:
+            Dict with ``file_ids`` (same order as input, None for failures),
+            ``failed`` (index and error per failed entry), counts and throughput
+        """
+        start_time = time.perf_counter()
+        file_ids: List[Optional[str]] = [None] * len(images)
+        failed = []
+        
+        def _put(image: Dict[str, Any]) -> str:
+            # Re-imports of the same photo share one stored file
+            return self.save_image(image['image_data'], image['filename'], image.get('metadata'))
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = [executor.submit(_put, image) for image in images]
+            for index, future in enumerate(futures):
+                try:
+                    file_ids[index] = future.result()
+                except Exception as e:
+                    failed.append({"index": index, "filename": images[index].get('filename'), "error": str(e)})
+        
+        elapsed = time.perf_counter() - start_time
+        saved_count = len(images) - len(failed)
+        logger.info(f"✅ Bulk image save: {saved_count}/{len(images)} images in {elapsed:.2f}s")
+        if failed:
+            logger.warning(f"⚠️ {len(failed)} images failed to save")
+        
+        return {
+            "file_ids": file_ids,
+            "saved_count": saved_count,
+            "failed": failed,
+            "elapsed_seconds": elapsed,
+            "images_per_second": saved_count / elapsed if elapsed > 0 else 0.0
+        }
+    
     def get_image(self, file_id: str) -> bytes:
         """Retrieve image from GridFS"""
         try:
@@ -68,32 +504,215 @@ class DatabaseManager:
             logger.error(f"❌ Error retrieving image: {e}")
             raise
     
+    def release_image(self, file_id: str) -> Optional[int]:
+        """
+        Drop one reference to an image, deleting it from GridFS at zero
+        
+        Returns:
+            Remaining references (0 once deleted), or None if the file does not exist
+        """
+        file_id = ObjectId(file_id)
+        files_collection = self.get_collection('fs.files')
+        while True:
+            file_doc = files_collection.find_one_and_update(
+                {"_id": file_id, "ref_count": {"$gt": 1}},
+                {"$inc": {"ref_count": -1}},
+                projection={"ref_count": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            if file_doc:
+                logger.info(f"✅ Image reference released: {file_id} ({file_doc['ref_count']} left)")
+                return file_doc['ref_count']
+            
+            # Claim the last reference and drop the dedup key in one write, so no
+            # upload can acquire the file between here and deleting its chunks
+            file_doc = files_collection.find_one_and_update(
+                {"_id": file_id, "$or": [{"ref_count": {"$lte": 1}}, {"ref_count": {"$exists": False}}]},
+                {"$set": {"ref_count": 0}, "$unset": {"dedup_key": ""}},
+                projection={"_id": 1}
+            )
+            if file_doc:
+                break
+            if files_collection.count_documents({"_id": file_id}, limit=1) == 0:
+                return None
+            # A concurrent upload acquired the file after the first update; release again
+        
+        self.fs.delete(file_id)
+        logger.info(f"✅ Image deleted: {file_id}")
+        return 0
+    
+    def set_image_ml_results(self, file_id: str, results: Dict[str, Any]) -> bool:
+        """Attach ML predictions to a stored image's GridFS files document"""
+        try:
+            result = self.get_collection('fs.files').update_one(
+                {"_id": ObjectId(file_id)},
+                {"$set": {"ml": results}}
+            )
+            return result.matched_count == 1
+        except Exception as e:
+            logger.error(f"❌ Error saving image ML results: {e}")
+            return False
+    
     def delete_image(self, file_id: str) -> bool:
-        """Delete image from GridFS"""
+        """Delete image from GridFS (only removes the data once no references remain)"""
         try:
-            file_id = ObjectId(file_id)
-            self.fs.delete(file_id)
-            logger.info(f"✅ Image deleted: {file_id}")
-            return True
+            return self.release_image(file_id) is not None
         except Exception as e:
             logger.error(f"❌ Error deleting image: {e}")
             return False
     
+    def _ensure_image_listing_indexes(self):
+        """Indexes serving the image listing filters, newest first"""
+        if getattr(self, '_image_listing_indexes_ready', False):
+            return
+        files = self.get_collection('fs.files')
+        files.create_index([("uploadDate", -1)])
+        files.create_index([("metadata.category", 1), ("uploadDate", -1)])
+        files.create_index([("metadata.product_id", 1), ("uploadDate", -1)])
+        self._image_listing_indexes_ready = True
+    
+    def list_images(
+        self,
+        limit: int = 50,
+        skip: int = 0,
+        category: Optional[str] = None,
+        product_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """List original (non-variant) image files, newest first"""
+        try:
+            self._ensure_image_listing_indexes()
+            query: Dict[str, Any] = {"metadata.variant_of": {"$exists": False}}
+            if category:
+                query["metadata.category"] = category
+            if product_id:
+                query["metadata.product_id"] = product_id
+            
+            return list(self.get_collection('fs.files').find(
+                query,
+                IMAGE_LISTING_PROJECTION
+            ).sort("uploadDate", -1).skip(skip).limit(limit))
+        except Exception as e:
+            logger.error(f"❌ Error listing images: {e}")
+            return []
+    
+    def get_image_stats(self) -> Dict[str, Any]:
+        """Image counts and stored bytes per category, from one $group over fs.files"""
+        try:
+            pipeline = [
+                {"$match": {"metadata.variant_of": {"$exists": False}}},
+                {"$group": {
+                    "_id": "$metadata.category",
+                    "count": {"$sum": 1},
+                    "total_bytes": {"$sum": "$length"}
+                }},
+                {"$sort": {"total_bytes": -1}}
+            ]
+            categories = [
+                {
+                    "category": group["_id"] or "uncategorized",
+                    "count": group["count"],
+                    "total_bytes": group["total_bytes"]
+                }
+                for group in self.get_collection('fs.files').aggregate(pipeline)
+            ]
+            return {
+                "categories": categories,
+                "total_count": sum(group["count"] for group in categories),
+                "total_bytes": sum(group["total_bytes"] for group in categories)
+            }
+        except Exception as e:
+            logger.error(f"❌ Error aggregating image stats: {e}")
+            raise
+    
     def save_product(self, product_data: Dict[str, Any]) -> str:
         """Save product to database"""
         try:
             products_collection = self.get_collection('products')
             product_data['created_at'] = datetime.now()
             product_data['updated_at'] = datetime.now()
+            if isinstance(product_data.get('image_features'), np.ndarray):
+                product_data['image_features'] = product_data['image_features'].tolist()
             
             result = products_collection.insert_one(product_data)
             product_id = str(result.inserted_id)
+            if self.vector_index.loaded and product_data.get('image_features') is not None:
+                self.vector_index.upsert(product_id, np.asarray(product_data['image_features']))
             logger.info(f"✅ Product saved with ID: {product_id}")
             return product_id
         except Exception as e:
             logger.error(f"❌ Error saving product: {e}")
             raise
     
+    def save_products_bulk(self, products: List[Dict[str, Any]], batch_size: int = 1000) -> Dict[str, Any]:
+        """
+        Save many products with unordered ``insert_many`` batches
+        
+        Unordered inserts let MongoDB keep going past bad documents, so one
+        duplicate key does not abort the rest of a catalog import.
+        
+        Returns:
+            Dict with ``inserted_ids``, ``inserted_count``, ``failed`` (index and
+            error per rejected document), elapsed time and throughput
+        """
+        start_time = time.perf_counter()
+        products_collection = self.get_collection('products')
+        inserted_ids: List[str] = []
+        failed = []
+        batch_size = max(1, batch_size)
+        
+        for batch_start in range(0, len(products), batch_size):
+            batch = products[batch_start:batch_start + batch_size]
+            now = datetime.now()
+            for product_data in batch:
+                product_data.setdefault('created_at', now)
+                product_data['updated_at'] = now
+                if isinstance(product_data.get('image_features'), np.ndarray):
+                    product_data['image_features'] = product_data['image_features'].tolist()
+            
+            try:
+                result = products_collection.insert_many(batch, ordered=False)
+                inserted_ids.extend(str(inserted_id) for inserted_id in result.inserted_ids)
+            except BulkWriteError as e:
+                failed_indexes = set()
+                for write_error in e.details.get('writeErrors', []):
+                    failed_indexes.add(write_error['index'])
+                    failed.append({
+                        "index": batch_start + write_error['index'],
+                        "code": write_error.get('code'),
+                        "error": write_error.get('errmsg')
+                    })
+                # insert_many assigns _id client-side, so the survivors are known
+                inserted_ids.extend(
+                    str(doc['_id']) for i, doc in enumerate(batch) if i not in failed_indexes
+                )
+            except Exception as e:
+                logger.error(f"❌ Error saving product batch at {batch_start}: {e}")
+                failed.extend(
+                    {"index": batch_start + i, "code": None, "error": str(e)} for i in range(len(batch))
+                )
+        
+        if self.vector_index.loaded:
+            # Rejected documents may carry the _id of a stored product; their vectors must not replace its own
+            accepted = set(inserted_ids)
+            self.vector_index.upsert_many([
+                (str(product_data['_id']), np.asarray(product_data['image_features']))
+                for product_data in products
+                if str(product_data.get('_id')) in accepted and product_data.get('image_features') is not None
+            ])
+        
+        elapsed = time.perf_counter() - start_time
+        logger.info(f"✅ Bulk product save: {len(inserted_ids)}/{len(products)} products in {elapsed:.2f}s")
+        if failed:
+            logger.warning(f"⚠️ {len(failed)} products failed to save")
+        
+        return {
+            "inserted_ids": inserted_ids,
+            "inserted_count": len(inserted_ids),
+            "failed": failed,
+            "elapsed_seconds": elapsed,
+            "products_per_second": len(inserted_ids) / elapsed if elapsed > 0 else 0.0
+        }
+    
     def get_product(self, product_id: str) -> Optional[Dict[str, Any]]:
         """Get product by ID"""
         try:
@@ -121,20 +740,62 @@ class DatabaseManager:
             logger.error(f"❌ Error searching products: {e}")
             return []
     
-    def find_similar_items(self, image_features: np.ndarray, limit: int = 10) -> List[Dict[str, Any]]:
-        """Find similar items based on image features"""
+    def _ensure_vector_index(self):
+        """Build the vector index from stored product features on first use"""
+        if self.vector_index.loaded:
+            return
+        
+        products_collection = self.get_collection('products')
+        cursor = products_collection.find(
+            {"image_features": {"$exists": True}},
+            {"image_features": 1}
+        )
+        self.vector_index.build(
+            (str(doc['_id']), np.asarray(doc['image_features'])) for doc in cursor
+        )
+        logger.info(f"✅ Product vector index built with {len(self.vector_index)} items")
+    
+    def update_product_features(self, product_id: str, image_features: np.ndarray) -> bool:
+        """Store a product's feature vector and refresh it in the vector index"""
         try:
             products_collection = self.get_collection('products')
+            features = np.asarray(image_features, dtype=np.float32).ravel()
+            products_collection.update_one(
+                {"_id": ObjectId(product_id)},
+                {"$set": {"image_features": features.tolist(), "updated_at": datetime.now()}}
+            )
+            if self.vector_index.loaded:
+                self.vector_index.upsert(product_id, features)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error updating product features: {e}")
+            return False
+    
+    def find_similar_items(self, image_features: np.ndarray, limit: int = 10) -> List[Dict[str, Any]]:
+        """Find similar items by cosine similarity over stored product features"""
+        try:
+            self._ensure_vector_index()
+            matches = self.vector_index.search(image_features, limit)
+            if not matches:
+                return []
             
-            # For now, return random products (implement proper similarity search)
-            # In production, you would use vector similarity search
-            similar_products = list(products_collection.aggregate([
-                {"$sample": {"size": limit}}
-            ]))
+            products_collection = self.get_collection('products')
+            products = {
+                str(product['_id']): product
+                for product in products_collection.find(
+                    {"_id": {"$in": [ObjectId(product_id) for product_id, _ in matches]}},
+                    {"image_features": 0}
+                )
+            }
             
-            # Convert ObjectId to string
-            for product in similar_products:
-                product['_id'] = str(product['_id'])
+            similar_products = []
+            for product_id, score in matches:
+                product = products.get(product_id)
+                if product is None:
+                    continue
+                product['_id'] = product_id
+                product['similarity_score'] = score
+                similar_products.append(product)
             
             return similar_products
         except Exception as e:
@@ -172,17 +833,14 @@ class DatabaseManager:
             return None
     
     def save_recommendation_history(self, user_id: str, recommendations: List[Dict[str, Any]]) -> bool:
-        """Save recommendation history"""
+        """Queue recommendation history for a batched background write"""
         try:
-            recommendations_collection = self.get_collection('recommendations')
             recommendation_data = {
                 "user_id": user_id,
                 "recommendations": recommendations,
                 "created_at": datetime.now()
             }
-            recommendations_collection.insert_one(recommendation_data)
-            logger.info(f"✅ Recommendation history saved for user: {user_id}")
-            return True
+            return self.write_buffer.enqueue('recommendations', recommendation_data)
         except Exception as e:
             logger.error(f"❌ Error saving recommendation history: {e}")
             return False
@@ -190,6 +848,8 @@ class DatabaseManager:
     def get_recommendation_history(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Get user's recommendation history"""
         try:
+            # Make queued history visible to the read
+            self.write_buffer.flush()
             recommendations_collection = self.get_collection('recommendations')
             history = list(recommendations_collection.find(
                 {"user_id": user_id}
@@ -206,6 +866,7 @@ class DatabaseManager:
     
     def close(self):
         """Close database connection"""
+        self.write_buffer.close()
         if self.client:
             self.client.close()
             logger.info("✅ Database connection closed")
@@ -218,6 +879,7 @@ def get_database_connection() -> DatabaseManager:
     global _db_instance
     if _db_instance is None:
         _db_instance = DatabaseManager()
+        _db_instance.enable_cache_invalidation()
     return _db_instance
 
 def test_connection() -> bool:
@@ -229,3 +891,250 @@ def test_connection() -> bool:
     except Exception as e:
         logger.error(f"Database connection test failed: {e}")
         return False
+
+
+# Async image helpers used by the FastAPI image service
+class UploadTooLargeError(ValueError):
+    """Upload exceeded the configured size limit"""
+
+class InvalidImageError(ValueError):
+    """Upload does not start with a supported image signature"""
+
+def detect_image_type(header: bytes) -> Optional[str]:
+    """Content type from an image's leading magic bytes, or None if unrecognised"""
+    if header.startswith(b'\xff\xd8\xff'):
+        return "image/jpeg"
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return "image/png"
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return "image/gif"
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return "image/webp"
+    return None
+
+def _run_sync(func, *args, **kwargs):
+    """Run a blocking PyMongo call on the default executor"""
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+def _file_doc_to_metadata(file_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten a GridFS files document into the metadata dict the services expect"""
+    metadata = dict(file_doc.get('metadata') or {})
+    metadata.update({
+        "id": str(file_doc['_id']),
+        "filename": file_doc.get('filename'),
+        "content_type": file_doc.get('contentType') or metadata.get('content_type') or "image/jpeg",
+        "upload_date": file_doc.get('uploadDate'),
+        "length": file_doc.get('length', 0),
+        "md5": file_doc.get('md5'),
+        "sha256": file_doc.get('sha256')
+    })
+    return metadata
+
+async def store_image_stream(
+    chunks: AsyncIterator[bytes],
+    filename: str,
+    content_type: str,
+    metadata: Dict[str, Any] = None,
+    max_size: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Write an image into GridFS as it arrives
+    
+    The content hash and size limit are checked per chunk and the magic bytes
+    on the first few bytes, so an oversized or non-image upload is aborted
+    (and its partial chunks removed) without buffering the whole file.
+    
+    Returns:
+        Dict with file_id, length, sha256 and the detected content_type
+    """
+    db = get_database_connection()
+    grid_in = db.fs.new_file(filename=filename, contentType=content_type, metadata=metadata or {})
+    hasher = hashlib.sha256()
+    length = 0
+    header = b""
+    detected_type = None
+    
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            length += len(chunk)
+            if max_size is not None and length > max_size:
+                raise UploadTooLargeError(f"Upload exceeds {max_size} bytes")
+            
+            if detected_type is None:
+                header += chunk[:12 - len(header)]
+                if len(header) >= 12:
+                    detected_type = detect_image_type(header)
+                    if detected_type is None:
+                        raise InvalidImageError("File is not a supported image")
+            
+            hasher.update(chunk)
+            await _run_sync(grid_in.write, chunk)
+        
+        if detected_type is None:
+            detected_type = detect_image_type(header)
+            if detected_type is None:
+                raise InvalidImageError("File is not a supported image")
+        
+        sha256 = hasher.hexdigest()
+        existing_id = await _run_sync(db.acquire_image_by_hash, sha256, metadata)
+        if existing_id is None:
+            grid_in.contentType = detected_type
+            grid_in.sha256 = sha256
+            grid_in.dedup_key = image_dedup_key(sha256, metadata)
+            grid_in.ref_count = 1
+            try:
+                await _run_sync(grid_in.close)
+            except FileExists:
+                # An identical upload finished first (the abort below removes our chunks)
+                existing_id = await _run_sync(db.acquire_image_by_hash, sha256, metadata)
+                if existing_id is None:
+                    raise
+    except BaseException:
+        await _run_sync(grid_in.abort)
+        raise
+    
+    if existing_id is not None:
+        # Identical content is already stored: drop our chunks and share that file
+        await _run_sync(grid_in.abort)
+        logger.info(f"✅ Image deduplicated to existing ID: {existing_id}")
+        return {
+            "file_id": existing_id,
+            "length": length,
+            "sha256": sha256,
+            "content_type": detected_type,
+            "deduplicated": True
+        }
+    
+    logger.info(f"✅ Image streamed to GridFS with ID: {grid_in._id} ({length} bytes)")
+    return {
+        "file_id": str(grid_in._id),
+        "length": length,
+        "sha256": sha256,
+        "content_type": detected_type,
+        "deduplicated": False
+    }
+
+async def _single_chunk(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+async def _decode_base64_chunks(image_data: str, chunk_size: int = 256 * 1024) -> AsyncIterator[bytes]:
+    """Decode a (data URL) base64 string piecewise instead of into one big buffer"""
+    start = image_data.index(',') + 1 if image_data.startswith('data:') else 0
+    # Base64 decodes independently in 4-character groups. MIME-wrapped input has line
+    # breaks between them, so groups are counted after dropping whitespace
+    step = chunk_size // 3 * 4
+    pending = ""
+    for offset in range(start, len(image_data), step):
+        piece = pending + "".join(image_data[offset:offset + step].split())
+        usable = len(piece) - len(piece) % 4
+        pending = piece[usable:]
+        if usable:
+            yield base64.b64decode(piece[:usable])
+    if pending:
+        # A truncated final group fails here just as it would in one-shot decoding
+        yield base64.b64decode(pending)
+
+async def store_image(
+    image_data: bytes,
+    filename: str,
+    content_type: str,
+    metadata: Dict[str, Any] = None,
+    max_size: Optional[int] = None
+) -> str:
+    """Store in-memory image bytes in GridFS and return the file ID"""
+    # The hash is known up front here, so a duplicate never writes chunks
+    db = get_database_connection()
+    existing_id = await _run_sync(db.acquire_image_by_hash, hashlib.sha256(image_data).hexdigest(), metadata)
+    if existing_id is not None:
+        return existing_id
+    
+    result = await store_image_stream(_single_chunk(image_data), filename, content_type, metadata, max_size)
+    return result["file_id"]
+
+async def store_image_base64(
+    image_data: str,
+    filename: str,
+    content_type: str,
+    metadata: Dict[str, Any] = None,
+    max_size: Optional[int] = None
+) -> Dict[str, Any]:
+    """Stream a base64 (or data URL) image into GridFS without a full decoded copy"""
+    return await store_image_stream(
+        _decode_base64_chunks(image_data), filename, content_type, metadata, max_size
+    )
+
+async def list_images(
+    limit: int = 50,
+    skip: int = 0,
+    category: Optional[str] = None,
+    product_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """List original images as flattened metadata dicts, newest first"""
+    db = get_database_connection()
+    file_docs = await _run_sync(db.list_images, limit, skip, category, product_id)
+    return [_file_doc_to_metadata(file_doc) for file_doc in file_docs]
+
+async def get_image_stats() -> Dict[str, Any]:
+    """Per-category image counts and byte totals"""
+    return await _run_sync(get_database_connection().get_image_stats)
+
+async def get_image_metadata(file_id: str) -> Optional[Dict[str, Any]]:
+    """Get GridFS file metadata without reading any chunks"""
+    try:
+        db = get_database_connection()
+        file_doc = await _run_sync(db.get_collection('fs.files').find_one, {"_id": ObjectId(file_id)})
+        return _file_doc_to_metadata(file_doc) if file_doc else None
+    except Exception as e:
+        logger.error(f"❌ Error getting image metadata: {e}")
+        return None
+
+async def open_image(file_id: str) -> Optional[GridOut]:
+    """Open a GridFS file for chunked reading; returns None if it does not exist"""
+    db = get_database_connection()
+    try:
+        return await _run_sync(db.fs.get, ObjectId(file_id))
+    except NoFile:
+        return None
+
+async def iter_image_chunks(grid_out: GridOut, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Yield bytes ``start``..``end`` (inclusive) of a GridFS file one stored chunk at a time"""
+    try:
+        if start:
+            grid_out.seek(start)
+        remaining = (end if end is not None else grid_out.length - 1) - start + 1
+        while remaining > 0:
+            chunk = await _run_sync(grid_out.readchunk)
+            if not chunk:
+                break
+            if len(chunk) > remaining:
+                chunk = chunk[:remaining]
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        grid_out.close()
+
+async def release_image(file_id: str) -> Optional[int]:
+    """Drop one reference to an image; returns remaining references or None if missing"""
+    return await _run_sync(get_database_connection().release_image, file_id)
+
+async def set_image_ml_results(file_id: str, results: Dict[str, Any]) -> bool:
+    """Attach ML predictions to a stored image"""
+    return await _run_sync(get_database_connection().set_image_ml_results, file_id, results)
+
+async def delete_image(file_id: str) -> bool:
+    """Delete an image reference from GridFS"""
+    try:
+        return await release_image(file_id) is not None
+    except Exception as e:
+        logger.error(f"❌ Error deleting image: {e}")
+        return False
+
+async def get_image(file_id: str) -> Optional[bytes]:
+    """Read a whole GridFS file into memory (prefer iter_image_chunks for responses)"""
+    grid_out = await open_image(file_id)
+    if grid_out is None:
+        return None
+    return b"".join([chunk async for chunk in iter_image_chunks(grid_out)])
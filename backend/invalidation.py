@@ -0,0 +1,180 @@
+"""
+Cache invalidation bus for the Fashion Recommender backend
+Tails MongoDB change streams and notifies in-process cache owners of writes
+"""
+
+import time
+import logging
+import threading
+from enum import Enum
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+class EventType(str, Enum):
+    """Kinds of cache invalidation events"""
+    PRODUCT_CHANGED = "product_changed"
+    IMAGE_CHANGED = "image_changed"
+    USER_CHANGED = "user_changed"
+
+# Collections watched for changes and the event each one publishes
+WATCHED_COLLECTIONS = {
+    "products": EventType.PRODUCT_CHANGED,
+    "fs.files": EventType.IMAGE_CHANGED,
+    "users": EventType.USER_CHANGED,
+}
+
+@dataclass
+class InvalidationEvent:
+    """A single write observed on a watched collection"""
+    event_type: EventType
+    operation: str  # insert, update, replace or delete
+    document_id: Optional[str]
+    collection: str
+    timestamp: datetime = field(default_factory=datetime.utcnow)
+
+Subscriber = Callable[[InvalidationEvent], None]
+
+class InvalidationBus:
+    """Fan-out of invalidation events to subscribers in this process"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[Optional[EventType], List[Subscriber]] = {}
+        self.stats = {"published": 0, "subscriber_errors": 0}
+    
+    def subscribe(self, callback: Subscriber, event_type: Optional[EventType] = None) -> Callable[[], None]:
+        """
+        Register a callback for one event type (or all events when None)
+        
+        Returns:
+            Function that removes the subscription
+        """
+        with self._lock:
+            self._subscribers.setdefault(event_type, []).append(callback)
+        
+        def unsubscribe():
+            with self._lock:
+                callbacks = self._subscribers.get(event_type, [])
+                if callback in callbacks:
+                    callbacks.remove(callback)
+        
+        return unsubscribe
+    
+    def publish(self, event: InvalidationEvent):
+        """Deliver an event to every matching subscriber"""
+        with self._lock:
+            callbacks = list(self._subscribers.get(event.event_type, [])) + list(self._subscribers.get(None, []))
+        
+        self.stats["published"] += 1
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                self.stats["subscriber_errors"] += 1
+                logger.error(f"❌ Invalidation subscriber failed for {event.event_type.value}: {e}")
+
+class ChangeStreamSource:
+    """Publishes MongoDB change stream events for the watched collections onto a bus"""
+    
+    def __init__(self, db, bus: InvalidationBus, max_await_time_ms: int = 500, retry_delay: float = 2.0):
+        self.db = db
+        self.bus = bus
+        self.max_await_time_ms = max_await_time_ms
+        self.retry_delay = retry_delay
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+    
+    def start(self):
+        """Start one tailing thread per watched collection"""
+        for collection_name, event_type in WATCHED_COLLECTIONS.items():
+            thread = threading.Thread(
+                target=self._watch,
+                args=(collection_name, event_type),
+                name=f"change-stream-{collection_name}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"✅ Watching change streams on {', '.join(WATCHED_COLLECTIONS)}")
+    
+    def _watch(self, collection_name: str, event_type: EventType):
+        from pymongo.errors import OperationFailure, PyMongoError
+        
+        resume_token = None
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+        
+        while not self._stop_event.is_set():
+            try:
+                with self.db[collection_name].watch(
+                    pipeline,
+                    resume_after=resume_token,
+                    max_await_time_ms=self.max_await_time_ms
+                ) as stream:
+                    while not self._stop_event.is_set():
+                        change = stream.try_next()
+                        if change is None:
+                            continue
+                        resume_token = stream.resume_token
+                        document_key = change.get("documentKey", {}).get("_id")
+                        self.bus.publish(InvalidationEvent(
+                            event_type=event_type,
+                            operation=change["operationType"],
+                            document_id=str(document_key) if document_key is not None else None,
+                            collection=collection_name
+                        ))
+            except OperationFailure as e:
+                # Standalone servers do not support change streams
+                logger.warning(f"⚠️ Change streams unavailable on {collection_name}: {e}")
+                return
+            except PyMongoError as e:
+                logger.warning(f"⚠️ Change stream on {collection_name} interrupted, retrying: {e}")
+                time.sleep(self.retry_delay)
+    
+    def stop(self):
+        """Stop all tailing threads"""
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout=self.retry_delay + 1)
+        self._threads = []
+
+class InMemoryChangeSource:
+    """In-process stand-in for ChangeStreamSource, used in tests and without a replica set"""
+    
+    def __init__(self, bus: InvalidationBus):
+        self.bus = bus
+    
+    def start(self):
+        pass
+    
+    def stop(self):
+        pass
+    
+    def emit(self, collection_name: str, operation: str, document_id: Any = None):
+        """Publish a change as if it had arrived from MongoDB"""
+        self.bus.publish(InvalidationEvent(
+            event_type=WATCHED_COLLECTIONS[collection_name],
+            operation=operation,
+            document_id=str(document_id) if document_id is not None else None,
+            collection=collection_name
+        ))
+
+# Global bus instance
+_bus_instance = None
+_source_instance = None
+
+def get_invalidation_bus(db=None) -> InvalidationBus:
+    """
+    Get the process-wide invalidation bus
+    
+    The first call with a database starts tailing its change streams.
+    """
+    global _bus_instance, _source_instance
+    if _bus_instance is None:
+        _bus_instance = InvalidationBus()
+    if db is not None and _source_instance is None:
+        _source_instance = ChangeStreamSource(db, _bus_instance)
+        _source_instance.start()
+    return _bus_instance
@@ -107,9 +107,8 @@ async def health_check():
         
         # Check ML service availability
         try:
-            from services.ml_service import MLService
-            ml_service = MLService()
-            ml_available = ml_service.is_available()
+            # The router's shared instance; constructing a service here would reload its models
+            ml_available = ml.ml_service.is_available()
         except Exception as e:
             logger.warning(f"ML service check failed: {e}")
             ml_available = False
@@ -167,9 +166,11 @@ async def api_info():
             "images": {
                 "upload": "POST /api/images/upload",
                 "upload_base64": "POST /api/images/upload-base64", 
+                "upload_batch": "POST /api/images/upload-batch",
                 "get": "GET /api/images/{file_id}",
                 "metadata": "GET /api/images/{file_id}/metadata",
                 "list": "GET /api/images",
+                "stats": "GET /api/images/stats",
                 "delete": "DELETE /api/images/{file_id}"
             },
             "products": {
@@ -191,9 +192,11 @@ async def api_info():
             },
             "ml": {
                 "predict": "POST /api/ml/predict",
+                "predict_upload": "POST /api/ml/predict/upload",
                 "similarity": "POST /api/ml/similarity",
                 "status": "GET /api/ml/status",
                 "colors": "POST /api/ml/analyze-colors",
+                "precompute_colors": "POST /api/ml/colors/precompute",
                 "categorize": "POST /api/ml/categorize",
                 "categories": "GET /api/ml/categories"
             }
@@ -258,9 +261,8 @@ async def startup_event():
     
     # Check ML service
     try:
-        from services.ml_service import MLService
-        ml_service = MLService()
-        if ml_service.is_available():
+        # The shared service started loading its model pool when the router was imported
+        if ml.ml_service.is_available():
             logger.info("✅ ML services available")
         else:
             logger.warning("⚠️ ML services not available")
@@ -0,0 +1,179 @@
+"""
+Exported Fashion Classifier Runtimes
+Runs TFLite / ONNX exports of the fashion classifier behind the FashionClassifier interface
+"""
+
+import os
+import abc
+import logging
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FASHION_CLASS_NAMES = [
+    "T-shirt/top", "Trouser", "Pullover", "Dress", "Coat",
+    "Sandal", "Shirt", "Sneaker", "Bag", "Ankle boot"
+]
+
+class ExportedFashionClassifier(abc.ABC):
+    """Common prediction API over an exported model; subclasses implement _run"""
+    
+    runtime = "exported"
+    
+    def __init__(self, model_path: str, num_threads: Optional[int] = None):
+        self.model_path = model_path
+        self.num_threads = num_threads or os.cpu_count() or 1
+        self.class_names = list(FASHION_CLASS_NAMES)
+        self.input_shape: Tuple[int, ...] = (224, 224, 3)
+        self._lock = threading.Lock()
+    
+    @abc.abstractmethod
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        """Class probabilities for one float32 NxHxWx3 batch"""
+    
+    def predict_batch(self, images, max_batch_size: int = 32) -> List[Dict[str, float]]:
+        """
+        Predict fashion categories for several images
+        
+        Args:
+            images: List of HxWx3 (or 1xHxWx3) arrays, or an NxHxWx3 array
+            max_batch_size: Largest batch sent through the runtime at once
+        
+        Returns:
+            Class probabilities per image, in input order
+        """
+        if isinstance(images, np.ndarray) and images.ndim == 4:
+            batch = images
+        else:
+            batch = np.concatenate([
+                image[np.newaxis] if image.ndim == 3 else image
+                for image in images
+            ])
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        
+        probabilities = []
+        # Interpreters/sessions are reused across threads, one batch at a time
+        with self._lock:
+            for start in range(0, len(batch), max_batch_size):
+                probabilities.append(self._run(batch[start:start + max_batch_size]))
+        probabilities = np.concatenate(probabilities) if probabilities else np.zeros((0, len(self.class_names)))
+        
+        return [
+            {class_name: float(row[i]) for i, class_name in enumerate(self.class_names)}
+            for row in probabilities
+        ]
+    
+    def predict(self, image: np.ndarray) -> Dict[str, float]:
+        """Predict fashion category from image"""
+        try:
+            if len(image.shape) == 3:
+                image = np.expand_dims(image, axis=0)
+            return self.predict_batch(image[:1])[0]
+        except Exception as e:
+            logger.error(f"❌ Error making prediction: {e}")
+            return {}
+    
+    def predict_top_k(self, image: np.ndarray, k: int = 3) -> List[Dict[str, Any]]:
+        """Get top-k predictions"""
+        predictions = sorted(self.predict(image).items(), key=lambda x: x[1], reverse=True)
+        return [
+            {"class": class_name, "probability": prob, "rank": i + 1}
+            for i, (class_name, prob) in enumerate(predictions[:k])
+        ]
+    
+    def get_class_confidence(self, image: np.ndarray, class_name: str) -> float:
+        """Get confidence for a specific class"""
+        return self.predict(image).get(class_name, 0.0)
+    
+    def is_available(self) -> bool:
+        """Check if model is available"""
+        return True
+    
+    def get_model_info(self) -> Dict[str, Any]:
+        """Get model information"""
+        return {
+            "runtime": self.runtime,
+            "num_classes": len(self.class_names),
+            "class_names": self.class_names,
+            "model_path": self.model_path,
+            "num_threads": self.num_threads,
+            "available": self.is_available()
+        }
+
+class TFLiteFashionClassifier(ExportedFashionClassifier):
+    """Fashion classifier running a .tflite export (float, dynamic-range or int8)"""
+    
+    runtime = "tflite"
+    
+    def __init__(self, model_path: str, num_threads: Optional[int] = None):
+        super().__init__(model_path, num_threads)
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        
+        self._interpreter_class = Interpreter
+        interpreter = self._new_interpreter()
+        self._input = interpreter.get_input_details()[0]
+        self._output = interpreter.get_output_details()[0]
+        self.input_shape = tuple(int(dim) for dim in self._input["shape"][1:])
+        # One allocated interpreter per padded batch size, so tensors are never reallocated per call
+        self._interpreters = {int(self._input["shape"][0]): interpreter}
+    
+    def _new_interpreter(self, batch_size: Optional[int] = None):
+        interpreter = self._interpreter_class(model_path=self.model_path, num_threads=self.num_threads)
+        if batch_size is not None:
+            interpreter.resize_tensor_input(self._input["index"], [batch_size, *self.input_shape])
+        interpreter.allocate_tensors()
+        return interpreter
+    
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        # Pad to the next power of two: a few interpreters cover every batch size,
+        # at most doubling the work of an odd-sized batch
+        count = len(batch)
+        padded_size = 1 << (count - 1).bit_length()
+        interpreter = self._interpreters.get(padded_size)
+        if interpreter is None:
+            interpreter = self._interpreters[padded_size] = self._new_interpreter(padded_size)
+        if padded_size != count:
+            batch = np.concatenate([batch, np.zeros((padded_size - count, *batch.shape[1:]), dtype=batch.dtype)])
+        
+        if self._input["dtype"] != np.float32:
+            # Fully integer models take quantized input
+            scale, zero_point = self._input["quantization"]
+            batch = np.round(batch / scale + zero_point).astype(self._input["dtype"])
+        
+        interpreter.set_tensor(self._input["index"], batch)
+        interpreter.invoke()
+        output = interpreter.get_tensor(self._output["index"])[:count]
+        
+        if self._output["dtype"] != np.float32:
+            scale, zero_point = self._output["quantization"]
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+class ONNXFashionClassifier(ExportedFashionClassifier):
+    """Fashion classifier running an .onnx export on ONNX Runtime's CPU provider"""
+    
+    runtime = "onnx"
+    
+    def __init__(self, model_path: str, num_threads: Optional[int] = None):
+        super().__init__(model_path, num_threads)
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.num_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        
+        model_input = self.session.get_inputs()[0]
+        self._input_name = model_input.name
+        if all(isinstance(dim, int) for dim in model_input.shape[1:]):
+            self.input_shape = tuple(model_input.shape[1:])
+    
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self._input_name: batch})[0]
@@ -12,6 +12,11 @@ from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout
 from tensorflow.keras.models import Model
 from tensorflow.keras.optimizers import Adam
 
+try:
+    from .classifier_runtimes import FASHION_CLASS_NAMES
+except ImportError:
+    from classifier_runtimes import FASHION_CLASS_NAMES
+
 logger = logging.getLogger(__name__)
 
 class FashionClassifier:
@@ -21,10 +26,10 @@ class FashionClassifier:
         self.model_path = model_path
         self.base_model = base_model
         self.model = None
-        self.class_names = [
-            "T-shirt/top", "Trouser", "Pullover", "Dress", "Coat",
-            "Sandal", "Shirt", "Sneaker", "Bag", "Ankle boot"
-        ]
+        self._infer = None
+        # False when model_path was given but an untrained model had to be built instead
+        self.loaded_from_path = False
+        self.class_names = list(FASHION_CLASS_NAMES)
         self._load_model()
     
     def _load_model(self):
@@ -33,6 +38,7 @@ class FashionClassifier:
             if self.model_path and tf.io.gfile.exists(self.model_path):
                 # Load pre-trained model
                 self.model = tf.keras.models.load_model(self.model_path)
+                self.loaded_from_path = True
                 logger.info(f"✅ Loaded pre-trained model from {self.model_path}")
             else:
                 # Create new model
@@ -41,6 +47,24 @@ class FashionClassifier:
         except Exception as e:
             logger.error(f"❌ Error loading model: {e}")
             self.model = self._create_model()
+        self._build_inference_fn()
+    
+    @property
+    def input_shape(self) -> tuple:
+        """Shape of one input image, without the batch dimension"""
+        return tuple(self.model.input_shape[1:])
+    
+    def _build_inference_fn(self):
+        """Compile a graph-mode forward pass, avoiding model.predict's per-call setup"""
+        input_shape = self.input_shape
+        model = self.model
+        
+        # A batch-agnostic signature means one trace serves every batch size
+        @tf.function(input_signature=[tf.TensorSpec((None,) + input_shape, tf.float32)])
+        def infer(images):
+            return model(images, training=False)
+        
+        self._infer = infer
     
     def _create_model(self) -> Model:
         """Create a new fashion classification model"""
@@ -78,6 +102,40 @@ class FashionClassifier:
         
         return model
     
+    def predict_batch(self, images, max_batch_size: int = 32) -> List[Dict[str, float]]:
+        """
+        Predict fashion categories for several images in one forward pass per chunk
+        
+        Args:
+            images: List of HxWx3 (or 1xHxWx3) arrays, or an NxHxWx3 array
+            max_batch_size: Largest batch sent through the model at once
+        
+        Returns:
+            Class probabilities per image, in input order
+        """
+        if self.model is None:
+            raise ValueError("Model not loaded")
+        
+        if isinstance(images, np.ndarray) and images.ndim == 4:
+            batch = images
+        else:
+            batch = np.concatenate([
+                image[np.newaxis] if image.ndim == 3 else image
+                for image in images
+            ])
+        batch = batch.astype(np.float32, copy=False)
+        
+        probabilities = []
+        for start in range(0, len(batch), max_batch_size):
+            chunk = self._infer(tf.convert_to_tensor(batch[start:start + max_batch_size]))
+            probabilities.append(chunk.numpy())
+        probabilities = np.concatenate(probabilities) if probabilities else np.zeros((0, len(self.class_names)))
+        
+        return [
+            {class_name: float(row[i]) for i, class_name in enumerate(self.class_names)}
+            for row in probabilities
+        ]
+    
     def predict(self, image: np.ndarray) -> Dict[str, float]:
         """Predict fashion category from image"""
         try:
@@ -89,14 +147,7 @@ class FashionClassifier:
                 image = np.expand_dims(image, axis=0)
             
             # Make prediction
-            predictions = self.model.predict(image, verbose=0)
-            
-            # Convert to class probabilities
-            class_probs = {}
-            for i, class_name in enumerate(self.class_names):
-                class_probs[class_name] = float(predictions[0][i])
-            
-            return class_probs
+            return self.predict_batch(image[:1])[0]
             
         except Exception as e:
             logger.error(f"❌ Error making prediction: {e}")
@@ -145,6 +196,7 @@ class FashionClassifier:
     def get_model_info(self) -> Dict[str, Any]:
         """Get model information"""
         return {
+            "runtime": "keras",
             "base_model": self.base_model,
             "num_classes": len(self.class_names),
             "class_names": self.class_names,
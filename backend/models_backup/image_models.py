@@ -3,7 +3,7 @@ Image-related Pydantic models
 """
 
 from pydantic import BaseModel, Field
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from datetime import datetime
 
 class ImageUploadResponse(BaseModel):
@@ -13,6 +13,7 @@ class ImageUploadResponse(BaseModel):
     content_type: str
     size: int
     image_url: str
+    deduplicated: bool = False  # True when an identical stored file was reused
     ml_predictions: Optional[Dict] = None
 
 class ImageMetadataResponse(BaseModel):
@@ -23,6 +24,35 @@ class ImageMetadataResponse(BaseModel):
     size: int
     metadata: Dict
 
+class BatchUploadItemResult(BaseModel):
+    filename: str
+    success: bool
+    file_id: Optional[str] = None
+    content_type: Optional[str] = None
+    size: Optional[int] = None
+    image_url: Optional[str] = None
+    deduplicated: bool = False
+    error: Optional[str] = None
+
+class BatchUploadResponse(BaseModel):
+    success: bool
+    total: int
+    succeeded: int
+    failed: int
+    results: List[BatchUploadItemResult]
+    processing_time: str
+
+class ImageCategoryStats(BaseModel):
+    category: str
+    count: int
+    total_bytes: int
+
+class ImageStatsResponse(BaseModel):
+    categories: List[ImageCategoryStats]
+    total_count: int
+    total_bytes: int
+    generated_at: str
+
 class ImageUploadRequest(BaseModel):
     image_data: str = Field(..., description="Base64 encoded image data")
     filename: str = Field(..., description="Original filename")
@@ -3,17 +3,17 @@ Image Management API Routes
 Handles image upload, retrieval, and management with MongoDB GridFS
 """
 
-import io
-import base64
-from typing import List, Optional
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, BackgroundTasks
-from fastapi.responses import StreamingResponse
-from PIL import Image
+import binascii
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import List, Optional, Tuple, Dict, Any
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, BackgroundTasks, Request, Query
+from fastapi.responses import StreamingResponse, Response
 import logging
 
 # Import our models and services
-from ..models.image_models import ImageUploadResponse, ImageMetadataResponse
-from ..services.image_service import ImageService
+from ..models.image_models import ImageUploadResponse, ImageMetadataResponse, BatchUploadResponse, ImageStatsResponse
+from ..services.image_service import ImageService, UploadTooLargeError, InvalidImageError
 from ..core.config import get_settings
 
 # Configure logging
@@ -33,41 +33,32 @@ async def upload_image(
     category: Optional[str] = Form(None),
     product_id: Optional[str] = Form(None)
 ):
-    """Upload an image file and store in GridFS"""
+    """Upload an image file, streaming it into GridFS"""
     try:
         # Validate file type
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
         
-        # Read file data
-        file_data = await file.read()
-        
-        # Optional: Resize image to optimize storage
-        try:
-            img = Image.open(io.BytesIO(file_data))
-            # Resize if too large (max 1920x1920)
-            if img.width > 1920 or img.height > 1920:
-                img.thumbnail((1920, 1920), Image.Resampling.LANCZOS)
-                output = io.BytesIO()
-                img.save(output, format=img.format or 'JPEG', quality=85)
-                file_data = output.getvalue()
-        except Exception as e:
-            logger.warning(f"Could not optimize image: {e}")
-        
-        # Store in GridFS using service
-        result = await image_service.upload_image(
-            file_data, 
-            file.filename, 
+        # Size and magic bytes are enforced chunk by chunk while storing
+        result = await image_service.upload_image_stream(
+            file,
+            file.filename,
             file.content_type,
             category=category,
             product_id=product_id
         )
         
-        # Add ML processing in background if available
-        background_tasks.add_task(image_service.process_image_ml, result.file_id, file_data)
+        # Variants and ML processing read the stored file back in the background
+        background_tasks.add_task(image_service.process_uploaded_image, result.file_id, result.content_type)
         
         return result
     
+    except HTTPException:
+        raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error uploading image: {e}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
@@ -89,36 +80,238 @@ async def upload_image_base64(
             product_id=product_id
         )
         
-        # Add ML processing in background if available
-        if image_data.startswith('data:'):
-            image_data = image_data.split(',')[1]
-        image_bytes = base64.b64decode(image_data)
-        background_tasks.add_task(image_service.process_image_ml, result.file_id, image_bytes)
+        # Variants and ML processing read the stored file back in the background
+        background_tasks.add_task(image_service.process_uploaded_image, result.file_id, result.content_type)
         
         return result
     
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (InvalidImageError, binascii.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image data: {str(e)}")
     except Exception as e:
         logger.error(f"Error uploading base64 image: {e}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+ARCHIVE_CONTENT_TYPES = {
+    "application/zip", "application/x-zip-compressed", "application/x-tar",
+    "application/gzip", "application/x-gzip", "application/x-gtar"
+}
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz")
+
+def _is_archive(file: UploadFile) -> bool:
+    return file.content_type in ARCHIVE_CONTENT_TYPES or (file.filename or "").lower().endswith(ARCHIVE_EXTENSIONS)
+
+@router.post("/upload-batch", response_model=BatchUploadResponse)
+async def upload_image_batch(
+    files: List[UploadFile] = File(...),
+    category: Optional[str] = Form(None),
+    product_id: Optional[str] = Form(None),
+    embed: bool = Form(False)
+):
+    """Upload many images (or one zip/tar archive of images) processed in parallel"""
+    try:
+        if len(files) > settings.batch_upload_max_files:
+            raise HTTPException(
+                status_code=413,
+                detail=f"At most {settings.batch_upload_max_files} files per batch"
+            )
+        
+        if len(files) == 1 and _is_archive(files[0]):
+            return await image_service.upload_archive(
+                files[0].file,
+                files[0].filename,
+                category=category,
+                product_id=product_id,
+                run_ml=embed
+            )
+        
+        return await image_service.upload_images_batch(
+            files,
+            category=category,
+            product_id=product_id,
+            run_ml=embed
+        )
+    
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in batch upload: {e}")
+        raise HTTPException(status_code=500, detail=f"Batch upload failed: {str(e)}")
+
+def _image_etag(metadata: Dict[str, Any]) -> str:
+    """Strong ETag from the stored content hash, falling back to GridFS md5 or file identity"""
+    digest = metadata.get("sha256") or metadata.get("content_hash") or metadata.get("md5")
+    if not digest:
+        upload_date = metadata.get("upload_date")
+        digest = f"{metadata['id']}-{metadata['length']}-{int(upload_date.timestamp()) if upload_date else 0}"
+    return f'"{digest}"'
+
+def _is_not_modified(request: Request, etag: str, metadata: Dict[str, Any]) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since against stored metadata"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    upload_date = metadata.get("upload_date")
+    if if_modified_since and upload_date:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return int(upload_date.replace(tzinfo=timezone.utc).timestamp()) <= int(since.timestamp())
+    
+    return False
+
+def _parse_range(range_header: str, length: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range ``bytes=`` header into inclusive offsets
+    
+    Returns None when the header should be ignored (multiple ranges or bad syntax)
+    and raises HTTPException 416 when the range cannot be satisfied.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else length - 1
+        elif last:
+            # Suffix range: the final N bytes
+            start = max(length - int(last), 0)
+            end = length - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    
+    if start >= length or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{length}"}
+        )
+    return start, min(end, length - 1)
+
+async def _get_image_variant(
+    file_id: str,
+    request: Request,
+    metadata: Dict[str, Any],
+    w: Optional[int],
+    h: Optional[int],
+    fmt: Optional[str]
+) -> Response:
+    """Serve a resized / re-encoded variant of an image"""
+    variants = image_service.variants
+    try:
+        output_format = variants.negotiate_format(request.headers.get("accept"), fmt, metadata["content_type"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    w, h = variants.clamp_size(w, h)
+    key = variants.variant_key(file_id, w, h, output_format)
+    etag = f'"{_image_etag(metadata).strip(chr(34))}-{key.split(":", 1)[1]}"'
+    
+    headers = {
+        "Cache-Control": "max-age=86400",
+        "ETag": etag,
+        # The chosen format depends on Accept unless fmt was given
+        "Vary": "Accept"
+    }
+    if _is_not_modified(request, etag, metadata):
+        return Response(status_code=304, headers=headers)
+    
+    data, content_type = await variants.get_variant(file_id, w, h, output_format)
+    return Response(content=data, media_type=content_type, headers=headers)
+
+@router.get("/stats", response_model=ImageStatsResponse)
+async def get_image_stats():
+    """Image counts and storage used per category"""
+    try:
+        return await image_service.get_image_stats()
+    except Exception as e:
+        logger.error(f"Error getting image stats: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get image stats")
+
 @router.get("/{file_id}")
-async def get_image_file(file_id: str):
-    """Retrieve image file from GridFS"""
+async def get_image_file(
+    file_id: str,
+    request: Request,
+    w: Optional[int] = None,
+    h: Optional[int] = None,
+    fmt: Optional[str] = None
+):
+    """Stream image file from GridFS, or a resized variant when w/h/fmt are given"""
     try:
-        image_data, content_type = await image_service.get_image_file(file_id)
+        metadata = await image_service.get_image_file_metadata(file_id)
+        if w or h or fmt:
+            return await _get_image_variant(file_id, request, metadata, w, h, fmt)
+        
+        length = metadata["length"]
+        etag = _image_etag(metadata)
+        
+        headers = {
+            "Cache-Control": "max-age=86400",  # Cache for 24 hours
+            "ETag": etag,
+            "Accept-Ranges": "bytes"
+        }
+        if metadata.get("upload_date"):
+            headers["Last-Modified"] = format_datetime(
+                metadata["upload_date"].replace(tzinfo=timezone.utc), usegmt=True
+            )
+        
+        # Revalidation only costs the metadata lookup above
+        if _is_not_modified(request, etag, metadata):
+            return Response(status_code=304, headers=headers)
+        
+        byte_range = None
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        if range_header and length and (if_range is None or if_range.strip() == etag):
+            byte_range = _parse_range(range_header, length)
+        
+        status_code = 200
+        start, end = 0, length - 1
+        if byte_range:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+        headers["Content-Length"] = str(end - start + 1 if length else 0)
+        
+        # Hot images come from memory or local disk; large ones stream from GridFS
+        if length and image_service.cache.is_cacheable(length):
+            chunks, tier = await image_service.cache.get_range(file_id, metadata["content_type"], start, end)
+            headers["X-Cache-Tier"] = tier
+        else:
+            chunks = await image_service.get_image_stream(file_id, start, end if length else None)
         
         return StreamingResponse(
-            io.BytesIO(image_data),
-            media_type=content_type,
-            headers={"Cache-Control": "max-age=86400"}  # Cache for 24 hours
+            chunks,
+            status_code=status_code,
+            media_type=metadata["content_type"],
+            headers=headers
         )
     
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found")
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error retrieving image {file_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve image")
 
+@router.get("/cache/stats")
+async def get_image_cache_stats():
+    """Hit ratio and bytes served per image cache tier"""
+    return image_service.cache.get_metrics()
+
 @router.get("/{file_id}/metadata", response_model=ImageMetadataResponse)
 async def get_image_info(file_id: str):
     """Get image metadata"""
@@ -144,10 +337,15 @@ async def delete_image_file(file_id: str):
         raise HTTPException(status_code=500, detail="Failed to delete image")
 
 @router.get("", response_model=List[ImageMetadataResponse])
-async def list_all_images(limit: int = 50, skip: int = 0, category: Optional[str] = None):
+async def list_all_images(
+    limit: int = Query(50, ge=1, le=200),
+    skip: int = Query(0, ge=0),
+    category: Optional[str] = None,
+    product_id: Optional[str] = None
+):
     """List all images with optional filtering"""
     try:
-        return await image_service.list_images(limit, skip, category)
+        return await image_service.list_images(limit, skip, category, product_id)
     except Exception as e:
         logger.error(f"Error listing images: {e}")
         raise HTTPException(status_code=500, detail="Failed to list images")
@@ -3,21 +3,23 @@ Machine Learning API Routes
 Handles ML predictions, image analysis, and AI-powered features
 """
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, BackgroundTasks
 import logging
 
 # Import our models and services
 from ..models.ml_models import MLPredictionRequest, MLPredictionResponse, SimilarityRequest, SimilarityResponse
-from ..services.ml_service import MLService
+from ..services.ml_service import get_ml_service
+from ..core.config import get_settings
 
 # Configure logging
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 # Create router
 router = APIRouter(prefix="/ml", tags=["Machine Learning"])
 
-# Initialize ML service
-ml_service = MLService()
+# Shared ML service (its model pool loads in the background)
+ml_service = get_ml_service()
 
 @router.post("/predict", response_model=MLPredictionResponse)
 async def predict_image_ml(request: MLPredictionRequest):
@@ -35,6 +37,36 @@ async def predict_image_ml(request: MLPredictionRequest):
         logger.error(f"ML prediction error: {e}")
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
+@router.post("/predict/upload", response_model=MLPredictionResponse)
+async def predict_image_upload(
+    file: UploadFile = File(...),
+    include_colors: bool = Form(True)
+):
+    """Get ML predictions for a multipart image upload (no base64 round trip)"""
+    try:
+        if not ml_service.is_available():
+            raise HTTPException(status_code=503, detail="ML service not available")
+        
+        if file.content_type and not file.content_type.startswith('image/'):
+            raise HTTPException(status_code=400, detail="File must be an image")
+        
+        image_data = await file.read(settings.max_file_size + 1)
+        if len(image_data) > settings.max_file_size:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Image exceeds maximum size of {settings.max_file_size} bytes"
+            )
+        if not image_data:
+            raise HTTPException(status_code=400, detail="Empty image upload")
+        
+        return await ml_service.predict_image(image_data, include_colors)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"ML prediction error: {e}")
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+
 @router.post("/similarity", response_model=SimilarityResponse)
 async def compute_similarity(request: SimilarityRequest):
     """Compute similarity between image and text"""
@@ -78,6 +110,17 @@ async def analyze_image_colors(image_data: str):
         logger.error(f"Color analysis error: {e}")
         raise HTTPException(status_code=500, detail=f"Color analysis failed: {str(e)}")
 
+@router.post("/colors/precompute")
+async def precompute_product_colors(background_tasks: BackgroundTasks, batch_size: int = 100, force: bool = False):
+    """Start the batch job that stores dominant colours on catalog products"""
+    background_tasks.add_task(ml_service.precompute_product_colors, batch_size, force)
+    return {
+        "success": True,
+        "message": "Product color precomputation started",
+        "batch_size": batch_size,
+        "force": force
+    }
+
 @router.post("/categorize")
 async def categorize_image(image_data: str):
     """Categorize fashion item from image"""
@@ -3,10 +3,12 @@ Visual Search API Routes
 Handles image recognition, similarity search, and outfit recommendations
 """
 
+import asyncio
 import logging
-from typing import Dict, Any
+from functools import partial
+from typing import Dict, Any, Union
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, UploadFile, File, Form
 from fastapi.responses import JSONResponse
 
 from ..models.visual_search_models import (
@@ -15,10 +17,12 @@ from ..models.visual_search_models import (
     ImageAnalysisRequest,
     ImageAnalysisResponse
 )
-from ..services.visual_search_service import VisualSearchService
+from ..services.visual_search_service import VisualSearchService, CLIP_INPUT_SIZE
+from ..core.config import get_settings
 
 # Configure logging
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 # Create router
 router = APIRouter(prefix="/visual-search", tags=["Visual Search"])
@@ -26,6 +30,21 @@ router = APIRouter(prefix="/visual-search", tags=["Visual Search"])
 # Initialize service
 visual_search_service = VisualSearchService()
 
+async def _read_image_upload(file: UploadFile) -> bytes:
+    """Read a multipart image upload, bounded by the configured max file size"""
+    if file.content_type and not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    
+    image_data = await file.read(settings.max_file_size + 1)
+    if len(image_data) > settings.max_file_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image exceeds maximum size of {settings.max_file_size} bytes"
+        )
+    if not image_data:
+        raise HTTPException(status_code=400, detail="Empty image upload")
+    return image_data
+
 @router.post("/search", response_model=VisualSearchResponse,
              summary="Visual Product Search",
              description="Find similar products and generate outfit recommendations from uploaded image")
@@ -38,14 +57,29 @@ async def visual_search(request: VisualSearchRequest):
     2. Finds similar products in the database
     3. Generates outfit recommendations based on the detected item
     """
+    logger.info(f"Visual search request received - max_products: {request.max_products}, max_outfits: {request.max_outfits}")
+    return await _visual_search(request.image, request.max_products, request.max_outfits)
+
+@router.post("/search/upload", response_model=VisualSearchResponse,
+             summary="Visual Product Search (Binary Upload)",
+             description="Same as /search, but takes the image as a multipart file instead of base64")
+async def visual_search_upload(
+    file: UploadFile = File(...),
+    max_products: int = Form(10, ge=1, le=50),
+    max_outfits: int = Form(3, ge=1, le=10)
+):
+    """Perform visual search on raw uploaded image bytes"""
+    image_data = await _read_image_upload(file)
+    logger.info(f"Visual search upload received - {len(image_data)} bytes, max_products: {max_products}, max_outfits: {max_outfits}")
+    return await _visual_search(image_data, max_products, max_outfits)
+
+async def _visual_search(image_data: Union[str, bytes], max_products: int, max_outfits: int) -> VisualSearchResponse:
     try:
-        logger.info(f"Visual search request received - max_products: {request.max_products}, max_outfits: {request.max_outfits}")
-        
         # Perform complete analysis
         results = await visual_search_service.analyze_image_and_recommend(
-            image_data=request.image,
-            max_products=request.max_products,
-            max_outfits=request.max_outfits
+            image_data=image_data,
+            max_products=max_products,
+            max_outfits=max_outfits
         )
         
         if not results['success']:
@@ -75,13 +109,27 @@ async def analyze_image(request: ImageAnalysisRequest):
     - Similar product search
     - Outfit recommendations
     """
+    logger.info("Complete image analysis request received")
+    return await _analyze_image(request.image, include_colors=request.include_colors)
+
+@router.post("/analyze/upload", response_model=ImageAnalysisResponse,
+             summary="Complete Image Analysis (Binary Upload)",
+             description="Same as /analyze, but takes the image as a multipart file instead of base64")
+async def analyze_image_upload(file: UploadFile = File(...), include_colors: bool = Form(True)):
+    """Complete image analysis on raw uploaded image bytes"""
+    image_data = await _read_image_upload(file)
+    logger.info(f"Complete image analysis upload received - {len(image_data)} bytes")
+    return await _analyze_image(image_data, include_colors=include_colors)
+
+async def _analyze_image(image_data: Union[str, bytes], include_colors: bool = True) -> ImageAnalysisResponse:
     try:
-        logger.info("Complete image analysis request received")
+        # Decoded once; similarity search and colour analysis share the result
+        context = visual_search_service.image_context(image_data)
         
         # For now, we'll use the visual search service
         # In a full implementation, this would integrate with the ML server
         results = await visual_search_service.analyze_image_and_recommend(
-            image_data=request.image,
+            image_data=context,
             max_products=10,
             max_outfits=3
         )
@@ -93,7 +141,7 @@ async def analyze_image(request: ImageAnalysisRequest):
         return ImageAnalysisResponse(
             success=True,
             detected_items=[],  # Would be populated by ML server integration
-            colors=[],  # Would be populated by color analysis
+            colors=visual_search_service.analyze_colors(context) if include_colors else [],
             similar_products=results['similar_products'],
             outfit_recommendations=results['outfit_recommendations'],
             overall_confidence=85,  # Placeholder
@@ -193,9 +241,24 @@ async def collab_visual_search(request: VisualSearchRequest):
     Advanced visual search using the collab system integration
     This endpoint uses CLIP + FAISS + MongoDB for high-performance similarity search
     """
+    logger.info("Collab visual search request received")
+    return await _collab_search(request.image, request.max_products, request.max_outfits)
+
+@router.post("/collab-search/upload",
+             summary="Collab System Visual Search (Binary Upload)",
+             description="Same as /collab-search, but takes the image as a multipart file instead of base64")
+async def collab_visual_search_upload(
+    file: UploadFile = File(...),
+    max_products: int = Form(10, ge=1, le=50),
+    max_outfits: int = Form(3, ge=1, le=10)
+):
+    """Collab system visual search on raw uploaded image bytes"""
+    image_data = await _read_image_upload(file)
+    logger.info(f"Collab visual search upload received - {len(image_data)} bytes")
+    return await _collab_search(image_data, max_products, max_outfits)
+
+async def _collab_search(image_data: Union[str, bytes], max_products: int, max_outfits: int) -> VisualSearchResponse:
     try:
-        logger.info("Collab visual search request received")
-        
         # Check if enhanced ML service is available
         if not visual_search_service.enhanced_ml_available:
             raise HTTPException(
@@ -211,16 +274,16 @@ async def collab_visual_search(request: VisualSearchRequest):
         
         # Perform enhanced search
         results = await visual_search_service.find_similar_products(
-            image_data=request.image,
-            limit=request.max_products
+            image_data=image_data,
+            limit=max_products
         )
         
         # Generate outfit recommendations if requested
         outfit_recommendations = []
-        if request.max_outfits > 0:
+        if max_outfits > 0:
             outfit_recommendations = await visual_search_service.generate_outfit_recommendations(
                 results,
-                max_outfits=request.max_outfits
+                max_outfits=max_outfits
             )
         
         return VisualSearchResponse(
@@ -259,17 +322,29 @@ async def upload_and_search(request: VisualSearchRequest, username: str = "guest
                 detail="Enhanced ML service not available"
             )
         
-        # Preprocess image
-        image = visual_search_service._preprocess_image(request.image)
+        # The upload is stored too, so decode at the stored size rather than the CLIP input size
+        if settings.store_full_user_uploads:
+            target_size = None
+        else:
+            target_size = max(settings.user_upload_thumbnail_size, CLIP_INPUT_SIZE)
+        try:
+            context = visual_search_service.image_context(request.image, target_size=target_size)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid image data")
+        
+        # Decoding, hashing, encoding and the CLIP pass all block, so keep them off the event loop
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(None, visual_search_service._preprocess_image, context)
         if not image:
             raise HTTPException(status_code=400, detail="Invalid image data")
         
         # Use enhanced ML service upload and search
-        search_result = visual_search_service.enhanced_ml.upload_user_image_and_search(
-            image=image,
+        search_result = await loop.run_in_executor(None, partial(
+            visual_search_service.enhanced_ml.upload_user_image_and_search,
+            context,
             username=username,
             top_k=request.max_products
-        )
+        ))
         
         if not search_result['success']:
             raise HTTPException(status_code=500, detail=search_result.get('error', 'Search failed'))
@@ -10,12 +10,23 @@ import numpy as np
 import faiss
 import torch
 from PIL import Image
-from transformers import CLIPProcessor, CLIPModel
 from typing import List, Dict, Any, Optional, Tuple
 from pymongo import MongoClient
 import gridfs
+from bson import ObjectId
 from datetime import datetime
 import io
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+from backend.database import WriteBehindBuffer
+
+from ..core.config import get_settings
+from ..utils.clip_encoder import (
+    CLIP_MODEL_NAME, configure_torch_threads, get_shared_clip_model, encode_images, preprocess_clip_images
+)
+from ..utils.image_context import ImageContext
+from .retention_service import RetentionService, USER_UPLOAD_SEARCH_TYPE
 
 logger = logging.getLogger(__name__)
 
@@ -23,14 +34,18 @@ class EnhancedMLService:
     """Enhanced ML service integrating collab system functionality"""
     
     def __init__(self):
+        self.settings = get_settings()
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.clip_model = None
-        self.clip_processor = None
+        self.clip_quantized = False
+        self.torch_threads = None
         self.faiss_index = None
         self.metadata = []
         self.mongo_client = None
         self.db = None
         self.fs = None
+        self.write_buffer = None
+        self.retention = None
         
         # Initialize components
         self._initialize_clip()
@@ -40,14 +55,18 @@ class EnhancedMLService:
     def _initialize_clip(self):
         """Initialize CLIP model"""
         try:
-            clip_model_name = "openai/clip-vit-base-patch32"
-            self.clip_model = CLIPModel.from_pretrained(clip_model_name).to(self.device)
-            self.clip_processor = CLIPProcessor.from_pretrained(clip_model_name)
-            logger.info(f"✅ CLIP model loaded on {self.device}")
+            if self.device == "cpu":
+                self.torch_threads = configure_torch_threads(
+                    self.settings.clip_num_threads, self.settings.clip_interop_threads
+                )
+            self.clip_quantized = self.settings.clip_quantize and self.device == "cpu"
+            # The same instance backs the ML service's zero-shot classifier
+            self.clip_model = get_shared_clip_model(CLIP_MODEL_NAME, self.device, quantize=self.clip_quantized)
+            mode = "int8 dynamic quantization" if self.clip_quantized else "float32"
+            logger.info(f"✅ CLIP model loaded on {self.device} ({mode}, threads {self.torch_threads})")
         except Exception as e:
             logger.error(f"❌ Failed to load CLIP model: {e}")
             self.clip_model = None
-            self.clip_processor = None
     
     def _initialize_mongodb(self):
         """Initialize MongoDB connection"""
@@ -56,6 +75,10 @@ class EnhancedMLService:
             self.mongo_client = MongoClient(mongo_uri)
             self.db = self.mongo_client["MANVUE"]
             self.fs = gridfs.GridFS(self.db)
+            self.write_buffer = WriteBehindBuffer(self.db)
+            self.retention = RetentionService(self.db, self.settings)
+            self.retention.ensure_indexes()
+            self.retention.start()
             logger.info("✅ Connected to MongoDB MANVUE")
         except Exception as e:
             logger.error(f"❌ Failed to connect to MongoDB: {e}")
@@ -86,25 +109,26 @@ class EnhancedMLService:
     def is_available(self) -> bool:
         """Check if ML service is available"""
         return (
-            self.clip_model is not None and 
-            self.clip_processor is not None and
+            self.clip_model is not None and
             self.faiss_index is not None and
             len(self.metadata) > 0
         )
     
     def image_to_embedding(self, image: Image.Image) -> Optional[np.ndarray]:
         """Convert PIL image to CLIP embedding"""
-        if not self.clip_model or not self.clip_processor:
+        embeddings = self.images_to_embeddings([image])
+        return embeddings[0] if embeddings is not None else None
+    
+    def images_to_embeddings(self, images: List[Image.Image]) -> Optional[np.ndarray]:
+        """Convert PIL images to CLIP embeddings in one forward pass (N x 512, normalized)"""
+        if not self.clip_model:
             return None
         
         try:
-            inputs = self.clip_processor(images=[image], return_tensors="pt").to(self.device)
-            with torch.no_grad():
-                feats = self.clip_model.get_image_features(**inputs)
-            feats = feats / feats.norm(p=2, dim=-1, keepdim=True)
-            return feats.cpu().numpy()[0].astype("float32")
+            pixel_values = preprocess_clip_images(images).to(self.device)
+            return encode_images(self.clip_model, pixel_values)
         except Exception as e:
-            logger.error(f"Error generating embedding: {e}")
+            logger.error(f"Error generating embeddings: {e}")
             return None
     
     def find_similar_products(
@@ -144,46 +168,54 @@ class EnhancedMLService:
     
     def upload_user_image_and_search(
         self, 
-        image: Image.Image, 
+        context: ImageContext, 
         username: str = "guest", 
         top_k: int = 6
     ) -> Dict[str, Any]:
-        """Upload user image and find similar products (like collab function)"""
+        """Upload user image and find similar products (like collab function; blocking, run it in an executor)"""
         try:
-            # Save image to MongoDB GridFS
-            buf = io.BytesIO()
-            image.save(buf, format="JPEG")
-            buf.seek(0)
-            
+            image = context.image
+            # Reserve the GridFS id up front so the upload can be written later
+            file_id = ObjectId()
             upload_name = f"user_{username}_{int(datetime.now().timestamp())}.jpg"
-            file_id = self.fs.put(
-                buf.read(),
-                filename=upload_name,
-                metadata={
-                    "username": username,
-                    "uploadedAt": datetime.utcnow(),
-                    "search_type": "visual_search"
-                }
-            )
+            uploaded_at = datetime.utcnow()
             
             # Find similar products
             similar_products = self.find_similar_products(image, top_k)
             
-            # Save query log
-            query_doc = {
+            # Encode now so the buffer holds compact bytes, not a decoded image
+            upload_data, upload_metadata = self._encode_user_upload(
+                image, context.content_hash, username, uploaded_at
+            )
+            
+            # Persist the upload and query log off the request path; a dropped upload
+            # must not leave the query log pointing at a file that is never written
+            stored = self.write_buffer.submit(
+                self._store_user_upload, upload_data, file_id, upload_name, upload_metadata,
+                nbytes=len(upload_data)
+            )
+            if not stored:
+                logger.warning("⚠️ Write-behind buffer full, user upload not stored")
+            self.write_buffer.enqueue("queries", {
                 "username": username,
-                "uploaded_file_id": str(file_id),
+                "uploaded_file_id": str(file_id) if stored else None,
                 "uploaded_filename": upload_name,
-                "results": similar_products,
-                "createdAt": datetime.utcnow(),
+                # Only what is needed to replay the query; full metadata lives in metadata.json
+                "results": [
+                    {
+                        "product_id": product.get("product_id"),
+                        "filename": product.get("filename"),
+                        "similarity_score": product.get("similarity_score")
+                    }
+                    for product in similar_products
+                ],
+                "createdAt": uploaded_at,
                 "total_results": len(similar_products)
-            }
-            
-            self.db["queries"].insert_one(query_doc)
+            })
             
             return {
                 "success": True,
-                "file_id": str(file_id),
+                "file_id": str(file_id) if stored else None,
                 "similar_products": similar_products,
                 "total_found": len(similar_products)
             }
@@ -196,6 +228,60 @@ class EnhancedMLService:
                 "similar_products": []
             }
     
+    def _encode_user_upload(
+        self,
+        image: Image.Image,
+        content_hash: str,
+        username: str,
+        uploaded_at: datetime
+    ) -> Tuple[bytes, Dict[str, Any]]:
+        """Encode a user upload as JPEG (a thumbnail unless full uploads are stored) with its metadata"""
+        metadata = {
+            "username": username,
+            "uploadedAt": uploaded_at,
+            "search_type": USER_UPLOAD_SEARCH_TYPE,
+            # Hash of the uploaded file bytes, comparable with GridFS sha256 elsewhere
+            "content_hash": content_hash,
+            "original_size": list(image.size)
+        }
+        
+        if not self.settings.store_full_user_uploads:
+            # A thumbnail is enough to audit queries and is a fraction of the size
+            size = self.settings.user_upload_thumbnail_size
+            image = image.copy()
+            image.thumbnail((size, size))
+            metadata["thumbnail"] = True
+        
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        buf = io.BytesIO()
+        image.save(buf, format="JPEG", quality=85)
+        return buf.getvalue(), metadata
+    
+    def _store_user_upload(
+        self,
+        data: bytes,
+        file_id: ObjectId,
+        upload_name: str,
+        metadata: Dict[str, Any]
+    ):
+        """Save an encoded user upload to GridFS (runs on the write-behind thread)"""
+        self.fs.put(
+            data,
+            _id=file_id,
+            filename=upload_name,
+            metadata=metadata
+        )
+    
+    def close(self):
+        """Flush pending analytics writes and close the MongoDB connection"""
+        if self.retention:
+            self.retention.stop()
+        if self.write_buffer:
+            self.write_buffer.close()
+        if self.mongo_client:
+            self.mongo_client.close()
+    
     def get_model_info(self) -> Dict[str, Any]:
         """Get information about loaded models and data"""
         return {
@@ -204,6 +290,9 @@ class EnhancedMLService:
             "faiss_index_size": self.faiss_index.ntotal if self.faiss_index else 0,
             "metadata_count": len(self.metadata),
             "device": self.device,
-            "mongodb_connected": self.mongo_client is not None
+            "clip_quantized": self.clip_quantized,
+            "torch_threads": self.torch_threads,
+            "mongodb_connected": self.mongo_client is not None,
+            "retention": self.retention.get_metrics() if self.retention else None
         }
 
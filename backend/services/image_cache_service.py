@@ -0,0 +1,259 @@
+"""
+Image Cache Service
+Tiered cache for original images: memory LRU, then local disk, then GridFS
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, BinaryIO, Iterator, Optional, Tuple
+from bson import ObjectId
+
+# Import database functions
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+from backend.database import get_image
+from backend.invalidation import EventType, get_invalidation_bus
+
+from ..core.config import get_settings
+from .image_variant_service import BytesLRU
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+TIERS = ("memory", "disk", "gridfs")
+
+# Temp files older than this were abandoned by a crashed writer
+STALE_TMP_SECONDS = 3600
+DISK_READ_CHUNK = 64 * 1024
+
+def iter_file_range(f: BinaryIO, start: int, end: int, chunk_size: int = DISK_READ_CHUNK) -> Iterator[bytes]:
+    """Read bytes start..end (inclusive) of an open file in chunks, closing it afterwards"""
+    with f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+class DiskLRU:
+    """
+    Size-capped directory of cached files evicted least recently used first
+    
+    max_bytes is this process's budget. Workers may share the directory; each one
+    evicts only what it tracks, so the directory can grow to workers x max_bytes.
+    """
+    
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._sizes: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_existing()
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+    
+    def _load_existing(self):
+        """Rebuild LRU order from file modification times after a restart"""
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = self._path(name)
+            try:
+                stat = os.stat(path)
+                if name.endswith(".tmp"):
+                    # Other workers may still be writing theirs; only remove abandoned ones
+                    if now - stat.st_mtime > STALE_TMP_SECONDS:
+                        os.unlink(path)
+                    continue
+            except FileNotFoundError:
+                # Evicted or renamed by another worker meanwhile
+                continue
+            entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._sizes[name] = size
+            self.current_bytes += size
+        self._evict()
+    
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._sizes:
+            name, size = self._sizes.popitem(last=False)
+            self.current_bytes -= size
+            try:
+                os.unlink(self._path(name))
+            except FileNotFoundError:
+                pass
+    
+    def open(self, key: str) -> Optional[BinaryIO]:
+        """Open a cached file for reading; the handle stays valid if it is evicted meanwhile"""
+        with self._lock:
+            if key not in self._sizes:
+                return None
+            self._sizes.move_to_end(key)
+        try:
+            return open(self._path(key), "rb")
+        except FileNotFoundError:
+            self.discard(key)
+            return None
+    
+    def get(self, key: str) -> Optional[bytes]:
+        f = self.open(key)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+    
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        # Unique per process and thread, as workers may share the directory
+        tmp_path = self._path(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self.current_bytes += len(data) - self._sizes.pop(key, 0)
+            self._sizes[key] = len(data)
+            self._evict()
+    
+    def discard(self, key: str):
+        with self._lock:
+            size = self._sizes.pop(key, None)
+            if size is None:
+                return
+            self.current_bytes -= size
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+class ImageCacheService:
+    """Service for serving hot images without a GridFS round trip"""
+    
+    def __init__(self):
+        self.settings = get_settings()
+        self.memory = BytesLRU(self.settings.image_memory_cache_bytes)
+        self.disk = DiskLRU(self.settings.image_disk_cache_dir, self.settings.image_disk_cache_bytes)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.metrics = {
+            "hits": {tier: 0 for tier in TIERS},
+            "bytes_served": {tier: 0 for tier in TIERS}
+        }
+        
+        # Deleted images must not outlive GridFS in any worker's cache
+        get_invalidation_bus().subscribe(self._on_image_changed, EventType.IMAGE_CHANGED)
+    
+    def _on_image_changed(self, event):
+        if event.operation == "delete" and event.document_id:
+            self.evict(event.document_id)
+    
+    def is_cacheable(self, length: int) -> bool:
+        """Whether an image is small enough to go through the cache"""
+        return length <= self.settings.image_disk_cache_max_object
+    
+    def _record(self, tier: str, nbytes: int):
+        self.metrics["hits"][tier] += 1
+        self.metrics["bytes_served"][tier] += nbytes
+    
+    async def _fill(self, file_id: str, content_type: str) -> Tuple[bytes, str]:
+        """Load from disk or GridFS and populate the faster tiers"""
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(None, self.disk.get, file_id)
+        tier = "disk"
+        if data is None:
+            data = await get_image(file_id)
+            if data is None:
+                raise FileNotFoundError(f"Image {file_id} not found")
+            tier = "gridfs"
+            await loop.run_in_executor(None, self.disk.put, file_id, data)
+        
+        if len(data) <= self.settings.image_memory_cache_max_object:
+            self.memory.put(file_id, data, content_type)
+        return data, tier
+    
+    def _fill_done(self, file_id: str, task: asyncio.Task):
+        if self._inflight.get(file_id) is task:
+            del self._inflight[file_id]
+        # Waiters re-raise a failure; keep the loop from warning when all of them left
+        if not task.cancelled():
+            task.exception()
+    
+    async def get(self, file_id: str, content_type: str) -> Tuple[bytes, str]:
+        """
+        Get image bytes through the cache tiers
+        
+        Args:
+            file_id: GridFS file ID
+            content_type: Content type to remember alongside the bytes
+        
+        Returns:
+            Tuple of (image bytes, tier that served them)
+        """
+        # file_id doubles as the disk cache file name
+        if not ObjectId.is_valid(file_id):
+            raise FileNotFoundError(f"Image {file_id} not found")
+        
+        cached = self.memory.get(file_id)
+        if cached is not None:
+            self._record("memory", len(cached[0]))
+            return cached[0], "memory"
+        
+        # Single-flight: concurrent misses for one image share one fill. The fill runs as
+        # its own task so a cancelled caller neither aborts it nor strands the others
+        task = self._inflight.get(file_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fill(file_id, content_type))
+            self._inflight[file_id] = task
+            task.add_done_callback(lambda done: self._fill_done(file_id, done))
+        data, tier = await asyncio.shield(task)
+        
+        self._record(tier, len(data))
+        return data, tier
+    
+    async def get_range(self, file_id: str, content_type: str, start: int, end: int) -> Tuple[Iterator[bytes], str]:
+        """
+        Get bytes start..end (inclusive) of an image through the cache tiers
+        
+        Disk hits are read in chunks while the response is sent rather than loaded whole.
+        
+        Returns:
+            Tuple of (iterator over the requested bytes, tier that served them)
+        """
+        if ObjectId.is_valid(file_id) and self.memory.get(file_id) is None:
+            f = await asyncio.get_running_loop().run_in_executor(None, self.disk.open, file_id)
+            if f is not None:
+                self._record("disk", end - start + 1)
+                return iter_file_range(f, start, end), "disk"
+        
+        data, tier = await self.get(file_id, content_type)
+        return iter((data[start:end + 1],)), tier
+    
+    def evict(self, file_id: str):
+        """Drop an image from the memory and disk tiers"""
+        self.memory.discard(file_id)
+        self.disk.discard(file_id)
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Hit counts, hit ratios and bytes served per tier plus tier occupancy"""
+        total = sum(self.metrics["hits"].values())
+        return {
+            "requests": total,
+            "hits": dict(self.metrics["hits"]),
+            "hit_ratio": {
+                tier: (self.metrics["hits"][tier] / total if total else 0.0) for tier in TIERS
+            },
+            "bytes_served": dict(self.metrics["bytes_served"]),
+            "memory_bytes": self.memory.current_bytes,
+            "memory_capacity": self.memory.max_bytes,
+            "disk_bytes": self.disk.current_bytes,
+            "disk_capacity": self.disk.max_bytes
+        }
@@ -3,9 +3,12 @@ Image Service
 Business logic for image management with MongoDB GridFS
 """
 
-import base64
+import time
+import asyncio
 import logging
-from typing import List, Optional, Tuple
+import tarfile
+import zipfile
+from typing import List, Optional, Tuple, AsyncIterator, Dict, Any
 from datetime import datetime
 
 # Import database functions
@@ -13,11 +16,18 @@ import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
 from backend.database import (
-    store_image, store_image_base64, get_image, get_image_metadata,
-    delete_image as db_delete_image, list_images as db_list_images
+    store_image, store_image_stream, store_image_base64, get_image, get_image_metadata,
+    open_image, iter_image_chunks, UploadTooLargeError, InvalidImageError, release_image, list_images as db_list_images,
+    get_image_stats as db_get_image_stats, set_image_ml_results
 )
 
-from ..models.image_models import ImageUploadResponse, ImageMetadataResponse
+from ..models.image_models import (
+    ImageUploadResponse, ImageMetadataResponse, BatchUploadItemResult, BatchUploadResponse,
+    ImageStatsResponse
+)
+from ..core.config import get_settings
+from .image_variant_service import ImageVariantService
+from .image_cache_service import ImageCacheService
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -27,6 +37,11 @@ class ImageService:
     
     def __init__(self):
         self.api_base_url = "http://localhost:5001"  # This should come from config
+        self.settings = get_settings()
+        self.variants = ImageVariantService()
+        self.cache = ImageCacheService()
+        self._stats: Optional[Tuple[float, ImageStatsResponse]] = None
+        self._stats_lock = asyncio.Lock()
     
     def _generate_image_url(self, file_id: str) -> str:
         """Generate image URL for given file ID"""
@@ -60,7 +75,12 @@ class ImageService:
                 "original_filename": filename
             }
             
-            file_id = await store_image(image_data, filename, content_type, metadata)
+            file_id = await store_image(
+                image_data, filename, content_type, metadata, max_size=self.settings.max_file_size
+            )
+            
+            # Thumbnails for product cards are served without a resize on first view
+            await self.variants.pregenerate(file_id, image_data, content_type)
             
             return ImageUploadResponse(
                 success=True,
@@ -75,6 +95,64 @@ class ImageService:
             logger.error(f"Error uploading image: {e}")
             raise
     
+    async def upload_image_stream(
+        self,
+        file,
+        filename: str,
+        content_type: str,
+        category: Optional[str] = None,
+        product_id: Optional[str] = None,
+        chunk_size: int = 255 * 1024
+    ) -> ImageUploadResponse:
+        """
+        Stream an uploaded file into GridFS one chunk at a time
+        
+        Args:
+            file: Async file-like object (e.g. FastAPI UploadFile)
+            filename: Original filename
+            content_type: MIME type claimed by the client
+            category: Product category
+            product_id: Associated product ID
+            chunk_size: Bytes read per step (GridFS default chunk size)
+            
+        Returns:
+            ImageUploadResponse with file details
+        """
+        async def read_chunks():
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        
+        try:
+            metadata = {
+                "category": category,
+                "product_id": product_id,
+                "original_filename": filename
+            }
+            
+            result = await store_image_stream(
+                read_chunks(), filename, content_type, metadata, max_size=self.settings.max_file_size
+            )
+            return self._stored_response(result, filename)
+        
+        except Exception as e:
+            logger.error(f"Error streaming image upload: {e}")
+            raise
+    
+    def _stored_response(self, result: Dict[str, Any], filename: str) -> ImageUploadResponse:
+        """Build an upload response from a store_image_stream result"""
+        return ImageUploadResponse(
+            success=True,
+            file_id=result["file_id"],
+            filename=filename,
+            content_type=result["content_type"],
+            size=result["length"],
+            image_url=self._generate_image_url(result["file_id"]),
+            deduplicated=result.get("deduplicated", False)
+        )
+    
     async def upload_image_base64(
         self,
         image_data: str,
@@ -83,7 +161,7 @@ class ImageService:
         product_id: Optional[str] = None
     ) -> ImageUploadResponse:
         """
-        Upload base64 encoded image
+        Upload base64 encoded image, decoding it piecewise into GridFS
         
         Args:
             image_data: Base64 encoded image
@@ -102,24 +180,186 @@ class ImageService:
                 "upload_method": "base64"
             }
             
-            file_id = await store_image_base64(image_data, filename, "image/jpeg", metadata)
+            # Reject before decoding anything if the decoded size must exceed the limit
+            if len(image_data) * 3 // 4 > self.settings.max_file_size + 3:
+                raise UploadTooLargeError(f"Upload exceeds {self.settings.max_file_size} bytes")
             
-            # Get stored file size
-            image_meta = await get_image_metadata(file_id)
-            
-            return ImageUploadResponse(
-                success=True,
-                file_id=file_id,
-                filename=filename,
-                content_type="image/jpeg",
-                size=image_meta["length"] if image_meta else 0,
-                image_url=self._generate_image_url(file_id)
+            result = await store_image_base64(
+                image_data, filename, "image/jpeg", metadata, max_size=self.settings.max_file_size
             )
+            return self._stored_response(result, filename)
         
         except Exception as e:
             logger.error(f"Error uploading base64 image: {e}")
             raise
     
+    def _batch_item_error(self, filename: str, error: Exception) -> BatchUploadItemResult:
+        logger.warning(f"Batch upload of {filename} failed: {error}")
+        return BatchUploadItemResult(filename=filename, success=False, error=str(error))
+    
+    def _batch_item_result(self, response: ImageUploadResponse) -> BatchUploadItemResult:
+        return BatchUploadItemResult(
+            filename=response.filename,
+            success=True,
+            file_id=response.file_id,
+            content_type=response.content_type,
+            size=response.size,
+            image_url=response.image_url,
+            deduplicated=response.deduplicated
+        )
+    
+    def _batch_response(self, results: List[BatchUploadItemResult], start_time: float) -> BatchUploadResponse:
+        succeeded = sum(1 for result in results if result.success)
+        return BatchUploadResponse(
+            success=succeeded == len(results),
+            total=len(results),
+            succeeded=succeeded,
+            failed=len(results) - succeeded,
+            results=results,
+            processing_time=f"{time.perf_counter() - start_time:.2f}s"
+        )
+    
+    async def upload_images_batch(
+        self,
+        files: list,
+        category: Optional[str] = None,
+        product_id: Optional[str] = None,
+        run_ml: bool = False
+    ) -> BatchUploadResponse:
+        """
+        Upload many files concurrently with bounded parallelism
+        
+        Args:
+            files: Async file-like objects with ``filename`` and ``content_type``
+            category: Product category applied to every file
+            product_id: Associated product ID applied to every file
+            run_ml: Whether to run ML predictions / embedding per file
+            
+        Returns:
+            BatchUploadResponse with one result per file, in input order
+        """
+        start_time = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.settings.batch_upload_concurrency)
+        
+        async def upload_one(file) -> BatchUploadItemResult:
+            async with semaphore:
+                try:
+                    response = await self.upload_image_stream(
+                        file, file.filename, file.content_type, category=category, product_id=product_id
+                    )
+                    await self.process_uploaded_image(response.file_id, response.content_type, run_ml)
+                    return self._batch_item_result(response)
+                except Exception as e:
+                    return self._batch_item_error(file.filename, e)
+        
+        results = await asyncio.gather(*(upload_one(file) for file in files))
+        return self._batch_response(list(results), start_time)
+    
+    def _archive_members(self, archive_file, filename: str):
+        """Yield (name, open member) for each regular file in a zip or tar archive"""
+        if zipfile.is_zipfile(archive_file):
+            archive_file.seek(0)
+            with zipfile.ZipFile(archive_file) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        yield info.filename, info.file_size, lambda info=info: archive.read(info)
+            return
+        
+        archive_file.seek(0)
+        try:
+            archive = tarfile.open(fileobj=archive_file, mode="r:*")
+        except tarfile.TarError:
+            raise ValueError(f"{filename} is not a zip or tar archive")
+        with archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, member.size, lambda member=member: archive.extractfile(member).read()
+    
+    async def upload_archive(
+        self,
+        archive_file,
+        filename: str,
+        category: Optional[str] = None,
+        product_id: Optional[str] = None,
+        run_ml: bool = False
+    ) -> BatchUploadResponse:
+        """
+        Upload every image inside a zip or tar archive
+        
+        Members are read one at a time (archives are not safe for concurrent
+        reads), but a member is only read once a worker slot is free, so at most
+        ``batch_upload_concurrency`` images are held in memory at once.
+        
+        Args:
+            archive_file: Seekable binary file object holding the archive
+            filename: Archive filename (for error messages)
+            category: Product category applied to every image
+            product_id: Associated product ID applied to every image
+            run_ml: Whether to run ML predictions / embedding per image
+            
+        Returns:
+            BatchUploadResponse with one result per archive member
+        """
+        start_time = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.settings.batch_upload_concurrency)
+        tasks = []
+        
+        async def upload_member(name: str, data: bytes) -> BatchUploadItemResult:
+            try:
+                metadata = {
+                    "category": category,
+                    "product_id": product_id,
+                    "original_filename": name,
+                    "upload_method": "archive"
+                }
+                result = await store_image_stream(
+                    self._as_chunks(data), name, "application/octet-stream", metadata,
+                    max_size=self.settings.max_file_size
+                )
+                response = self._stored_response(result, name)
+                await self.process_uploaded_image(response.file_id, response.content_type, run_ml, image_data=data)
+                return self._batch_item_result(response)
+            except Exception as e:
+                return self._batch_item_error(name, e)
+            finally:
+                semaphore.release()
+        
+        members = self._archive_members(archive_file, filename)
+        results = []
+        while True:
+            await semaphore.acquire()
+            member = await loop.run_in_executor(None, next, members, None)
+            if member is None:
+                semaphore.release()
+                break
+            
+            name, size, read = member
+            error = None
+            if len(results) >= self.settings.batch_upload_max_files:
+                error = ValueError(f"Skipped: batch limit of {self.settings.batch_upload_max_files} files reached")
+            elif size > self.settings.max_file_size:
+                error = UploadTooLargeError(f"Upload exceeds {self.settings.max_file_size} bytes")
+            if error is not None:
+                semaphore.release()
+                results.append(self._batch_item_error(name, error))
+                continue
+            
+            try:
+                data = await loop.run_in_executor(None, read)
+            except Exception as e:
+                semaphore.release()
+                results.append(self._batch_item_error(name, e))
+                continue
+            results.append(asyncio.ensure_future(upload_member(name, data)))
+        
+        results = [await result if isinstance(result, asyncio.Future) else result for result in results]
+        return self._batch_response(results, start_time)
+    
+    @staticmethod
+    async def _as_chunks(data: bytes):
+        yield data
+    
     async def get_image_file(self, file_id: str) -> Tuple[bytes, str]:
         """
         Get image file data and content type
@@ -145,6 +385,46 @@ class ImageService:
             logger.error(f"Error retrieving image {file_id}: {e}")
             raise
     
+    async def get_image_file_metadata(self, file_id: str) -> Dict[str, Any]:
+        """
+        Get raw GridFS file metadata (no chunk reads)
+        
+        Args:
+            file_id: GridFS file ID
+            
+        Returns:
+            Dict with filename, content_type, upload_date, length and stored metadata
+        """
+        metadata = await get_image_metadata(file_id)
+        if not metadata:
+            raise FileNotFoundError(f"Image {file_id} not found")
+        return metadata
+    
+    async def get_image_stream(self, file_id: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """
+        Open an image for streaming without buffering it
+        
+        Args:
+            file_id: GridFS file ID
+            start: First byte offset to send
+            end: Last byte offset to send (inclusive), None for end of file
+            
+        Returns:
+            Async iterator over the file's chunks
+        """
+        try:
+            grid_out = await open_image(file_id)
+            if grid_out is None:
+                raise FileNotFoundError(f"Image {file_id} not found")
+            
+            return iter_image_chunks(grid_out, start, end)
+        
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            logger.error(f"Error opening image stream {file_id}: {e}")
+            raise
+    
     async def get_image_metadata(self, file_id: str) -> ImageMetadataResponse:
         """
         Get image metadata
@@ -176,7 +456,7 @@ class ImageService:
     
     async def delete_image(self, file_id: str) -> bool:
         """
-        Delete image from GridFS
+        Delete image from GridFS (decrements the reference count of shared files)
         
         Args:
             file_id: GridFS file ID
@@ -185,7 +465,14 @@ class ImageService:
             bool: True if successful
         """
         try:
-            return await db_delete_image(file_id)
+            # Shared (deduplicated) files only go away with their last reference
+            remaining = await release_image(file_id)
+            if remaining is None:
+                return False
+            if remaining == 0:
+                await self.variants.delete_variants(file_id)
+                self.cache.evict(file_id)
+            return True
         
         except Exception as e:
             logger.error(f"Error deleting image {file_id}: {e}")
@@ -195,7 +482,8 @@ class ImageService:
         self, 
         limit: int = 50, 
         skip: int = 0, 
-        category: Optional[str] = None
+        category: Optional[str] = None,
+        product_id: Optional[str] = None
     ) -> List[ImageMetadataResponse]:
         """
         List images with optional filtering
@@ -204,16 +492,14 @@ class ImageService:
             limit: Maximum number of images
             skip: Number of images to skip
             category: Filter by category
+            product_id: Filter by associated product ID
             
         Returns:
             List of ImageMetadataResponse
         """
         try:
-            images = await db_list_images(limit, skip)
-            
-            # Filter by category if specified
-            if category:
-                images = [img for img in images if img.get("category") == category]
+            # Filters are applied by the fs.files indexes, not after fetching
+            images = await db_list_images(limit, skip, category, product_id)
             
             return [
                 ImageMetadataResponse(
@@ -232,6 +518,55 @@ class ImageService:
             logger.error(f"Error listing images: {e}")
             raise
     
+    async def get_image_stats(self) -> ImageStatsResponse:
+        """
+        Get image counts and storage per category
+        
+        The aggregation result is reused for image_stats_cache_ttl seconds so
+        dashboards polling this endpoint do not rescan fs.files each time.
+        
+        Returns:
+            ImageStatsResponse with per-category and overall totals
+        """
+        async with self._stats_lock:
+            now = time.monotonic()
+            if self._stats and now - self._stats[0] < self.settings.image_stats_cache_ttl:
+                return self._stats[1]
+            
+            stats = ImageStatsResponse(
+                **await db_get_image_stats(),
+                generated_at=datetime.utcnow().isoformat()
+            )
+            self._stats = (now, stats)
+            return stats
+    
+    async def process_uploaded_image(
+        self,
+        file_id: str,
+        content_type: str,
+        run_ml: bool = True,
+        image_data: Optional[bytes] = None
+    ):
+        """
+        Follow-up for stored uploads: variants and ML processing
+        
+        Args:
+            file_id: GridFS file ID
+            content_type: Stored content type
+            run_ml: Whether to run ML predictions / embedding
+            image_data: Image bytes if still in memory, otherwise read from GridFS
+        """
+        try:
+            if image_data is None:
+                image_data = await get_image(file_id)
+            if image_data is None:
+                return
+            await self.variants.pregenerate(file_id, image_data, content_type)
+            if run_ml:
+                await self.process_image_ml(file_id, image_data)
+        except Exception as e:
+            logger.error(f"Post-upload processing failed for {file_id}: {e}")
+    
     async def process_image_ml(self, file_id: str, image_data: bytes):
         """
         Background task to process uploaded image with ML
@@ -242,22 +577,27 @@ class ImageService:
         """
         try:
             # Import ML service to avoid circular imports
-            from .ml_service import MLService
+            from .ml_service import get_ml_service
             
-            ml_service = MLService()
+            ml_service = get_ml_service()
             if not ml_service.is_available():
                 logger.info(f"ML service not available for processing image {file_id}")
                 return
             
-            # Convert image to base64 for ML processing
-            image_b64 = base64.b64encode(image_data).decode('utf-8')
-            image_data_url = f"data:image/jpeg;base64,{image_b64}"
-            
-            # Get ML predictions
-            prediction_response = await ml_service.predict_image(image_data_url, True)
+            # The stored bytes go to the model as they are
+            prediction_response = await ml_service.predict_image(image_data, True)
             
-            logger.info(f"ML processing completed for image {file_id}")
-            # Note: In a real implementation, you'd update the GridFS metadata with ML results
+            # Keep the results with the image so they are not recomputed per request
+            saved = await set_image_ml_results(file_id, {
+                **prediction_response.dict(
+                    include={"detected_items", "colors", "overall_confidence", "model_version"}
+                ),
+                "processed_at": datetime.utcnow()
+            })
+            if saved:
+                logger.info(f"ML processing completed for image {file_id}")
+            else:
+                logger.warning(f"⚠️ ML results for image {file_id} were not saved")
             
         except Exception as e:
             logger.error(f"Background ML processing failed for {file_id}: {e}")
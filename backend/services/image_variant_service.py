@@ -0,0 +1,250 @@
+"""
+Image Variant Service
+Resized and re-encoded derivatives of GridFS images, produced once and cached
+"""
+
+import io
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from PIL import Image, features
+
+# Import database functions
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+from backend.database import get_database_connection, get_image
+
+from ..core.config import get_settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+FORMAT_CONTENT_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+}
+
+class BytesLRU:
+    """Byte-bounded in-memory LRU of encoded images"""
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._items: "OrderedDict[str, Tuple[bytes, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+    
+    def put(self, key: str, data: bytes, content_type: str):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self.current_bytes -= len(self._items.pop(key)[0])
+            self._items[key] = (data, content_type)
+            self.current_bytes += len(data)
+            while self.current_bytes > self.max_bytes:
+                _, (evicted, _) = self._items.popitem(last=False)
+                self.current_bytes -= len(evicted)
+    
+    def discard(self, key: str):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is not None:
+                self.current_bytes -= len(item[0])
+    
+    def discard_prefix(self, prefix: str):
+        with self._lock:
+            for key in [key for key in self._items if key.startswith(prefix)]:
+                self.current_bytes -= len(self._items.pop(key)[0])
+
+class ImageVariantService:
+    """Service for resizing images on demand with a two-level variant cache"""
+    
+    def __init__(self):
+        self.settings = get_settings()
+        self.cache = BytesLRU(self.settings.image_variant_cache_bytes)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}
+        self._index_ready = False
+        self.supported_formats = ["jpeg", "png"]
+        if features.check("webp"):
+            self.supported_formats.append("webp")
+        if "AVIF" in Image.SAVE:
+            self.supported_formats.append("avif")
+    
+    @staticmethod
+    def variant_key(file_id: str, width: Optional[int], height: Optional[int], fmt: str) -> str:
+        """Cache key identifying one derived image"""
+        return f"{file_id}:{width or 0}x{height or 0}.{fmt}"
+    
+    def negotiate_format(self, accept: Optional[str], requested: Optional[str], source_type: str) -> str:
+        """
+        Pick an output format
+        
+        Args:
+            accept: Request Accept header
+            requested: Explicit ``fmt`` query parameter, if any
+            source_type: Content type of the stored original
+        
+        Returns:
+            Format name from FORMAT_CONTENT_TYPES
+        """
+        if requested:
+            requested = requested.lower().replace("jpg", "jpeg")
+            if requested not in self.supported_formats:
+                raise ValueError(f"Unsupported format: {requested}")
+            return requested
+        
+        accept = (accept or "").lower()
+        for fmt in ("avif", "webp"):
+            if fmt in self.supported_formats and FORMAT_CONTENT_TYPES[fmt] in accept:
+                return fmt
+        return "png" if source_type == "image/png" else "jpeg"
+    
+    def clamp_size(self, width: Optional[int], height: Optional[int]) -> Tuple[Optional[int], Optional[int]]:
+        """Bound requested dimensions to the configured maximum"""
+        limit = self.settings.image_variant_max_dimension
+        if width is not None:
+            width = max(1, min(width, limit))
+        if height is not None:
+            height = max(1, min(height, limit))
+        return width, height
+    
+    def _render(self, source: bytes, width: Optional[int], height: Optional[int], fmt: str) -> bytes:
+        """Decode, downscale and encode one variant (CPU bound)"""
+        image = Image.open(io.BytesIO(source))
+        target = (width or image.width, height or image.height)
+        
+        # Let the JPEG decoder skip most of the work for large downscales
+        if image.format == "JPEG":
+            image.draft("RGB", target)
+        
+        if fmt == "jpeg" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA")
+        
+        # reducing_gap does a cheap integer reduce before the final filter pass
+        image.thumbnail(target, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        
+        output = io.BytesIO()
+        save_kwargs = {"optimize": True} if fmt in ("jpeg", "png") else {}
+        if fmt in ("jpeg", "webp", "avif"):
+            save_kwargs["quality"] = self.settings.image_variant_quality
+        image.save(output, format=fmt.upper(), **save_kwargs)
+        return output.getvalue()
+    
+    def _find_stored(self, key: str) -> Optional[bytes]:
+        db = get_database_connection()
+        files = db.get_collection("fs.files")
+        if not self._index_ready:
+            files.create_index("metadata.variant_key", sparse=True)
+            self._index_ready = True
+        file_doc = files.find_one({"metadata.variant_key": key}, {"_id": 1})
+        return db.get_image(str(file_doc["_id"])) if file_doc else None
+    
+    def _store(self, key: str, file_id: str, data: bytes, fmt: str):
+        # Each variant owns its file: presets can render byte-identical outputs for small
+        # sources, and sharing one by content hash would leave the others unfindable by key
+        get_database_connection().save_image(
+            data,
+            filename=key,
+            metadata={
+                "variant_of": file_id,
+                "variant_key": key,
+                "content_type": FORMAT_CONTENT_TYPES[fmt]
+            },
+            deduplicate=False
+        )
+    
+    async def get_variant(
+        self,
+        file_id: str,
+        width: Optional[int],
+        height: Optional[int],
+        fmt: str,
+        source: Optional[bytes] = None
+    ) -> Tuple[bytes, str]:
+        """
+        Get a resized variant, producing and caching it on first request
+        
+        Args:
+            file_id: GridFS file ID of the original
+            width: Target max width (None keeps aspect from height)
+            height: Target max height (None keeps aspect from width)
+            fmt: Output format
+            source: Original bytes if already in memory
+        
+        Returns:
+            Tuple of (variant bytes, content type)
+        """
+        key = self.variant_key(file_id, width, height, fmt)
+        content_type = FORMAT_CONTENT_TYPES[fmt]
+        
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        
+        # One producer per variant; concurrent requests wait for its result
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._lock_users[key] = self._lock_users.get(key, 0) + 1
+        try:
+            async with lock:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return cached
+                
+                loop = asyncio.get_running_loop()
+                data = await loop.run_in_executor(None, self._find_stored, key)
+                if data is None:
+                    if source is None:
+                        source = await get_image(file_id)
+                        if source is None:
+                            raise FileNotFoundError(f"Image {file_id} not found")
+                    data = await loop.run_in_executor(None, self._render, source, width, height, fmt)
+                    await loop.run_in_executor(None, self._store, key, file_id, data, fmt)
+                
+                self.cache.put(key, data, content_type)
+        finally:
+            # Drop the lock only once nobody is waiting on it, otherwise a later request
+            # would get a fresh lock and render alongside a waiter (also on failures)
+            self._lock_users[key] -= 1
+            if not self._lock_users[key]:
+                del self._lock_users[key]
+                del self._locks[key]
+        return data, content_type
+    
+    async def pregenerate(self, file_id: str, source: bytes, source_type: str = "image/jpeg"):
+        """Produce the configured preset sizes for a newly uploaded image"""
+        formats = ["webp"] if "webp" in self.supported_formats else []
+        formats.append("png" if source_type == "image/png" else "jpeg")
+        
+        for size in self.settings.image_variant_presets:
+            for fmt in formats:
+                try:
+                    await self.get_variant(file_id, size, size, fmt, source=source)
+                except Exception as e:
+                    logger.warning(f"Could not pre-generate {size}px {fmt} variant for {file_id}: {e}")
+    
+    async def delete_variants(self, file_id: str):
+        """Remove all stored and cached variants of an original"""
+        self.cache.discard_prefix(f"{file_id}:")
+        db = get_database_connection()
+        loop = asyncio.get_running_loop()
+        variant_docs = await loop.run_in_executor(
+            None,
+            lambda: list(db.get_collection("fs.files").find({"metadata.variant_of": file_id}, {"_id": 1}))
+        )
+        for doc in variant_docs:
+            await loop.run_in_executor(None, db.delete_image, str(doc["_id"]))
@@ -4,53 +4,81 @@ Business logic for ML predictions and AI features
 """
 
 import base64
+import asyncio
 import logging
-from typing import Dict, Any, List, Optional
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Union
 from datetime import datetime
+from PIL import Image
 
+from ..core.config import get_settings
 from ..models.ml_models import MLPredictionResponse, DetectedItem, ColorInfo
+from ..utils.image_context import ImageContext
+from ..utils.color_analysis import dominant_colors
+from .model_pool import FashionModelPool
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Decode size shared by the classifier input and colour analysis
+MODEL_INPUT_SIZE = 224
+# Number of per-image colour results kept in memory, keyed by content hash
+COLOR_CACHE_SIZE = 2048
+# At most this many items are reported per image, runners-up only above this probability
+MAX_DETECTED_ITEMS = 3
+MIN_ITEM_CONFIDENCE = 0.10
+
+# MANVUE specific category mapping; the keys are the labels the model pool predicts
+MANVUE_CATEGORY_MAP = {
+    'T-Shirt': {'category': 'tops', 'type': 'tops', 'confidence_boost': 0.15},
+    'Shirt': {'category': 'tops', 'type': 'tops', 'confidence_boost': 0.18},
+    'Pullover': {'category': 'tops', 'type': 'tops', 'confidence_boost': 0.12},
+    'Coat': {'category': 'outerwear', 'type': 'outerwear', 'confidence_boost': 0.20},
+    'Trouser': {'category': 'bottoms', 'type': 'bottoms', 'confidence_boost': 0.16},
+    'Sneaker': {'category': 'shoes', 'type': 'shoes', 'confidence_boost': 0.18},
+    'Ankle Boot': {'category': 'shoes', 'type': 'shoes', 'confidence_boost': 0.17},
+    'Sandal': {'category': 'shoes', 'type': 'shoes', 'confidence_boost': 0.15},
+    'Bag': {'category': 'accessories', 'type': 'accessories', 'confidence_boost': 0.12},
+}
+
 class MLService:
     """Service for handling ML operations"""
     
     def __init__(self):
-        self.ml_available = False
+        self.settings = get_settings()
         self.model_version = "2.0.0"
+        self._color_cache: "OrderedDict[str, List[ColorInfo]]" = OrderedDict()
+        self._color_cache_lock = threading.Lock()
         
-        # Try to import ML functionality
-        try:
-            # Import the ML server functionality
-            import sys
-            import os
-            sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
-            
-            # Try to import from the backend ML module
-            from backend.ml_model import get_image_embedding, get_text_embedding, compute_similarity, is_model_loaded
-            self.ml_available = True
-            logger.info("✅ ML service initialized successfully")
-        except ImportError as e:
-            logger.warning(f"⚠️ ML service not available: {e}")
-            self.ml_available = False
+        # Loads in the background; predictions wait for it (up to ml_predict_timeout)
+        self.model_pool = FashionModelPool(
+            list(MANVUE_CATEGORY_MAP),
+            backend=self.settings.ml_classifier_backend,
+            models_dir=self.settings.ml_models_dir,
+            max_batch_size=self.settings.classify_max_batch_size,
+            max_wait_ms=self.settings.classify_batch_wait_ms
+        )
+        self.model_pool.start()
     
     def is_available(self) -> bool:
-        """Check if ML service is available"""
-        return self.ml_available
+        """Check if ML service is available (a model is loaded or still loading)"""
+        return self.model_pool.is_available()
     
     def get_status(self) -> Dict[str, Any]:
         """Get ML service status"""
         try:
+            loaded = self.model_pool.handle.ready
             return {
-                "available": self.ml_available,
+                "available": self.is_available(),
                 "models_loaded": {
-                    "clip": self.ml_available,
-                    "fashion_classifier": self.ml_available
+                    "clip": loaded and self.model_pool.backend == "clip",
+                    "fashion_classifier": loaded and self.model_pool.backend == "fashion_classifier"
                 },
                 "version": self.model_version,
-                "device": "cpu",  # This should be detected dynamically
-                "memory_usage": None
+                "device": "cpu",
+                "memory_usage": None,
+                "model_pool": self.model_pool.status()
             }
         except Exception as e:
             logger.error(f"Error getting ML status: {e}")
@@ -62,32 +90,39 @@ class MLService:
                 "memory_usage": None
             }
     
-    async def predict_image(self, image_data: str, include_colors: bool = True) -> MLPredictionResponse:
+    async def predict_image(self, image_data: Union[str, bytes], include_colors: bool = True) -> MLPredictionResponse:
         """
         Predict fashion items from image
         
         Args:
-            image_data: Base64 encoded image data
+            image_data: Raw image bytes or base64 encoded image data
             include_colors: Whether to include color analysis
             
         Returns:
             MLPredictionResponse with predictions
         """
         try:
-            if not self.ml_available:
-                # Return mock predictions for demo
-                return self._get_mock_predictions(include_colors)
+            if not self.is_available():
+                # Return mock predictions for demo; colours do not need a model
+                response = self._get_mock_predictions(include_colors=False)
+                if include_colors:
+                    response.colors = await self.extract_colors(image_data)
+                return response
             
             start_time = datetime.now()
             
+            # One decode shared by prediction and colour extraction
+            context = ImageContext.from_data(image_data, min_size=MODEL_INPUT_SIZE)
+            await asyncio.get_running_loop().run_in_executor(None, lambda: context.image)
+            
             # Process image with ML model
             # This would integrate with your actual ML pipeline
-            predictions = await self._process_image_ml(image_data)
+            predictions = await self._process_image_ml(context)
             
             # Extract colors if requested
             colors = []
             if include_colors:
-                colors = await self.extract_colors(image_data)
+                colors = await self.extract_colors(context)
             
             processing_time = f"{(datetime.now() - start_time).total_seconds():.2f}s"
             
@@ -104,53 +139,32 @@ class MLService:
             logger.error(f"Error predicting image: {e}")
             raise
     
-    async def _process_image_ml(self, image_data: str) -> List[DetectedItem]:
+    async def _process_image_ml(self, image_data: Union[str, bytes, ImageContext]) -> List[DetectedItem]:
         """
         Process image with ML model
         
         Args:
-            image_data: Base64 encoded image data
+            image_data: Image context, raw image bytes or base64 encoded image data
             
         Returns:
             List of DetectedItem
         """
         try:
-            # Mock ML processing - replace with actual ML model
-            # This is where you'd integrate with your fashion classification model
-            
-            # MANVUE specific category mapping
-            MANVUE_CATEGORY_MAP = {
-                'T-Shirt': {'category': 'tops', 'type': 'tops', 'confidence_boost': 0.15},
-                'Shirt': {'category': 'tops', 'type': 'tops', 'confidence_boost': 0.18},
-                'Pullover': {'category': 'tops', 'type': 'tops', 'confidence_boost': 0.12},
-                'Coat': {'category': 'outerwear', 'type': 'outerwear', 'confidence_boost': 0.20},
-                'Trouser': {'category': 'bottoms', 'type': 'bottoms', 'confidence_boost': 0.16},
-                'Sneaker': {'category': 'shoes', 'type': 'shoes', 'confidence_boost': 0.18},
-                'Ankle Boot': {'category': 'shoes', 'type': 'shoes', 'confidence_boost': 0.17},
-                'Sandal': {'category': 'shoes', 'type': 'shoes', 'confidence_boost': 0.15},
-                'Bag': {'category': 'accessories', 'type': 'accessories', 'confidence_boost': 0.12},
-            }
-            
-            # Mock predictions - in reality, this would use your trained model
-            mock_predictions = [
-                {
-                    'name': 'T-Shirt',
-                    'confidence': 85,
-                    'category_info': MANVUE_CATEGORY_MAP['T-Shirt']
-                },
-                {
-                    'name': 'Shirt', 
-                    'confidence': 72,
-                    'category_info': MANVUE_CATEGORY_MAP['Shirt']
-                }
-            ]
+            context = ImageContext.from_data(image_data, min_size=MODEL_INPUT_SIZE)
+            probabilities = await self.model_pool.predict(context, timeout=self.settings.ml_predict_timeout)
+            if probabilities is None:
+                raise RuntimeError("No classification model available")
             
+            ranked = sorted(probabilities.items(), key=lambda item: item[1], reverse=True)
             detected_items = []
-            for pred in mock_predictions:
-                category_info = pred['category_info']
+            for rank, (name, probability) in enumerate(ranked[:MAX_DETECTED_ITEMS]):
+                # The top prediction is always reported; runners-up only when plausible
+                if rank and probability < MIN_ITEM_CONFIDENCE:
+                    break
+                category_info = MANVUE_CATEGORY_MAP[name]
                 detected_items.append(DetectedItem(
-                    name=pred['name'],
-                    confidence=pred['confidence'],
+                    name=name,
+                    confidence=int(round(probability * 100)),
                     category=category_info['category'],
                     type=category_info['type'],
                     confidence_boost=category_info['confidence_boost']
@@ -162,36 +176,141 @@ class MLService:
             logger.error(f"Error processing image with ML: {e}")
             raise
     
-    async def extract_colors(self, image_data: str) -> List[ColorInfo]:
+    async def extract_colors(
+        self,
+        image_data: Union[str, bytes, ImageContext],
+        n_colors: int = 5
+    ) -> List[ColorInfo]:
         """
         Extract colors from image
         
         Args:
-            image_data: Base64 encoded image data
+            image_data: Image context (reusing its decoded image), raw image bytes or base64 encoded image data
+            n_colors: Maximum number of colors returned
             
         Returns:
-            List of ColorInfo
+            List of ColorInfo, most dominant first
         """
         try:
-            # Mock color extraction - replace with actual image processing
-            mock_colors = [
-                ColorInfo(hex="#ffffff", name="White", dominance=0.65),
-                ColorInfo(hex="#000000", name="Black", dominance=0.20),
-                ColorInfo(hex="#808080", name="Gray", dominance=0.15)
-            ]
+            context = ImageContext.from_data(image_data, min_size=MODEL_INPUT_SIZE)
+            
+            # The content hash is checked before the image is decoded
+            cached = self._get_cached_colors(context.content_hash)
+            if cached is not None:
+                return cached
             
-            return mock_colors
+            loop = asyncio.get_running_loop()
+            colors = await loop.run_in_executor(None, lambda: self._compute_colors(context.image, n_colors))
+            self._cache_colors(context.content_hash, colors)
+            return colors
         
         except Exception as e:
             logger.error(f"Error extracting colors: {e}")
             raise
     
-    async def categorize_image(self, image_data: str) -> Dict[str, Any]:
+    @staticmethod
+    def _compute_colors(image: Image.Image, n_colors: int = 5) -> List[ColorInfo]:
+        """Dominant colours of a decoded image as ColorInfo (CPU bound)"""
+        return [
+            ColorInfo(hex=color["hex"], name=color["name"], dominance=round(color["percentage"] / 100, 4))
+            for color in dominant_colors(image, n_colors=n_colors)
+        ]
+    
+    def _get_cached_colors(self, content_hash: str) -> Optional[List[ColorInfo]]:
+        with self._color_cache_lock:
+            colors = self._color_cache.get(content_hash)
+            if colors is not None:
+                self._color_cache.move_to_end(content_hash)
+            return colors
+    
+    def _cache_colors(self, content_hash: str, colors: List[ColorInfo]):
+        with self._color_cache_lock:
+            self._color_cache[content_hash] = colors
+            self._color_cache.move_to_end(content_hash)
+            while len(self._color_cache) > COLOR_CACHE_SIZE:
+                self._color_cache.popitem(last=False)
+    
+    def precompute_product_colors(self, batch_size: int = 100, force: bool = False) -> Dict[str, Any]:
+        """
+        Batch job storing dominant colours on every product with an image
+        
+        Products are read in batches, each product's first GridFS image is
+        analysed (reusing the content-hash cache, so shared images are decoded
+        once) and results are written back with one bulk write per batch.
+        
+        Args:
+            batch_size: Products per read/write batch
+            force: Recompute products that already have colours
+            
+        Returns:
+            Dict with products processed, updated and failed, and elapsed time
+        """
+        from pymongo import UpdateOne
+        from bson import ObjectId
+        from backend.database import get_database_connection
+        
+        db = get_database_connection()
+        products = db.get_collection('products')
+        files = db.get_collection('fs.files')
+        
+        query: Dict[str, Any] = {"image_ids.0": {"$exists": True}}
+        if not force:
+            query["colors"] = {"$exists": False}
+        
+        start = datetime.now()
+        stats = {"processed": 0, "updated": 0, "failed": 0}
+        last_id = None
+        
+        while True:
+            # Keyset pagination stays stable while documents are being updated
+            page_query = dict(query)
+            if last_id is not None:
+                page_query["_id"] = {"$gt": last_id}
+            batch = list(products.find(page_query, {"image_ids": 1}).sort("_id", 1).limit(batch_size))
+            if not batch:
+                break
+            last_id = batch[-1]["_id"]
+            
+            updates = []
+            for product in batch:
+                stats["processed"] += 1
+                try:
+                    file_id = product["image_ids"][0]
+                    file_doc = files.find_one({"_id": ObjectId(file_id)}, {"sha256": 1}) or {}
+                    content_hash = file_doc.get("sha256")
+                    
+                    colors = self._get_cached_colors(content_hash) if content_hash else None
+                    if colors is None:
+                        context = ImageContext(db.get_image(file_id), min_size=MODEL_INPUT_SIZE)
+                        colors = self._compute_colors(context.image)
+                        if content_hash:
+                            self._cache_colors(content_hash, colors)
+                    
+                    updates.append(UpdateOne(
+                        {"_id": product["_id"]},
+                        {"$set": {
+                            "colors": [color.dict() for color in colors],
+                            "colors_updated_at": datetime.now()
+                        }}
+                    ))
+                except Exception as e:
+                    stats["failed"] += 1
+                    logger.warning(f"⚠️ Could not compute colors for product {product['_id']}: {e}")
+            
+            if updates:
+                result = products.bulk_write(updates, ordered=False)
+                stats["updated"] += result.modified_count
+        
+        stats["processing_time"] = f"{(datetime.now() - start).total_seconds():.2f}s"
+        logger.info(f"✅ Product colors precomputed: {stats}")
+        return stats
+    
+    async def categorize_image(self, image_data: Union[str, bytes]) -> Dict[str, Any]:
         """
         Categorize fashion item from image
         
         Args:
-            image_data: Base64 encoded image data
+            image_data: Raw image bytes or base64 encoded image data
             
         Returns:
             Category information
@@ -231,7 +350,7 @@ class MLService:
             Similarity score (0.0 to 1.0)
         """
         try:
-            if not self.ml_available:
+            if not self.is_available():
                 # Return mock similarity for demo
                 return 0.75
             
@@ -275,21 +394,10 @@ class MLService:
         Returns:
             MLPredictionResponse with mock data
         """
+        # Labels the real model can return, so clients see the same vocabulary either way
         mock_items = [
-            DetectedItem(
-                name="T-Shirt",
-                confidence=85,
-                category="tops",
-                type="tops",
-                confidence_boost=0.15
-            ),
-            DetectedItem(
-                name="Jeans",
-                confidence=72,
-                category="bottoms", 
-                type="bottoms",
-                confidence_boost=0.16
-            )
+            DetectedItem(name=name, confidence=confidence, **MANVUE_CATEGORY_MAP[name])
+            for name, confidence in (("T-Shirt", 85), ("Trouser", 72))
         ]
         
         mock_colors = []
@@ -307,3 +415,16 @@ class MLService:
             processing_time="0.25s",
             model_version=self.model_version
         )
+
+# Global ML service instance
+_ml_service_instance = None
+_ml_service_lock = threading.Lock()
+
+def get_ml_service() -> MLService:
+    """Get the process-wide ML service; its model pool is shared by every caller"""
+    global _ml_service_instance
+    if _ml_service_instance is None:
+        with _ml_service_lock:
+            if _ml_service_instance is None:
+                _ml_service_instance = MLService()
+    return _ml_service_instance
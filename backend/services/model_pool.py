@@ -0,0 +1,190 @@
+"""
+Shared Model Pool
+One process-wide fashion classifier behind a background load and a request batcher
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+import numpy as np
+from PIL import Image
+
+from ..core.config import get_settings
+from ..utils.batching import DynamicBatcher
+from ..utils.image_context import ImageContext
+from ..utils.model_loader import LazyModel, ModelLoader
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("auto", "fashion_classifier", "clip")
+
+# Trained classifier class names -> MANVUE labels. Classes with no MANVUE category ("Dress")
+# are dropped and the remaining probabilities renormalised
+FASHION_CLASS_TO_MANVUE = {
+    "T-shirt/top": "T-Shirt",
+    "Trouser": "Trouser",
+    "Pullover": "Pullover",
+    "Coat": "Coat",
+    "Sandal": "Sandal",
+    "Shirt": "Shirt",
+    "Sneaker": "Sneaker",
+    "Bag": "Bag",
+    "Ankle boot": "Ankle Boot",
+}
+
+def to_manvue_probabilities(probabilities: Dict[str, float]) -> Dict[str, float]:
+    """Trained classifier probabilities over MANVUE labels, renormalised to sum to 1"""
+    mapped = {
+        FASHION_CLASS_TO_MANVUE[class_name]: probability
+        for class_name, probability in probabilities.items()
+        if class_name in FASHION_CLASS_TO_MANVUE
+    }
+    total = sum(mapped.values())
+    return {label: probability / total for label, probability in mapped.items()} if total > 0 else mapped
+
+class FashionModelPool:
+    """
+    Loads one classification backend in the background and serves batched predictions
+    
+    ``fashion_classifier`` runs the trained classifier from the models directory
+    (whichever runtime ModelLoader resolves); ``clip`` scores images against
+    precomputed CLIP text embeddings of the labels. ``auto`` prefers the trained
+    classifier and falls back to CLIP when no model file is present. Either way
+    an image costs one encoder pass, shared with concurrent requests.
+    """
+    
+    def __init__(
+        self,
+        labels: List[str],
+        backend: str = "auto",
+        models_dir: str = "../models",
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0
+    ):
+        """
+        Args:
+            labels: MANVUE labels predictions are reported in
+            backend: "fashion_classifier", "clip" or "auto"
+            models_dir: Where ModelLoader looks for the trained classifier
+            max_batch_size: Largest batch of concurrent requests per forward pass
+            max_wait_ms: How long a request waits for others to join its batch
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unsupported classifier backend: {backend}")
+        
+        self.settings = get_settings()
+        self.labels = list(labels)
+        self.requested_backend = backend
+        self.backend: Optional[str] = None
+        self.models_dir = models_dir
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.handle = LazyModel("ml_classifier", self._load, self._warmup)
+        self._loader: Optional[ModelLoader] = None
+        self._batcher: Optional[DynamicBatcher] = None
+        self._batcher_lock = threading.Lock()
+    
+    def start(self):
+        """Begin loading the backend in the background (no-op once started)"""
+        self.handle.start()
+    
+    def _load(self) -> Optional[Any]:
+        if self.requested_backend in ("auto", "fashion_classifier"):
+            self._loader = ModelLoader(
+                models_dir=self.models_dir,
+                warmup_batch_sizes=(1, self.max_batch_size),
+                classifier_runtime=self.settings.classifier_runtime,
+                num_threads=self.settings.classifier_num_threads
+            )
+            classifier = self._loader.load_fashion_classifier()
+            if classifier is not None:
+                self.backend = "fashion_classifier"
+                return classifier
+            if self.requested_backend == "fashion_classifier":
+                return None
+            if self._loader._resolve_classifier_runtime(self.settings.classifier_runtime) is not None:
+                logger.warning("⚠️ Trained fashion classifier failed to load, using CLIP zero-shot classification")
+            else:
+                logger.info("No trained fashion classifier found, using CLIP zero-shot classification")
+        
+        from ..utils.clip_encoder import CLIPZeroShotClassifier, configure_torch_threads
+        
+        configure_torch_threads(self.settings.clip_num_threads, self.settings.clip_interop_threads)
+        classifier = CLIPZeroShotClassifier(self.labels, quantize=self.settings.clip_quantize)
+        self.backend = "clip"
+        return classifier
+    
+    def _warmup(self, model):
+        """Run dummy batches at the sizes traffic will use before the pool reports ready"""
+        if self.backend == "fashion_classifier":
+            self._loader._warmup_fashion_classifier(model)
+            return
+        blank = Image.new("RGB", (224, 224))
+        for batch_size in (1, self.max_batch_size):
+            model.predict_batch([blank] * batch_size)
+    
+    def _predict_batch(self, contexts: List[ImageContext]) -> List[Dict[str, float]]:
+        """Label probabilities for a batch of images (runs on the batcher thread)"""
+        model = self.handle.get()
+        if self.backend == "clip":
+            return model.predict_batch([context.image for context in contexts])
+        
+        height, width, channels = tuple(model.input_shape)[:3]
+        if channels == 1:
+            batch = np.stack([
+                context.grayscale((width, height)).astype(np.float32)[..., np.newaxis] / 255.0
+                for context in contexts
+            ])
+        else:
+            batch = np.concatenate([context.normalized((width, height)) for context in contexts])
+        return [to_manvue_probabilities(probabilities) for probabilities in model.predict_batch(batch)]
+    
+    def _get_batcher(self) -> Optional[DynamicBatcher]:
+        if not self.handle.ready:
+            return None
+        with self._batcher_lock:
+            if self._batcher is None:
+                self._batcher = DynamicBatcher(
+                    self._predict_batch,
+                    max_batch_size=self.max_batch_size,
+                    max_wait_ms=self.max_wait_ms,
+                    name="ml-classify-batcher"
+                )
+        return self._batcher
+    
+    async def predict(self, context: ImageContext, timeout: Optional[float] = 30.0) -> Optional[Dict[str, float]]:
+        """
+        Classify one image, batched together with concurrent requests
+        
+        Args:
+            context: Decoded request image
+            timeout: Seconds to wait for a load in progress plus the prediction
+        
+        Returns:
+            Label probabilities, or None if no backend could be loaded
+        """
+        if not self.handle.ready:
+            await asyncio.get_running_loop().run_in_executor(None, self.handle.get, timeout)
+        batcher = self._get_batcher()
+        if batcher is None:
+            return None
+        return await asyncio.wait_for(asyncio.wrap_future(batcher.submit(context)), timeout)
+    
+    def is_available(self) -> bool:
+        """True unless loading finished without a usable backend"""
+        return self.handle.state not in (LazyModel.UNAVAILABLE, LazyModel.FAILED)
+    
+    def status(self) -> Dict[str, Any]:
+        """Backend, load state and batching statistics"""
+        return {
+            "backend": self.backend,
+            "requested_backend": self.requested_backend,
+            **self.handle.status(),
+            "batching": self._batcher.get_stats() if self._batcher else None
+        }
+    
+    def close(self):
+        """Stop the batcher worker"""
+        if self._batcher:
+            self._batcher.close()
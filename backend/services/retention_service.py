@@ -0,0 +1,117 @@
+"""
+Retention Service
+Expires visual search query logs and user-upload images stored in GridFS
+"""
+
+import logging
+import threading
+from typing import Dict, Any, Optional
+from datetime import datetime, timedelta
+
+from ..core.config import get_settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# GridFS metadata marker for images uploaded through visual search
+USER_UPLOAD_SEARCH_TYPE = "visual_search"
+
+class RetentionService:
+    """Service for bounding the growth of query logs and user uploads"""
+    
+    def __init__(self, db, settings=None):
+        self.db = db
+        self.settings = settings or get_settings()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.metrics = {
+            "sweeps": 0,
+            "files_deleted": 0,
+            "bytes_reclaimed": 0,
+            "last_sweep_at": None
+        }
+    
+    def ensure_indexes(self):
+        """Create the TTL index on query logs and the index used by the upload sweeper"""
+        try:
+            ttl_seconds = int(timedelta(days=self.settings.query_log_ttl_days).total_seconds())
+            queries = self.db["queries"]
+            
+            # An existing createdAt index with a different TTL has to be updated in place
+            existing = queries.index_information().get("createdAt_1")
+            if existing and existing.get("expireAfterSeconds") != ttl_seconds:
+                self.db.command("collMod", "queries", index={
+                    "keyPattern": {"createdAt": 1},
+                    "expireAfterSeconds": ttl_seconds
+                })
+            elif not existing:
+                queries.create_index("createdAt", expireAfterSeconds=ttl_seconds)
+            
+            self.db["fs.files"].create_index([("metadata.search_type", 1), ("uploadDate", 1)])
+            logger.info(f"✅ Retention indexes ready (query logs expire after {self.settings.query_log_ttl_days} days)")
+        except Exception as e:
+            logger.error(f"❌ Error creating retention indexes: {e}")
+    
+    def sweep_expired_uploads(self) -> Dict[str, Any]:
+        """
+        Delete expired user-upload files from GridFS in batches
+        
+        Returns:
+            Dict with files deleted and bytes reclaimed by this sweep
+        """
+        cutoff = datetime.utcnow() - timedelta(days=self.settings.user_upload_ttl_days)
+        batch_size = self.settings.retention_sweep_batch_size
+        files_deleted = 0
+        bytes_reclaimed = 0
+        
+        try:
+            while not self._stop_event.is_set():
+                expired = list(self.db["fs.files"].find(
+                    {"metadata.search_type": USER_UPLOAD_SEARCH_TYPE, "uploadDate": {"$lt": cutoff}},
+                    {"_id": 1, "length": 1}
+                ).limit(batch_size))
+                if not expired:
+                    break
+                
+                file_ids = [doc["_id"] for doc in expired]
+                # Chunks first so an interrupted sweep never leaves orphaned chunks
+                self.db["fs.chunks"].delete_many({"files_id": {"$in": file_ids}})
+                self.db["fs.files"].delete_many({"_id": {"$in": file_ids}})
+                
+                files_deleted += len(file_ids)
+                bytes_reclaimed += sum(doc.get("length", 0) for doc in expired)
+        except Exception as e:
+            logger.error(f"❌ Error sweeping expired uploads: {e}")
+        
+        self.metrics["sweeps"] += 1
+        self.metrics["files_deleted"] += files_deleted
+        self.metrics["bytes_reclaimed"] += bytes_reclaimed
+        self.metrics["last_sweep_at"] = datetime.utcnow().isoformat()
+        
+        if files_deleted:
+            logger.info(f"🧹 Deleted {files_deleted} expired uploads, reclaimed {bytes_reclaimed} bytes")
+        
+        return {"files_deleted": files_deleted, "bytes_reclaimed": bytes_reclaimed}
+    
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.sweep_expired_uploads()
+            self._stop_event.wait(self.settings.retention_sweep_interval)
+    
+    def start(self):
+        """Start the background sweeper thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="upload-retention", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop the background sweeper thread"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get sweeper metrics"""
+        return dict(self.metrics)
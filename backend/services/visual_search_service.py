@@ -4,10 +4,8 @@ Handles image recognition, similarity search, and outfit recommendations
 """
 
 import logging
-import base64
-import io
 import numpy as np
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Union
 from PIL import Image
 import asyncio
 from datetime import datetime
@@ -40,12 +38,21 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
 from backend.database import get_all_product_embeddings, store_product_embedding
 
+from ..core.config import get_settings
+from ..utils.image_decode import ImageTooLargeError
+from ..utils.image_context import ImageContext
+from ..utils.color_analysis import dominant_colors
+
 logger = logging.getLogger(__name__)
 
+# CLIP ViT-B/32 input resolution; decoding needs at least this many pixels per side
+CLIP_INPUT_SIZE = 224
+
 class VisualSearchService:
     """Service for visual search and outfit recommendations"""
     
     def __init__(self):
+        self.settings = get_settings()
         self.product_service = ProductService()
         self.clip_available = CLIP_AVAILABLE
         self.enhanced_ml_available = enhanced_ml_available
@@ -90,37 +97,66 @@ class VisualSearchService:
             }
         }
     
-    def _preprocess_image(self, image_data: str) -> Optional[Image.Image]:
+    def image_context(self, image_data: Union[str, bytes, ImageContext], target_size: Optional[int] = CLIP_INPUT_SIZE) -> ImageContext:
+        """Wrap request image data in a context that is decoded at most once"""
+        return ImageContext.from_data(
+            image_data,
+            min_size=target_size,
+            max_pixels=self.settings.image_decode_max_pixels
+        )
+    
+    def _preprocess_image(
+        self,
+        image_data: Union[str, bytes, ImageContext],
+        target_size: Optional[int] = CLIP_INPUT_SIZE
+    ) -> Optional[Image.Image]:
         """
-        Preprocess base64 image data for ML model
+        Preprocess image data for ML model
         
         Args:
-            image_data: Base64 encoded image data
+            image_data: Image context, raw image bytes, or base64 encoded image data (optionally a data URL)
+            target_size: Smallest side the model needs; JPEGs are decoded at reduced
+                resolution down to this size. None decodes at full resolution.
+                Ignored for an existing context.
             
         Returns:
-            PIL Image object or None if processing fails
+            EXIF-oriented RGB PIL Image or None if processing fails
         """
         try:
-            # Remove data URL prefix if present
-            if ',' in image_data:
-                image_data = image_data.split(',')[1]
-            
-            # Decode base64
-            image_bytes = base64.b64decode(image_data)
-            image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-            
-            return image
+            return self.image_context(image_data, target_size).image
             
+        except ImageTooLargeError as e:
+            logger.warning(f"⚠️ Rejected oversized image: {e}")
+            return None
         except Exception as e:
             logger.error(f"Error preprocessing image: {e}")
             return None
     
-    def _get_image_embedding_from_data(self, image_data: str) -> Optional[List[float]]:
+    def analyze_colors(self, image_data: Union[str, bytes, ImageContext], n_colors: int = 5) -> List[Dict[str, Any]]:
+        """
+        Dominant colours of the image
+        
+        Args:
+            image_data: Image context, raw image bytes or base64 encoded image data
+            n_colors: Maximum number of colours
+            
+        Returns:
+            List of dicts with hex, name and dominance (0.0-1.0), most dominant first
+        """
+        image = self._preprocess_image(image_data)
+        if not image:
+            return []
+        return [
+            {"hex": color["hex"], "name": color["name"], "dominance": round(color["percentage"] / 100, 4)}
+            for color in dominant_colors(image, n_colors=n_colors)
+        ]
+    
+    def _get_image_embedding_from_data(self, image_data: Union[str, bytes, ImageContext]) -> Optional[List[float]]:
         """
-        Get CLIP embedding from base64 image data
+        Get CLIP embedding from image data
         
         Args:
-            image_data: Base64 encoded image data
+            image_data: Image context, raw image bytes or base64 encoded image data
             
         Returns:
             Image embedding as list of floats or None
@@ -207,7 +243,7 @@ class VisualSearchService:
     
     async def find_similar_products(
         self, 
-        image_data: str, 
+        image_data: Union[str, bytes, ImageContext], 
         limit: int = 10,
         category_filter: Optional[str] = None
     ) -> List[Dict[str, Any]]:
@@ -215,7 +251,7 @@ class VisualSearchService:
         Find products similar to the uploaded image
         
         Args:
-            image_data: Base64 encoded image data
+            image_data: Image context, raw image bytes or base64 encoded image data
             limit: Maximum number of results
             category_filter: Optional category filter
             
@@ -237,7 +273,7 @@ class VisualSearchService:
     
     async def _find_similar_with_enhanced_ml(
         self, 
-        image_data: str, 
+        image_data: Union[str, bytes, ImageContext], 
         limit: int
     ) -> List[Dict[str, Any]]:
         """Find similar products using enhanced ML service"""
@@ -274,7 +310,7 @@ class VisualSearchService:
     
     async def _find_similar_with_fallback(
         self, 
-        image_data: str, 
+        image_data: Union[str, bytes, ImageContext], 
         limit: int,
         category_filter: Optional[str] = None
     ) -> List[Dict[str, Any]]:
@@ -419,7 +455,7 @@ class VisualSearchService:
     
     async def analyze_image_and_recommend(
         self, 
-        image_data: str, 
+        image_data: Union[str, bytes, ImageContext], 
         max_products: int = 10,
         max_outfits: int = 3
     ) -> Dict[str, Any]:
@@ -427,7 +463,7 @@ class VisualSearchService:
         Complete image analysis with product search and outfit recommendations
         
         Args:
-            image_data: Base64 encoded image data
+            image_data: Image context, raw image bytes or base64 encoded image data
             max_products: Maximum number of similar products
             max_outfits: Maximum number of outfit recommendations
             
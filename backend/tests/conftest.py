@@ -0,0 +1,62 @@
+"""
+Shared pytest setup for the fashion recommender backend
+"""
+
+import os
+import sys
+import uuid
+
+import pytest
+
+# Tests import the backend as a package (backend.database, backend.utils...), like the services do
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+@pytest.fixture
+def database_manager(monkeypatch):
+    """DatabaseManager backed by an in-memory mongomock server (GridFS included)"""
+    mongomock = pytest.importorskip("mongomock")
+    import mongomock.gridfs
+    from backend import database
+    
+    mongomock.gridfs.enable_gridfs_integration()
+    monkeypatch.setattr(database, "MongoClient", mongomock.MongoClient)
+    # mongomock keeps data per server across clients, so each test gets its own database
+    manager = database.DatabaseManager("mongodb://localhost:27017/", f"fashion_recommender_test_{uuid.uuid4().hex}")
+    yield manager
+    manager.close()
+
+@pytest.fixture
+def offline_clip(monkeypatch):
+    """
+    Serve a tiny random CLIP from from_pretrained, since the model hub is unreachable in tests
+    
+    Images keep CLIP's 224px input; embeddings are 16-d. Returns the model factory.
+    """
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    from backend.utils import clip_encoder
+    
+    def build_model():
+        text = dict(
+            hidden_size=32, intermediate_size=64, num_hidden_layers=1, num_attention_heads=2,
+            vocab_size=100, max_position_embeddings=16, bos_token_id=0, eos_token_id=1, pad_token_id=1
+        )
+        vision = dict(
+            hidden_size=32, intermediate_size=64, num_hidden_layers=1, num_attention_heads=2,
+            image_size=clip_encoder.CLIP_IMAGE_SIZE, patch_size=32
+        )
+        torch.manual_seed(0)
+        config = transformers.CLIPConfig(text_config=text, vision_config=vision, projection_dim=16)
+        return transformers.CLIPModel(config).eval()
+    
+    def tokenize(prompts, padding=True, return_tensors="pt"):
+        # One distinct token per prompt between BOS and EOS
+        ids = torch.tensor([[0, 2 + i % 98, 1] for i in range(len(prompts))])
+        return transformers.BatchEncoding({"input_ids": ids, "attention_mask": torch.ones_like(ids)})
+    
+    monkeypatch.setattr(transformers.CLIPModel, "from_pretrained", classmethod(lambda cls, name, **kwargs: build_model()))
+    monkeypatch.setattr(transformers.CLIPTokenizer, "from_pretrained", classmethod(lambda cls, name, **kwargs: tokenize))
+    monkeypatch.setattr(clip_encoder, "_shared_models", {})
+    return build_model
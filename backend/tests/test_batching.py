@@ -0,0 +1,145 @@
+"""
+Tests for the dynamic request batcher and classifier loading
+"""
+
+import sys
+import types
+import threading
+from concurrent.futures import CancelledError, TimeoutError
+
+import pytest
+
+from backend.utils.batching import DynamicBatcher
+from backend.utils.model_loader import ModelLoader
+
+
+@pytest.fixture
+def make_batcher():
+    batchers = []
+    
+    def make(batch_fn, **kwargs):
+        kwargs.setdefault("max_wait_ms", 20)
+        batcher = DynamicBatcher(batch_fn, **kwargs)
+        batchers.append(batcher)
+        return batcher
+    
+    yield make
+    for batcher in batchers:
+        batcher.close()
+
+
+def _gated(batch_fn):
+    """Wrap batch_fn so the first batch blocks until the returned event is set"""
+    started = threading.Event()
+    release = threading.Event()
+    batches = []
+    
+    def gated(items):
+        batches.append(list(items))
+        if len(batches) == 1:
+            started.set()
+            release.wait(5)
+        return batch_fn(items)
+    
+    return gated, started, release, batches
+
+
+def test_concurrent_submits_share_a_batch(make_batcher):
+    gated, started, release, batches = _gated(lambda items: [item * 2 for item in items])
+    batcher = make_batcher(gated, max_batch_size=4)
+    
+    first = batcher.submit(0)
+    assert started.wait(5)
+    futures = [batcher.submit(item) for item in range(1, 5)]
+    release.set()
+    
+    assert first.result(5) == 0
+    assert [future.result(5) for future in futures] == [2, 4, 6, 8]
+    assert batches == [[0], [1, 2, 3, 4]]
+    assert batcher.get_stats()["max_batch"] == 4
+
+
+def test_batch_failure_reaches_every_caller(make_batcher):
+    def failing(items):
+        raise ValueError("model exploded")
+    
+    batcher = make_batcher(failing)
+    futures = [batcher.submit(item) for item in range(3)]
+    
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(5)
+    assert batcher.get_stats()["errors"] >= 1
+
+
+def test_result_count_mismatch_is_an_error(make_batcher):
+    batcher = make_batcher(lambda items: items[:-1])
+    
+    with pytest.raises(RuntimeError, match="results"):
+        batcher(1, timeout=5)
+
+
+def test_cancelled_requests_are_skipped_and_worker_survives(make_batcher):
+    gated, started, release, batches = _gated(lambda items: list(items))
+    batcher = make_batcher(gated)
+    
+    first = batcher.submit("first")
+    assert started.wait(5)
+    abandoned = batcher.submit("abandoned")
+    assert abandoned.cancel()
+    release.set()
+    
+    assert first.result(5) == "first"
+    with pytest.raises(CancelledError):
+        abandoned.result(5)
+    assert batcher("after", timeout=5) == "after"
+    assert ["abandoned"] not in batches
+
+
+
+def test_timed_out_call_is_not_run(make_batcher):
+    gated, started, release, batches = _gated(lambda items: list(items))
+    batcher = make_batcher(gated)
+    
+    first = batcher.submit("first")
+    assert started.wait(5)
+    with pytest.raises(TimeoutError):
+        batcher("late", timeout=0.05)
+    release.set()
+    
+    assert first.result(5) == "first"
+    assert batcher("after", timeout=5) == "after"
+    assert all("late" not in batch for batch in batches)
+
+def test_already_resolved_future_does_not_stop_the_batch(make_batcher):
+    def settle_first(items):
+        # A caller's future resolved behind the batcher's back must not affect the others
+        if not first_future.done():
+            first_future.set_result("early")
+        return [item.upper() for item in items]
+    
+    batcher = make_batcher(settle_first)
+    first_future = batcher.submit("a")
+    second_future = batcher.submit("b")
+    
+    assert first_future.result(5) == "early"
+    assert second_future.result(5) == "B"
+    assert batcher("c", timeout=5) == "C"
+
+
+def test_failed_keras_load_returns_none(tmp_path, monkeypatch):
+    class UntrainedFallback:
+        def __init__(self, model_path=None):
+            self.model_path = model_path
+            self.loaded_from_path = False
+    
+    fake_module = types.ModuleType("backend.models.fashion_classifier")
+    fake_module.FashionClassifier = UntrainedFallback
+    monkeypatch.setitem(sys.modules, "backend.models.fashion_classifier", fake_module)
+    (tmp_path / "fashion_classifier.h5").write_bytes(b"not a keras model")
+    
+    loader = ModelLoader(models_dir=str(tmp_path), classifier_runtime="keras")
+    assert loader.load_fashion_classifier() is None
+    
+    UntrainedFallback.__init__ = lambda self, model_path=None: setattr(self, "loaded_from_path", True)
+    assert isinstance(loader.load_fashion_classifier(), UntrainedFallback)
@@ -0,0 +1,90 @@
+"""
+Smoke tests for exported fashion classifier runtimes
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from backend.models.classifier_runtimes import FASHION_CLASS_NAMES, ONNXFashionClassifier
+from backend.utils.model_loader import ModelLoader
+
+INPUT_SHAPE = (8, 8, 3)
+
+
+@pytest.fixture
+def onnx_export(tmp_path):
+    """A tiny linear softmax classifier saved where ModelLoader looks for the ONNX export"""
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    from onnx import TensorProto, helper, numpy_helper
+    
+    weights = np.random.default_rng(0).normal(size=(int(np.prod(INPUT_SHAPE)), len(FASHION_CLASS_NAMES)))
+    weights = weights.astype(np.float32)
+    graph = helper.make_graph(
+        [
+            helper.make_node("Flatten", ["images"], ["flat"], axis=1),
+            helper.make_node("MatMul", ["flat", "weights"], ["logits"]),
+            helper.make_node("Softmax", ["logits"], ["probabilities"], axis=1),
+        ],
+        "fashion_classifier",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, ["batch", *INPUT_SHAPE])],
+        [helper.make_tensor_value_info("probabilities", TensorProto.FLOAT, ["batch", len(FASHION_CLASS_NAMES)])],
+        initializer=[numpy_helper.from_array(weights, "weights")],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    path = tmp_path / "fashion_classifier.onnx"
+    onnx.save(model, str(path))
+    return path, weights
+
+
+def _reference(batch: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    logits = batch.reshape(len(batch), -1) @ weights
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def test_loader_picks_the_onnx_export(onnx_export):
+    path, _ = onnx_export
+    loader = ModelLoader(models_dir=str(path.parent), num_threads=1)
+    
+    for runtime in ("auto", "onnx"):
+        classifier = loader.load_fashion_classifier(runtime=runtime)
+        assert isinstance(classifier, ONNXFashionClassifier)
+        assert classifier.input_shape == INPUT_SHAPE
+    assert loader.load_fashion_classifier(runtime="tflite") is None
+
+
+def test_onnx_predictions_match_the_reference_model(onnx_export):
+    path, weights = onnx_export
+    classifier = ONNXFashionClassifier(str(path), num_threads=1)
+    batch = np.random.default_rng(1).random((5, *INPUT_SHAPE), dtype=np.float32)
+    
+    predictions = classifier.predict_batch(batch, max_batch_size=2)
+    expected = _reference(batch, weights)
+    
+    assert len(predictions) == 5
+    for prediction, row in zip(predictions, expected):
+        assert list(prediction) == FASHION_CLASS_NAMES
+        np.testing.assert_allclose(list(prediction.values()), row, rtol=1e-4, atol=1e-6)
+    
+    top = classifier.predict_top_k(batch[0], k=3)
+    assert [item["rank"] for item in top] == [1, 2, 3]
+    assert top[0]["class"] == FASHION_CLASS_NAMES[int(np.argmax(expected[0]))]
+
+
+def test_classifier_benchmark_runs_on_an_export(onnx_export, monkeypatch):
+    monkeypatch.syspath_prepend(str(Path(__file__).resolve().parents[1]))
+    import benchmark_classifier
+    
+    path, _ = onnx_export
+    classifier = ONNXFashionClassifier(str(path), num_threads=1)
+    inputs = benchmark_classifier.load_inputs(None, 4, classifier.input_shape)
+    
+    results = benchmark_classifier.benchmark(classifier, inputs, [1, 4], iterations=2)
+    
+    assert set(results) == {1, 4}
+    assert all(stats["images_per_s"] > 0 for stats in results.values())
+    assert len(benchmark_classifier.top1(classifier.predict_batch(inputs))) == 4
@@ -0,0 +1,103 @@
+"""
+Smoke tests for the CPU-tuned CLIP image encoder
+"""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from backend.utils import clip_encoder
+
+@pytest.fixture
+def pixel_values():
+    rng = np.random.default_rng(0)
+    images = [
+        Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+        for width, height in [(240, 224), (224, 448), (300, 300), (225, 224)]
+    ]
+    return clip_encoder.preprocess_clip_images(images)
+
+
+def test_quantized_encoder_agrees_with_float32(offline_clip, pixel_values):
+    reference_model = clip_encoder.load_clip_model("tiny")
+    quantized_model = clip_encoder.load_clip_model("tiny", quantize=True)
+    
+    assert any("quantized" in type(module).__module__ for module in quantized_model.modules())
+    assert clip_encoder.model_size_mb(quantized_model) < clip_encoder.model_size_mb(reference_model)
+    
+    reference = clip_encoder.encode_images(reference_model, pixel_values)
+    candidate = clip_encoder.encode_images(quantized_model, pixel_values)
+    assert reference.shape == candidate.shape == (4, 16)
+    np.testing.assert_allclose(np.linalg.norm(candidate, axis=1), 1.0, rtol=1e-5)
+    
+    agreement = clip_encoder.encoder_agreement(reference, candidate, k=2)
+    assert agreement["cosine_min"] > 0.9
+    assert agreement["k"] == 2
+
+
+def test_encoder_agreement_against_a_catalog():
+    rng = np.random.default_rng(0)
+    catalog = rng.normal(size=(20, 8)).astype(np.float32)
+    catalog /= np.linalg.norm(catalog, axis=1, keepdims=True)
+    queries = catalog[:5]
+    
+    same = clip_encoder.encoder_agreement(queries, queries, catalog, k=3)
+    assert same["cosine_mean"] == pytest.approx(1.0)
+    assert same["recall_at_k"] == 1.0
+    
+    shuffled = clip_encoder.encoder_agreement(queries, catalog[5:10], catalog, k=3)
+    assert shuffled["recall_at_k"] < 1.0
+
+
+def test_time_encoder_and_thread_configuration(offline_clip, pixel_values):
+    previous = torch.get_num_threads()
+    try:
+        assert clip_encoder.configure_torch_threads(1)["intra_op"] == 1
+    finally:
+        torch.set_num_threads(previous)
+    
+    stats = clip_encoder.time_encoder(offline_clip(), pixel_values, iterations=2)
+    assert stats["p95_ms"] >= stats["p50_ms"] > 0
+    assert stats["images_per_s"] > 0
+
+
+def _sample_image(mode: str, size, rng) -> Image.Image:
+    width, height = size
+    rgba = Image.fromarray(rng.integers(0, 256, (height, width, 4), dtype=np.uint8), "RGBA")
+    if mode == "P":
+        # Palette image with a transparent index, as PNG uploads often are
+        image = rgba.convert("RGB").convert("P", palette=Image.Palette.ADAPTIVE)
+        image.info["transparency"] = 0
+        return image
+    return rgba if mode == "RGBA" else rgba.convert(mode)
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L", "LA", "P"])
+def test_preprocessing_matches_clip_image_processor(mode):
+    processor = transformers.CLIPImageProcessor()
+    rng = np.random.default_rng(0)
+    # Square, landscape, portrait, off-by-one and extreme aspect ratios
+    sizes = [(224, 224), (640, 480), (300, 800), (225, 224), (1201, 37)]
+    images = [_sample_image(mode, size, rng) for size in sizes]
+    
+    expected = processor(images=images, return_tensors="pt")["pixel_values"]
+    actual = clip_encoder.preprocess_clip_images(images)
+    
+    assert actual.dtype == expected.dtype
+    assert torch.equal(actual, expected)
+    
+    check = clip_encoder.verify_preprocessing(processor, images)
+    assert check["identical"]
+    assert check["max_abs_diff"] == 0.0
+
+
+def test_clip_model_is_shared_per_configuration(offline_clip):
+    first = clip_encoder.get_shared_clip_model("tiny")
+    
+    assert clip_encoder.get_shared_clip_model("tiny") is first
+    assert clip_encoder.get_shared_clip_model("tiny", quantize=True) is not first
+    # Quantization is CPU-only, so it cannot split the cache on other devices
+    assert clip_encoder.get_shared_clip_model("tiny", "meta", quantize=True) is clip_encoder.get_shared_clip_model("tiny", "meta")
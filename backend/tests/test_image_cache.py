@@ -0,0 +1,135 @@
+"""
+Tests for the single-flight fill of the image cache
+"""
+
+import os
+import time
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+from backend.services import image_cache_service
+from backend.services.image_cache_service import DiskLRU, ImageCacheService, STALE_TMP_SECONDS
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return ImageCacheService()
+
+
+def _slow_source(monkeypatch, result=b"image-bytes", error=None):
+    """Patch GridFS reads with one that blocks until released and counts calls"""
+    calls = []
+    release = asyncio.Event()
+    
+    async def fake_get_image(file_id):
+        calls.append(file_id)
+        await release.wait()
+        if error is not None:
+            raise error
+        return result
+    
+    monkeypatch.setattr(image_cache_service, "get_image", fake_get_image)
+    return calls, release
+
+
+def test_concurrent_misses_share_one_fill(cache, monkeypatch):
+    file_id = str(ObjectId())
+    
+    async def scenario():
+        calls, release = _slow_source(monkeypatch)
+        waiters = [asyncio.ensure_future(cache.get(file_id, "image/jpeg")) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        release.set()
+        return calls, await asyncio.gather(*waiters)
+    
+    calls, results = asyncio.run(scenario())
+    assert calls == [file_id]
+    assert results == [(b"image-bytes", "gridfs")] * 5
+    assert cache._inflight == {}
+    assert cache.get_metrics()["hits"] == {"memory": 0, "disk": 0, "gridfs": 5}
+    
+    assert asyncio.run(cache.get(file_id, "image/jpeg")) == (b"image-bytes", "memory")
+
+
+def test_cancelled_first_caller_does_not_strand_waiters(cache, monkeypatch):
+    file_id = str(ObjectId())
+    
+    async def scenario():
+        calls, release = _slow_source(monkeypatch)
+        first = asyncio.ensure_future(cache.get(file_id, "image/jpeg"))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(cache.get(file_id, "image/jpeg"))
+        await asyncio.sleep(0.01)
+        
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        
+        release.set()
+        return calls, await asyncio.wait_for(second, timeout=1)
+    
+    calls, result = asyncio.run(scenario())
+    assert calls == [file_id]
+    assert result == (b"image-bytes", "gridfs")
+    assert cache._inflight == {}
+
+
+def test_fill_failure_reaches_every_waiter(cache, monkeypatch):
+    file_id = str(ObjectId())
+    
+    async def scenario():
+        _, release = _slow_source(monkeypatch, error=RuntimeError("gridfs down"))
+        waiters = [asyncio.ensure_future(cache.get(file_id, "image/jpeg")) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(*waiters, return_exceptions=True)
+    
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert cache._inflight == {}
+
+
+def test_missing_image_raises_not_found(cache, monkeypatch):
+    async def missing(file_id):
+        return None
+    
+    monkeypatch.setattr(image_cache_service, "get_image", missing)
+    
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(cache.get(str(ObjectId()), "image/jpeg"))
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(cache.get("not-an-object-id", "image/jpeg"))
+
+
+def test_disk_hits_are_served_as_ranges(cache, monkeypatch):
+    file_id = str(ObjectId())
+    payload = bytes(range(256)) * 1024
+    cache.disk.put(file_id, payload)
+    _slow_source(monkeypatch)
+    
+    async def scenario():
+        chunks, tier = await cache.get_range(file_id, "image/jpeg", 100, 200_000)
+        return list(chunks), tier
+    
+    chunks, tier = asyncio.run(scenario())
+    assert tier == "disk"
+    assert len(chunks) > 1
+    assert b"".join(chunks) == payload[100:200_001]
+    assert cache.get_metrics()["bytes_served"]["disk"] == 199_901
+
+
+def test_startup_only_removes_abandoned_temp_files(tmp_path):
+    (tmp_path / "cached").write_bytes(b"x" * 10)
+    (tmp_path / "writing.1.2.tmp").write_bytes(b"partial")
+    abandoned = tmp_path / "abandoned.3.4.tmp"
+    abandoned.write_bytes(b"partial")
+    stale = time.time() - STALE_TMP_SECONDS - 60
+    os.utime(abandoned, (stale, stale))
+    
+    disk = DiskLRU(str(tmp_path), max_bytes=1000)
+    
+    assert sorted(os.listdir(tmp_path)) == ["cached", "writing.1.2.tmp"]
+    assert disk.current_bytes == 10
@@ -0,0 +1,149 @@
+"""
+Tests for conditional and range requests on GET /api/images/{file_id}
+"""
+
+import importlib
+import sys
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("fastapi")
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+IMAGE = bytes(range(256)) * 4
+UPLOAD_DATE = datetime(2024, 1, 2, 3, 4, 5)
+ETAG = '"abc123"'
+
+class FakeCache:
+    def __init__(self, cacheable):
+        self.cacheable = cacheable
+    
+    def is_cacheable(self, length):
+        return self.cacheable
+    
+    async def get_range(self, file_id, content_type, start, end):
+        return iter((IMAGE[start:end + 1],)), "memory"
+
+class FakeImageService:
+    def __init__(self, cacheable):
+        self.cache = FakeCache(cacheable)
+        self.streamed = []
+    
+    async def get_image_file_metadata(self, file_id):
+        if file_id != "img":
+            raise FileNotFoundError(file_id)
+        return {
+            "id": file_id,
+            "length": len(IMAGE),
+            "content_type": "image/jpeg",
+            "sha256": "abc123",
+            "upload_date": UPLOAD_DATE
+        }
+    
+    async def get_image_stream(self, file_id, start, end):
+        self.streamed.append((start, end))
+        
+        async def chunks():
+            # Two chunks, as GridFS would deliver them
+            middle = (start + end + 1) // 2
+            yield IMAGE[start:middle]
+            yield IMAGE[middle:end + 1]
+        
+        return chunks()
+
+@pytest.fixture(params=[False, True], ids=["gridfs-stream", "cache"])
+def client(request, monkeypatch):
+    # The routes import their pydantic models from backend.models; this tree keeps them in models_backup
+    monkeypatch.setitem(
+        sys.modules, "backend.models.image_models",
+        importlib.import_module("backend.models_backup.image_models")
+    )
+    images = importlib.import_module("backend.routes.images")
+    monkeypatch.setattr(images, "image_service", FakeImageService(cacheable=request.param))
+    
+    app = FastAPI()
+    app.include_router(images.router, prefix="/api")
+    return TestClient(app)
+
+def test_full_response_carries_validators(client):
+    response = client.get("/api/images/img")
+    
+    assert response.status_code == 200
+    assert response.content == IMAGE
+    assert response.headers["etag"] == ETAG
+    assert response.headers["last-modified"] == "Tue, 02 Jan 2024 03:04:05 GMT"
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-length"] == str(len(IMAGE))
+
+@pytest.mark.parametrize("if_none_match", [ETAG, f"W/{ETAG}", f'"other", {ETAG}', "*"])
+def test_matching_if_none_match_returns_304(client, if_none_match):
+    response = client.get("/api/images/img", headers={"If-None-Match": if_none_match})
+    
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == ETAG
+
+def test_stale_if_none_match_returns_body(client):
+    response = client.get("/api/images/img", headers={"If-None-Match": '"other"'})
+    
+    assert response.status_code == 200
+    assert response.content == IMAGE
+
+def test_if_none_match_takes_precedence_over_if_modified_since(client):
+    response = client.get("/api/images/img", headers={
+        "If-None-Match": '"other"',
+        "If-Modified-Since": "Wed, 03 Jan 2024 00:00:00 GMT"
+    })
+    
+    assert response.status_code == 200
+
+@pytest.mark.parametrize("since, status", [
+    ("Tue, 02 Jan 2024 03:04:05 GMT", 304),
+    ("Wed, 03 Jan 2024 00:00:00 GMT", 304),
+    ("Mon, 01 Jan 2024 00:00:00 GMT", 200),
+    ("not a date", 200),
+])
+def test_if_modified_since(client, since, status):
+    response = client.get("/api/images/img", headers={"If-Modified-Since": since})
+    
+    assert response.status_code == status
+
+@pytest.mark.parametrize("range_header, start, end", [
+    ("bytes=2-5", 2, 5),
+    ("bytes=1000-", 1000, 1023),
+    ("bytes=-3", 1021, 1023),
+    ("bytes=1020-5000", 1020, 1023),
+])
+def test_range_returns_partial_content(client, range_header, start, end):
+    response = client.get("/api/images/img", headers={"Range": range_header})
+    
+    assert response.status_code == 206
+    assert response.content == IMAGE[start:end + 1]
+    assert response.headers["content-range"] == f"bytes {start}-{end}/{len(IMAGE)}"
+    assert response.headers["content-length"] == str(end - start + 1)
+
+def test_unsatisfiable_range_returns_416(client):
+    response = client.get("/api/images/img", headers={"Range": "bytes=5000-"})
+    
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(IMAGE)}"
+
+@pytest.mark.parametrize("range_header", ["bytes=0-1,4-5", "items=0-5", "bytes=x-y"])
+def test_unsupported_range_is_ignored(client, range_header):
+    response = client.get("/api/images/img", headers={"Range": range_header})
+    
+    assert response.status_code == 200
+    assert response.content == IMAGE
+
+def test_if_range_mismatch_sends_whole_image(client):
+    response = client.get("/api/images/img", headers={"Range": "bytes=2-5", "If-Range": '"other"'})
+    assert response.status_code == 200
+    assert response.content == IMAGE
+    
+    response = client.get("/api/images/img", headers={"Range": "bytes=2-5", "If-Range": ETAG})
+    assert response.status_code == 206
+
+def test_missing_image_returns_404(client):
+    assert client.get("/api/images/missing").status_code == 404
@@ -0,0 +1,27 @@
+"""
+Tests for the hand-crafted image features used for similarity search
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+from backend.utils.image_processor import ImageProcessor
+
+
+def _features(gray: np.ndarray) -> np.ndarray:
+    return ImageProcessor()._extract_basic_features(np.repeat(gray[..., None], 3, axis=2), gray=gray)
+
+
+def test_texture_moves_the_feature_distance():
+    # Same pixel values in the same proportions, so identical colour histograms
+    checkerboard = (np.indices((64, 64)).sum(axis=0) % 2 * 200 + 20).astype(np.uint8)
+    halves = np.sort(checkerboard, axis=1)
+    # Same checkerboard texture with different colours
+    recoloured = checkerboard + np.uint8(30)
+    
+    texture_distance = np.linalg.norm(_features(checkerboard) - _features(halves))
+    color_distance = np.linalg.norm(_features(checkerboard) - _features(recoloured))
+    
+    assert np.allclose(_features(checkerboard)[256:], _features(halves)[256:])
+    assert texture_distance > color_distance > 0
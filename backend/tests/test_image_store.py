@@ -0,0 +1,174 @@
+"""
+Tests for storing uploaded images in GridFS
+"""
+
+import sys
+import base64
+import asyncio
+import binascii
+import importlib
+
+import pytest
+
+from backend import database
+
+
+def _decode(image_data: str, chunk_size: int) -> bytes:
+    async def collect():
+        return b"".join([chunk async for chunk in database._decode_base64_chunks(image_data, chunk_size)])
+    return asyncio.run(collect())
+
+
+PAYLOAD = bytes(range(256)) * 40
+
+
+@pytest.mark.parametrize("chunk_size", [3, 48, 57, 1000, 256 * 1024])
+@pytest.mark.parametrize("encoded", [
+    base64.b64encode(PAYLOAD).decode(),
+    base64.encodebytes(PAYLOAD).decode(),
+    base64.encodebytes(PAYLOAD).decode().replace("\n", "\r\n"),
+    "data:image/png;base64," + base64.encodebytes(PAYLOAD).decode(),
+], ids=["plain", "mime", "crlf", "data-url"])
+def test_base64_chunks_decode_like_one_shot(encoded, chunk_size):
+    assert _decode(encoded, chunk_size) == PAYLOAD
+
+
+def test_base64_chunks_reject_truncated_input():
+    encoded = base64.b64encode(PAYLOAD).decode()[:-1]
+    with pytest.raises(binascii.Error):
+        _decode(encoded, 48)
+
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+
+
+@pytest.fixture
+def manager(database_manager, monkeypatch):
+    monkeypatch.setattr(database, "_db_instance", database_manager)
+    return database_manager
+
+
+def _lose_first_lookup(manager, monkeypatch):
+    """Make the first dedup lookup miss, as if an identical upload finished right after it"""
+    lookup = manager.acquire_image_by_hash
+    calls = []
+    
+    def racing_lookup(sha256, metadata=None):
+        calls.append(sha256)
+        return None if len(calls) == 1 else lookup(sha256, metadata)
+    
+    monkeypatch.setattr(manager, "acquire_image_by_hash", racing_lookup)
+
+
+def test_identical_uploads_share_a_file_per_product(manager):
+    first = manager.save_image(PNG_BYTES, "a.png", {"category": "shirts", "product_id": "p1"})
+    again = manager.save_image(PNG_BYTES, "b.png", {"category": "shirts", "product_id": "p1"})
+    other_product = manager.save_image(PNG_BYTES, "c.png", {"category": "shirts", "product_id": "p2"})
+    other_category = manager.save_image(PNG_BYTES, "d.png", {"category": "shoes", "product_id": "p1"})
+    
+    assert first == again
+    assert len({first, other_product, other_category}) == 3
+    
+    files = manager.get_collection("fs.files")
+    assert files.find_one({"_id": database.ObjectId(first)})["ref_count"] == 2
+    assert [str(doc["_id"]) for doc in manager.list_images(product_id="p2")] == [other_product]
+    assert [str(doc["_id"]) for doc in manager.list_images(category="shoes")] == [other_category]
+
+
+def test_store_image_dedups_within_the_same_filters_only(manager):
+    async def upload(product_id):
+        return await database.store_image(PNG_BYTES, "a.png", "image/png", {"product_id": product_id})
+    
+    assert asyncio.run(upload("p1")) == asyncio.run(upload("p1"))
+    assert asyncio.run(upload("p1")) != asyncio.run(upload("p2"))
+
+
+def test_save_image_race_reuses_winner_without_orphan_chunks(manager, monkeypatch):
+    metadata = {"category": "shirts", "product_id": "p1"}
+    winner = manager.save_image(PNG_BYTES, "a.png", metadata)
+    _lose_first_lookup(manager, monkeypatch)
+    
+    assert manager.save_image(PNG_BYTES, "b.png", metadata) == winner
+    assert manager.get_collection("fs.files").count_documents({}) == 1
+    assert manager.get_collection("fs.chunks").distinct("files_id") == [database.ObjectId(winner)]
+
+
+def test_stream_race_reuses_winner_without_orphan_chunks(manager, monkeypatch):
+    metadata = {"category": "shirts", "product_id": "p1"}
+    winner = manager.save_image(PNG_BYTES, "a.png", metadata)
+    _lose_first_lookup(manager, monkeypatch)
+    
+    async def upload():
+        return await database.store_image_stream(
+            database._single_chunk(PNG_BYTES), "b.png", "image/png", metadata
+        )
+    
+    result = asyncio.run(upload())
+    assert result["file_id"] == winner
+    assert result["deduplicated"] is True
+    assert manager.get_collection("fs.files").count_documents({}) == 1
+    assert manager.get_collection("fs.chunks").distinct("files_id") == [database.ObjectId(winner)]
+
+
+def test_undeduplicated_writes_record_the_same_hash_field(manager):
+    shared = manager.save_image(PNG_BYTES, "a.png", {"product_id": "p1"})
+    private = manager.save_image(PNG_BYTES, "b.png", {"product_id": "p1"}, deduplicate=False)
+    
+    files = manager.get_collection("fs.files")
+    assert shared != private
+    assert files.find_one({"_id": database.ObjectId(private)})["sha256"] == files.find_one(
+        {"_id": database.ObjectId(shared)}
+    )["sha256"]
+    assert "dedup_key" not in files.find_one({"_id": database.ObjectId(private)})
+
+
+def test_last_release_unshares_before_deleting(manager, monkeypatch):
+    metadata = {"category": "shirts", "product_id": "p1"}
+    file_id = manager.save_image(PNG_BYTES, "a.png", metadata)
+    files = manager.get_collection("fs.files")
+    delete = manager.fs.delete
+    
+    def racing_delete(oid):
+        # An identical upload arriving mid-delete must get a new file, not this one
+        assert "dedup_key" not in files.find_one({"_id": oid})
+        assert manager.save_image(PNG_BYTES, "b.png", metadata) != file_id
+        delete(oid)
+    
+    monkeypatch.setattr(manager.fs, "delete", racing_delete)
+    
+    assert manager.release_image(file_id) == 0
+    assert manager.release_image(file_id) is None
+    assert files.count_documents({}) == 1
+
+
+def test_ml_results_are_saved_on_the_image(manager, monkeypatch):
+    for name in ("image_models", "ml_models"):
+        monkeypatch.setitem(
+            sys.modules, f"backend.models.{name}", importlib.import_module(f"backend.models_backup.{name}")
+        )
+    from backend.models_backup.ml_models import DetectedItem, MLPredictionResponse
+    from backend.services import ml_service
+    from backend.services.image_service import ImageService
+    
+    seen = []
+    
+    class FakeMLService:
+        def is_available(self):
+            return True
+        
+        async def predict_image(self, image_data, include_colors=True):
+            seen.append(image_data)
+            item = DetectedItem(name="Shirt", confidence=90, category="tops", type="shirt")
+            return MLPredictionResponse(detected_items=[item], overall_confidence=90, processing_time="0s")
+    
+    monkeypatch.setattr(ml_service, "get_ml_service", FakeMLService)
+    file_id = manager.save_image(PNG_BYTES, "a.png", {"product_id": "p1"})
+    
+    service = ImageService.__new__(ImageService)
+    asyncio.run(service.process_image_ml(file_id, PNG_BYTES))
+    
+    assert seen == [PNG_BYTES]
+    stored = manager.get_collection("fs.files").find_one({"_id": database.ObjectId(file_id)})["ml"]
+    assert stored["detected_items"][0]["name"] == "Shirt"
+    assert stored["overall_confidence"] == 90
+    assert "processed_at" in stored
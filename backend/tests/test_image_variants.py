@@ -0,0 +1,91 @@
+"""
+Tests for stored image variants
+"""
+
+import io
+import asyncio
+
+import pytest
+from PIL import Image
+
+from backend import database
+from backend.services import image_variant_service
+from backend.services.image_variant_service import ImageVariantService
+
+
+def _png(size=(40, 30)) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", size, (200, 40, 40)).save(output, format="PNG")
+    return output.getvalue()
+
+
+@pytest.fixture
+def service(database_manager, monkeypatch):
+    monkeypatch.setattr(database, "_db_instance", database_manager)
+    return ImageVariantService()
+
+
+def test_identical_variants_are_stored_under_their_own_keys(service, database_manager):
+    source = _png()
+    file_id = database_manager.save_image(source, "original.png", {"category": "shirts"})
+    
+    # Both presets upscale-clamp to the 40x30 source and encode to the same bytes
+    first, _ = asyncio.run(service.get_variant(file_id, 300, 300, "png", source=source))
+    second, _ = asyncio.run(service.get_variant(file_id, 600, 600, "png", source=source))
+    assert first == second
+    
+    for width in (300, 600):
+        key = service.variant_key(file_id, width, width, "png")
+        assert service._find_stored(key) == first
+    
+    files = database_manager.get_collection("fs.files")
+    assert files.count_documents({"metadata.variant_of": file_id}) == 2
+    assert files.find_one({"_id": database.ObjectId(file_id)})["ref_count"] == 1
+    
+    asyncio.run(service.delete_variants(file_id))
+    assert files.count_documents({"metadata.variant_of": file_id}) == 0
+    assert database_manager.get_image(file_id) == source
+
+
+def test_missing_source_releases_the_key_lock(service, monkeypatch):
+    async def missing(file_id):
+        return None
+    
+    monkeypatch.setattr(image_variant_service, "get_image", missing)
+    file_id = str(database.ObjectId())
+    
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(service.get_variant(file_id, 300, 300, "jpeg"))
+    assert service._locks == {}
+
+
+def test_waiters_keep_the_key_lock_after_a_failed_render(service, database_manager, monkeypatch):
+    source = _png()
+    file_id = database_manager.save_image(source, "original.png", {"category": "shirts"})
+    render = service._render
+    renders = []
+    
+    def flaky_render(*args):
+        renders.append(args)
+        if len(renders) == 1:
+            raise OSError("encoder failed")
+        return render(*args)
+    
+    monkeypatch.setattr(service, "_render", flaky_render)
+    
+    async def scenario():
+        first = asyncio.ensure_future(service.get_variant(file_id, 20, 20, "png", source=source))
+        waiter = asyncio.ensure_future(service.get_variant(file_id, 20, 20, "png", source=source))
+        await asyncio.sleep(0)
+        # Arrives while the waiter still queues behind the failed producer
+        first_result = await asyncio.gather(first, return_exceptions=True)
+        late = asyncio.ensure_future(service.get_variant(file_id, 20, 20, "png", source=source))
+        return first_result, await waiter, await late
+    
+    (failure,), waited, late = asyncio.run(scenario())
+    
+    assert isinstance(failure, OSError)
+    assert waited == late
+    assert len(renders) == 2
+    assert database_manager.get_collection("fs.files").count_documents({"metadata.variant_of": file_id}) == 1
+    assert service._locks == {} and service._lock_users == {}
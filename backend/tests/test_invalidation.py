@@ -0,0 +1,142 @@
+"""
+Tests for the cache invalidation bus and its change sources
+"""
+
+import threading
+
+import numpy as np
+from pymongo.errors import OperationFailure
+
+from backend.invalidation import (
+    ChangeStreamSource, EventType, InMemoryChangeSource, InvalidationBus, InvalidationEvent
+)
+
+def _event(event_type=EventType.PRODUCT_CHANGED, operation="update", document_id="1"):
+    return InvalidationEvent(event_type=event_type, operation=operation, document_id=document_id, collection="products")
+
+def test_publish_routes_by_event_type():
+    bus = InvalidationBus()
+    products, everything = [], []
+    bus.subscribe(products.append, EventType.PRODUCT_CHANGED)
+    bus.subscribe(everything.append)
+    
+    bus.publish(_event(EventType.PRODUCT_CHANGED))
+    bus.publish(_event(EventType.IMAGE_CHANGED))
+    
+    assert [event.event_type for event in products] == [EventType.PRODUCT_CHANGED]
+    assert [event.event_type for event in everything] == [EventType.PRODUCT_CHANGED, EventType.IMAGE_CHANGED]
+    assert bus.stats["published"] == 2
+
+def test_unsubscribe_stops_delivery():
+    bus = InvalidationBus()
+    received = []
+    unsubscribe = bus.subscribe(received.append, EventType.PRODUCT_CHANGED)
+    
+    bus.publish(_event())
+    unsubscribe()
+    unsubscribe()  # idempotent
+    bus.publish(_event())
+    
+    assert len(received) == 1
+
+def test_failing_subscriber_does_not_block_others():
+    bus = InvalidationBus()
+    received = []
+    
+    def broken(event):
+        raise RuntimeError("boom")
+    
+    bus.subscribe(broken)
+    bus.subscribe(received.append)
+    bus.publish(_event())
+    
+    assert len(received) == 1
+    assert bus.stats["subscriber_errors"] == 1
+
+def test_in_memory_source_maps_collections_to_events():
+    bus = InvalidationBus()
+    received = []
+    bus.subscribe(received.append)
+    source = InMemoryChangeSource(bus)
+    
+    source.emit("fs.files", "delete", 42)
+    
+    assert received[0].event_type == EventType.IMAGE_CHANGED
+    assert received[0].operation == "delete"
+    assert received[0].document_id == "42"
+
+class FakeStream:
+    def __init__(self, changes, stop_event):
+        self.changes = list(changes)
+        self.stop_event = stop_event
+        self.resume_token = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+    
+    def try_next(self):
+        if not self.changes:
+            self.stop_event.set()
+            return None
+        change = self.changes.pop(0)
+        self.resume_token = {"_data": change["documentKey"]["_id"]}
+        return change
+
+class FakeCollection:
+    def __init__(self, source, changes=(), error=None):
+        self.source = source
+        self.changes = changes
+        self.error = error
+    
+    def watch(self, pipeline, resume_after=None, max_await_time_ms=None):
+        if self.error:
+            raise self.error
+        return FakeStream(self.changes, self.source._stop_event)
+
+def test_change_stream_source_publishes_changes():
+    bus = InvalidationBus()
+    received = []
+    bus.subscribe(received.append, EventType.PRODUCT_CHANGED)
+    source = ChangeStreamSource(db={}, bus=bus)
+    changes = [
+        {"operationType": "insert", "documentKey": {"_id": "a"}},
+        {"operationType": "delete", "documentKey": {"_id": "b"}},
+    ]
+    source.db = {"products": FakeCollection(source, changes)}
+    
+    source._watch("products", EventType.PRODUCT_CHANGED)
+    
+    assert [(event.operation, event.document_id) for event in received] == [("insert", "a"), ("delete", "b")]
+
+def test_change_stream_source_gives_up_without_replica_set():
+    bus = InvalidationBus()
+    source = ChangeStreamSource(db={}, bus=bus)
+    source.db = {"products": FakeCollection(source, error=OperationFailure("The $changeStream stage is only supported on replica sets"))}
+    
+    thread = threading.Thread(target=source._watch, args=("products", EventType.PRODUCT_CHANGED))
+    thread.start()
+    thread.join(timeout=2)
+    
+    assert not thread.is_alive()
+
+def test_product_change_refreshes_vector_index(database_manager):
+    bus = InvalidationBus()
+    source = InMemoryChangeSource(bus)
+    database_manager.enable_cache_invalidation(bus)
+    products = database_manager.get_collection("products")
+    first = products.insert_one({"name": "a", "image_features": [1.0, 0.0, 0.0]}).inserted_id
+    second = products.insert_one({"name": "b", "image_features": [0.0, 1.0, 0.0]}).inserted_id
+    database_manager._ensure_vector_index()
+    
+    # Another worker moves product a next to product b
+    products.update_one({"_id": first}, {"$set": {"image_features": [0.0, 1.0, 0.1]}})
+    source.emit("products", "update", first)
+    matches = database_manager.vector_index.search(np.array([0.0, 1.0, 0.1]), limit=1)
+    assert matches[0][0] == str(first)
+    
+    products.delete_one({"_id": second})
+    source.emit("products", "delete", second)
+    assert len(database_manager.vector_index) == 1
@@ -0,0 +1,138 @@
+"""
+Tests for the shared fashion model pool and the ML service built on it
+"""
+
+import io
+import sys
+import asyncio
+import logging
+import importlib
+import threading
+
+import pytest
+from PIL import Image
+
+from backend.services.model_pool import FashionModelPool, to_manvue_probabilities
+from backend.utils.image_context import ImageContext
+
+LABELS = ["T-Shirt", "Trouser", "Bag"]
+
+
+def _context() -> ImageContext:
+    output = io.BytesIO()
+    Image.new("RGB", (64, 64), (10, 120, 200)).save(output, format="PNG")
+    return ImageContext.from_data(output.getvalue())
+
+
+class GatedModel:
+    """Fake zero-shot model whose predictions block while the gate is closed"""
+    
+    def __init__(self):
+        self.gate = threading.Event()
+        self.gate.set()
+        self.busy = threading.Event()
+    
+    def predict_batch(self, images):
+        self.busy.set()
+        self.gate.wait(5)
+        return [{"T-Shirt": 0.7, "Trouser": 0.2, "Bag": 0.1} for _ in images]
+
+
+@pytest.fixture
+def gated_pool():
+    model = GatedModel()
+    
+    class GatedPool(FashionModelPool):
+        def _load(self):
+            self.backend = "clip"
+            return model
+    
+    pool = GatedPool(LABELS, backend="clip", max_batch_size=4, max_wait_ms=1)
+    pool.start()
+    assert pool.handle.get(5) is model
+    yield pool, model
+    model.gate.set()
+    pool.close()
+
+
+def test_classifier_probabilities_are_renormalised_without_dress():
+    probabilities = {"T-shirt/top": 0.3, "Dress": 0.5, "Trouser": 0.1, "Bag": 0.1}
+    
+    mapped = to_manvue_probabilities(probabilities)
+    
+    assert set(mapped) == {"T-Shirt", "Trouser", "Bag"}
+    assert sum(mapped.values()) == pytest.approx(1.0)
+    assert mapped["T-Shirt"] == pytest.approx(0.6)
+    assert to_manvue_probabilities({"Dress": 1.0}) == {}
+
+
+def test_timed_out_predictions_do_not_stop_the_batcher(gated_pool):
+    pool, model = gated_pool
+    context = _context()
+    
+    async def scenario():
+        model.gate.clear()
+        model.busy.clear()
+        # Times out while its batch is running, then again while queued behind it
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.predict(context, timeout=0.05)
+        assert model.busy.is_set()
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.predict(context, timeout=0.05)
+        model.gate.set()
+        return await pool.predict(context, timeout=5)
+    
+    assert asyncio.run(scenario()) == {"T-Shirt": 0.7, "Trouser": 0.2, "Bag": 0.1}
+    assert asyncio.run(pool.predict(context, timeout=5))["T-Shirt"] == 0.7
+
+
+def test_unloadable_classifier_falls_back_to_shared_clip(offline_clip, tmp_path, caplog):
+    from backend.utils import clip_encoder
+    
+    (tmp_path / "fashion_classifier.onnx").write_bytes(b"not an onnx model")
+    pool = FashionModelPool(LABELS, backend="auto", models_dir=str(tmp_path), max_batch_size=2)
+    
+    with caplog.at_level(logging.INFO, logger="backend.services.model_pool"):
+        pool.start()
+        classifier = pool.handle.get(60)
+    try:
+        assert pool.backend == "clip"
+        assert "failed to load" in caplog.text
+        assert "No trained fashion classifier found" not in caplog.text
+        # Visual search asks for the same model and gets the same instance
+        assert classifier.model is clip_encoder.get_shared_clip_model(clip_encoder.CLIP_MODEL_NAME)
+        
+        probabilities = asyncio.run(pool.predict(_context(), timeout=30))
+        assert set(probabilities) == set(LABELS)
+        assert sum(probabilities.values()) == pytest.approx(1.0, abs=1e-5)
+    finally:
+        pool.close()
+
+
+def test_missing_classifier_is_logged_as_not_found(offline_clip, tmp_path, caplog):
+    pool = FashionModelPool(LABELS, backend="auto", models_dir=str(tmp_path))
+    
+    with caplog.at_level(logging.INFO, logger="backend.services.model_pool"):
+        pool.start()
+        pool.handle.get(60)
+    pool.close()
+    
+    assert pool.backend == "clip"
+    assert "No trained fashion classifier found" in caplog.text
+
+
+def test_mock_predictions_use_category_map_labels(monkeypatch):
+    monkeypatch.setitem(
+        sys.modules, "backend.models.ml_models", importlib.import_module("backend.models_backup.ml_models")
+    )
+    from backend.services import ml_service
+    
+    service = ml_service.MLService.__new__(ml_service.MLService)
+    service.model_version = "test"
+    
+    response = service._get_mock_predictions()
+    
+    assert response.detected_items
+    for item in response.detected_items:
+        category = ml_service.MANVUE_CATEGORY_MAP[item.name]
+        assert (item.category, item.type) == (category["category"], category["type"])
@@ -0,0 +1,89 @@
+"""
+Tests for the in-process product vector index
+"""
+
+import numpy as np
+
+from backend.database import ProductVectorIndex
+
+def _vectors(count, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((count, dim)).astype(np.float32)
+
+def test_search_returns_nearest_first():
+    vectors = _vectors(20)
+    index = ProductVectorIndex()
+    index.build([(f"p{i}", vector) for i, vector in enumerate(vectors)])
+    
+    results = index.search(vectors[7], limit=3)
+    
+    assert results[0][0] == "p7"
+    assert abs(results[0][1] - 1.0) < 1e-5
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+def test_upsert_many_appends_with_amortised_growth():
+    vectors = _vectors(1000)
+    index = ProductVectorIndex()
+    index.build([])
+    
+    reallocations = 0
+    matrix = index._matrix
+    for start in range(0, 1000, 10):
+        index.upsert_many([(f"p{i}", vectors[i]) for i in range(start, start + 10)])
+        if index._matrix is not matrix:
+            reallocations += 1
+            matrix = index._matrix
+    
+    assert len(index) == 1000
+    # Doubling from MIN_CAPACITY: 64 -> 128 -> ... -> 1024
+    assert reallocations <= 5
+    assert index.search(vectors[999], limit=1)[0][0] == "p999"
+
+def test_upsert_replaces_existing_vector():
+    vectors = _vectors(3)
+    index = ProductVectorIndex()
+    index.build([("a", vectors[0]), ("b", vectors[1])])
+    
+    index.upsert("a", vectors[2])
+    
+    assert len(index) == 2
+    assert index.search(vectors[2], limit=1)[0][0] == "a"
+
+def test_upsert_skips_mismatched_dimensions():
+    index = ProductVectorIndex()
+    index.build([("a", _vectors(1, dim=8)[0])])
+    
+    index.upsert_many([("b", _vectors(1, dim=4)[0]), ("c", _vectors(1, dim=8, seed=1)[0])])
+    
+    assert len(index) == 2
+    assert {product_id for product_id, _ in index.search(_vectors(1, dim=8)[0], limit=5)} == {"a", "c"}
+
+def test_remove_moves_last_row_into_gap():
+    vectors = _vectors(5)
+    index = ProductVectorIndex()
+    index.build([(f"p{i}", vector) for i, vector in enumerate(vectors)])
+    
+    index.remove("p1")
+    index.remove("missing")
+    
+    assert len(index) == 4
+    assert "p1" not in {product_id for product_id, _ in index.search(vectors[1], limit=5)}
+    for i in (0, 2, 3, 4):
+        assert index.search(vectors[i], limit=1)[0][0] == f"p{i}"
+
+def test_bulk_save_indexes_only_accepted_products(database_manager):
+    products = database_manager.get_collection("products")
+    existing = products.insert_one({"name": "stored", "image_features": [1.0, 0.0, 0.0]}).inserted_id
+    database_manager._ensure_vector_index()
+    
+    # The duplicate is rejected by MongoDB; the new product goes in
+    result = database_manager.save_products_bulk([
+        {"_id": existing, "name": "duplicate", "image_features": [0.0, 1.0, 0.0]},
+        {"name": "new", "image_features": [0.0, 0.0, 1.0]},
+    ])
+    
+    assert result["inserted_count"] == 1
+    assert [failure["index"] for failure in result["failed"]] == [0]
+    assert len(database_manager.vector_index) == 2
+    assert database_manager.vector_index.search(np.array([1.0, 0.0, 0.0]), limit=1)[0][0] == str(existing)
+    assert database_manager.vector_index.search(np.array([0.0, 1.0, 0.0]), limit=1)[0][1] < 0.5
@@ -0,0 +1,157 @@
+"""
+Tests for the write-behind buffer used for analytics writes
+"""
+
+import io
+import hashlib
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+from pymongo.errors import BulkWriteError
+
+from backend.database import WriteBehindBuffer
+from backend.services.enhanced_ml_service import EnhancedMLService
+from backend.utils.image_context import ImageContext
+
+class FakeCollection:
+    def __init__(self, fail_indexes=()):
+        self.documents = []
+        self.fail_indexes = set(fail_indexes)
+    
+    def insert_many(self, documents, ordered=True):
+        if self.fail_indexes:
+            errors = [{"index": i, "code": 11000, "errmsg": "duplicate"} for i in sorted(self.fail_indexes)]
+            self.documents.extend(d for i, d in enumerate(documents) if i not in self.fail_indexes)
+            raise BulkWriteError({"writeErrors": errors})
+        self.documents.extend(documents)
+
+class FakeDatabase(dict):
+    def __missing__(self, name):
+        collection = self[name] = FakeCollection()
+        return collection
+
+@pytest.fixture
+def db():
+    return FakeDatabase()
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_flushes_when_batch_is_full(db):
+    buffer = WriteBehindBuffer(db, max_batch_size=3, flush_interval=60)
+    try:
+        for i in range(3):
+            assert buffer.enqueue("queries", {"n": i})
+        assert _wait_for(lambda: len(db["queries"].documents) == 3)
+        assert buffer.stats["written"] == 3
+    finally:
+        buffer.close()
+
+def test_flushes_on_interval(db):
+    buffer = WriteBehindBuffer(db, max_batch_size=100, flush_interval=0.05)
+    try:
+        buffer.enqueue("queries", {"n": 1})
+        assert _wait_for(lambda: len(db["queries"].documents) == 1)
+    finally:
+        buffer.close()
+
+def test_close_flushes_pending_documents_and_tasks(db):
+    ran = []
+    buffer = WriteBehindBuffer(db, max_batch_size=100, flush_interval=60)
+    buffer.enqueue("queries", {"n": 1})
+    buffer.submit(ran.append, "task")
+    buffer.close()
+    
+    assert db["queries"].documents == [{"n": 1}]
+    assert ran == ["task"]
+    # Closed buffers drop new work instead of queueing it forever
+    assert buffer.enqueue("queries", {"n": 2}) is False
+    assert buffer.stats["dropped"] == 1
+
+def test_drops_beyond_max_pending(db):
+    buffer = WriteBehindBuffer(db, max_batch_size=100, flush_interval=60, max_pending=2)
+    try:
+        assert buffer.enqueue("queries", {"n": 1})
+        assert buffer.submit(lambda: None)
+        assert buffer.enqueue("queries", {"n": 3}) is False
+        assert buffer.stats["dropped"] == 1
+    finally:
+        buffer.close()
+
+def test_drops_beyond_max_pending_bytes(db):
+    stored = []
+    buffer = WriteBehindBuffer(db, max_batch_size=100, flush_interval=60, max_pending_bytes=1000)
+    try:
+        assert buffer.submit(stored.append, b"a" * 600, nbytes=600)
+        assert buffer.submit(stored.append, b"b" * 600, nbytes=600) is False
+        # The byte budget is released once pending work is flushed
+        buffer.flush()
+        assert buffer.submit(stored.append, b"c" * 600, nbytes=600)
+    finally:
+        buffer.close()
+    
+    assert [data[:1] for data in stored] == [b"a", b"c"]
+    assert buffer.stats["dropped"] == 1
+
+def test_failed_writes_are_counted_not_raised(db):
+    db["queries"] = FakeCollection(fail_indexes=[1])
+    
+    def failing_task():
+        raise RuntimeError("gridfs down")
+    
+    buffer = WriteBehindBuffer(db, max_batch_size=100, flush_interval=60)
+    try:
+        for i in range(3):
+            buffer.enqueue("queries", {"n": i})
+        buffer.submit(failing_task)
+        buffer.flush()
+        
+        assert [d["n"] for d in db["queries"].documents] == [0, 2]
+        assert buffer.stats["written"] == 2
+        assert buffer.stats["failed"] == 2
+    finally:
+        buffer.close()
+
+def test_concurrent_producers_lose_nothing(db):
+    buffer = WriteBehindBuffer(db, max_batch_size=50, flush_interval=0.01)
+    
+    def produce(worker):
+        for i in range(200):
+            buffer.enqueue("queries", {"worker": worker, "n": i})
+    
+    threads = [threading.Thread(target=produce, args=(w,)) for w in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    buffer.close()
+    
+    assert len(db["queries"].documents) == 800
+    assert buffer.stats["dropped"] == 0
+
+def test_user_upload_is_stored_with_the_file_hash(db):
+    encoded = io.BytesIO()
+    Image.new("RGB", (64, 48), (200, 30, 30)).save(encoded, format="PNG")
+    context = ImageContext(encoded.getvalue())
+    stored = []
+    
+    service = EnhancedMLService.__new__(EnhancedMLService)
+    service.settings = SimpleNamespace(store_full_user_uploads=False, user_upload_thumbnail_size=32)
+    service.find_similar_products = lambda image, top_k: []
+    service.fs = SimpleNamespace(put=lambda data, **kwargs: stored.append(kwargs["metadata"]))
+    service.write_buffer = WriteBehindBuffer(db, max_batch_size=100, flush_interval=60)
+    try:
+        assert service.upload_user_image_and_search(context, username="ann")["success"]
+    finally:
+        service.write_buffer.close()
+    
+    assert stored[0]["content_hash"] == hashlib.sha256(encoded.getvalue()).hexdigest()
+    assert stored[0]["original_size"] == [64, 48]
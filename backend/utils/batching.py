@@ -0,0 +1,136 @@
+"""
+Request batching utilities for fashion recommender
+Coalesces concurrent single-item model calls into one batched call
+"""
+
+import queue
+import logging
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, TimeoutError
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class DynamicBatcher:
+    """
+    Groups items submitted from concurrent request threads into batches
+    
+    A single worker thread takes the first waiting item, then keeps collecting
+    until ``max_batch_size`` items are queued or ``max_wait_ms`` has passed,
+    and hands the whole batch to ``batch_fn``. Under light load a request waits
+    at most ``max_wait_ms``; under heavy load batches fill up immediately.
+    """
+    
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        name: str = "batcher"
+    ):
+        """
+        Args:
+            batch_fn: Maps a list of items to a list of results in the same order
+            max_batch_size: Largest batch passed to ``batch_fn``
+            max_wait_ms: How long the first item of a batch waits for company
+            name: Worker thread name
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._stop_event = threading.Event()
+        self.stats = {"batches": 0, "items": 0, "max_batch": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+    
+    def submit(self, item: Any) -> Future:
+        """Queue one item; the future resolves to its result"""
+        if self._stop_event.is_set():
+            raise RuntimeError("Batcher is closed")
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+    
+    def __call__(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """Submit one item and block until its result is ready"""
+        future = self.submit(item)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            # Nobody will read the result; skip the item unless its batch already started
+            future.cancel()
+            raise
+    
+    def _collect(self) -> List[tuple]:
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # Whatever is already queued joins immediately; otherwise wait out the deadline
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                batch = self._collect()
+                if batch:
+                    self._process(batch)
+            except Exception as e:
+                # The worker must outlive any one batch, or every later submit hangs
+                logger.error(f"❌ Batcher worker error: {e}")
+    
+    def _process(self, batch: List[tuple]):
+        # Callers that timed out or were cancelled while queued are skipped, not computed
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        
+        items = [item for item, _ in batch]
+        try:
+            results = self.batch_fn(items)
+            if len(results) != len(items):
+                raise RuntimeError(f"Batch function returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"❌ Batched call failed for {len(items)} items: {e}")
+            for _, future in batch:
+                self._resolve(future, error=e)
+        else:
+            for (_, future), result in zip(batch, results):
+                self._resolve(future, result)
+        
+        self.stats["batches"] += 1
+        self.stats["items"] += len(items)
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(items))
+    
+    @staticmethod
+    def _resolve(future: Future, result: Any = None, error: Optional[BaseException] = None):
+        """Settle one future without letting its state affect the rest of the batch"""
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            logger.debug("Batched request was already resolved")
+    
+    def close(self):
+        """Stop the worker after the batch in progress"""
+        self._stop_event.set()
+        self._thread.join(timeout=5)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Batch counts and the average batch size so far"""
+        stats = dict(self.stats)
+        stats["avg_batch"] = stats["items"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
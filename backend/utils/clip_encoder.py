@@ -0,0 +1,378 @@
+"""
+CLIP image encoder utilities for fashion recommender
+CPU tuning (threads, dynamic int8 quantization), batch preprocessing, accuracy checks
+and zero-shot classification for the CLIP image encoder
+"""
+
+import io
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import torch
+from PIL import Image
+
+try:
+    # CLIPProcessor's own conversion, so transparent, palette and grayscale images match it
+    from transformers.image_transforms import convert_to_rgb
+except ImportError:
+    convert_to_rgb = None
+
+logger = logging.getLogger(__name__)
+
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+
+# CLIPImageProcessor defaults for ViT-B/32: shortest edge resized to 224, then a 224x224 centre crop
+CLIP_IMAGE_SIZE = 224
+CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+RESCALE_FACTOR = 1 / 255
+
+_normalize_luts: Dict[Tuple[Tuple[float, ...], Tuple[float, ...]], np.ndarray] = {}
+_shared_models: Dict[Tuple[str, str, bool], torch.nn.Module] = {}
+_shared_models_lock = threading.Lock()
+
+def _get_normalize_lut(mean: Sequence[float], std: Sequence[float]) -> np.ndarray:
+    """
+    Flat 3x256 float32 table of the normalized value of every uint8 level per channel
+    
+    Computed with the processor's own arithmetic (float64 rescale cast to
+    float32, then float32 (x - mean) / std), so a lookup is bit-identical to it.
+    """
+    key = (tuple(mean), tuple(std))
+    lut = _normalize_luts.get(key)
+    if lut is None:
+        levels = (np.arange(256, dtype=np.float64) * RESCALE_FACTOR).astype(np.float32)
+        mean32 = np.array(mean, dtype=np.float32)[:, np.newaxis]
+        std32 = np.array(std, dtype=np.float32)[:, np.newaxis]
+        lut = _normalize_luts[key] = ((levels[np.newaxis] - mean32) / std32).ravel()
+    return lut
+
+def _resize_and_crop(image: Image.Image, image_size: int, reducing_gap: Optional[float]) -> np.ndarray:
+    """Bicubic resize of the shortest edge to ``image_size`` and a centre crop, as HxWx3 uint8"""
+    if image.mode != "RGB":
+        image = convert_to_rgb(image) if convert_to_rgb else image.convert("RGB")
+    width, height = image.size
+    # Same output size rule as transformers' get_resize_output_image_size (long side truncated)
+    if width <= height:
+        size = (image_size, int(image_size * height / width))
+    else:
+        size = (int(image_size * width / height), image_size)
+    if size != image.size:
+        image = image.resize(size, Image.Resampling.BICUBIC, reducing_gap=reducing_gap)
+    
+    pixels = np.asarray(image)
+    top = (pixels.shape[0] - image_size) // 2
+    left = (pixels.shape[1] - image_size) // 2
+    return pixels[top:top + image_size, left:left + image_size]
+
+def preprocess_clip_images(
+    images: List[Image.Image],
+    image_size: int = CLIP_IMAGE_SIZE,
+    mean: Sequence[float] = CLIP_MEAN,
+    std: Sequence[float] = CLIP_STD,
+    reducing_gap: Optional[float] = None
+) -> torch.Tensor:
+    """
+    CLIP pixel values for a batch of images, without CLIPProcessor
+    
+    Each image is resized and centre-cropped with PIL's bicubic resampler
+    (the only per-image step); rescaling, normalization and the HWC->CHW
+    transpose then run as one table lookup over the whole uint8 batch.
+    
+    Args:
+        images: Decoded PIL images
+        image_size: Shortest edge after resizing, and the crop size
+        mean: Per-channel normalization mean
+        std: Per-channel normalization std
+        reducing_gap: PIL's fast pre-reduction for large images; None (the
+            default) matches CLIPProcessor exactly, 2.0-3.0 is faster on large
+            uploads at the cost of tiny pixel differences
+    
+    Returns:
+        Nx3xHxW float32 tensor, identical to
+        ``CLIPProcessor(images=images, return_tensors="pt")["pixel_values"]``
+        when ``reducing_gap`` is None
+    """
+    batch = np.stack([_resize_and_crop(image, image_size, reducing_gap) for image in images])
+    # Offset each channel into its own 256-entry block of the flat table
+    indices = batch.transpose(0, 3, 1, 2).astype(np.uint16)
+    indices += (np.arange(3, dtype=np.uint16) * 256)[np.newaxis, :, np.newaxis, np.newaxis]
+    return torch.from_numpy(np.take(_get_normalize_lut(mean, std), indices))
+
+def verify_preprocessing(processor: Any, images: List[Image.Image]) -> Dict[str, Any]:
+    """
+    Compare ``preprocess_clip_images`` against a CLIPProcessor on the same images
+    
+    Args:
+        processor: transformers CLIPProcessor (or CLIPImageProcessor)
+        images: Sample images, ideally of varied sizes, aspect ratios and modes
+    
+    Returns:
+        Whether the tensors are identical, the largest absolute difference and
+        the time each path took
+    """
+    image_processor = getattr(processor, "image_processor", processor)
+    crop = image_processor.crop_size
+    # A dict before transformers 5, a SizeDict after
+    crop_size = crop["height"] if isinstance(crop, dict) else getattr(crop, "height", crop)
+    
+    start = time.perf_counter()
+    expected = processor(images=images, return_tensors="pt")["pixel_values"]
+    processor_ms = (time.perf_counter() - start) * 1000
+    
+    start = time.perf_counter()
+    actual = preprocess_clip_images(
+        images, crop_size, mean=image_processor.image_mean, std=image_processor.image_std
+    )
+    vectorized_ms = (time.perf_counter() - start) * 1000
+    
+    same_shape = tuple(actual.shape) == tuple(expected.shape)
+    return {
+        "identical": same_shape and torch.equal(actual, expected),
+        "max_abs_diff": float((actual - expected).abs().max()) if same_shape else None,
+        "processor_ms": processor_ms,
+        "vectorized_ms": vectorized_ms,
+        "speedup": processor_ms / vectorized_ms if vectorized_ms else None
+    }
+
+def configure_torch_threads(num_threads: Optional[int] = None, interop_threads: Optional[int] = None) -> Dict[str, int]:
+    """
+    Pin torch's CPU thread pools for this worker
+    
+    With several workers per node, each defaulting to every core, the pools
+    oversubscribe the CPU; give each worker its share instead.
+    
+    Args:
+        num_threads: Intra-op threads (matrix multiplies); None leaves torch's default
+        interop_threads: Inter-op threads; only settable before torch runs any parallel work
+    
+    Returns:
+        The thread counts now in effect
+    """
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            # Already fixed by earlier parallel work in this process
+            logger.warning(f"⚠️ Could not set torch inter-op threads: {e}")
+    return {
+        "intra_op": torch.get_num_threads(),
+        "inter_op": torch.get_num_interop_threads()
+    }
+
+def quantize_clip_model(model: torch.nn.Module) -> torch.nn.Module:
+    """
+    Dynamic int8 quantization of every Linear layer (CPU only)
+    
+    Weights are stored as int8 and activations quantized on the fly, so the
+    attention and MLP projections that dominate ViT-B/32 run on int8 kernels.
+    Convolutions, layer norms and embeddings stay in float32.
+    """
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def load_clip_model(
+    model_name: str = CLIP_MODEL_NAME,
+    device: str = "cpu",
+    quantize: bool = False
+) -> torch.nn.Module:
+    """
+    Load CLIP for inference, optionally quantized
+    
+    Args:
+        model_name: HuggingFace model id
+        device: Torch device; quantization is skipped off CPU
+        quantize: Apply dynamic int8 quantization to Linear layers
+    
+    Returns:
+        The model in eval mode
+    """
+    from transformers import CLIPModel
+    
+    model = CLIPModel.from_pretrained(model_name).eval()
+    if quantize:
+        if device == "cpu":
+            model = quantize_clip_model(model)
+        else:
+            logger.warning(f"⚠️ Dynamic quantization is CPU-only, keeping float32 on {device}")
+    return model.to(device)
+
+def get_shared_clip_model(
+    model_name: str = CLIP_MODEL_NAME,
+    device: str = "cpu",
+    quantize: bool = False
+) -> torch.nn.Module:
+    """
+    Process-wide CLIP model for these settings, loaded on first use
+    
+    Visual search and zero-shot classification run the same weights, so they
+    share one instance instead of each holding a copy in memory. Arguments are
+    as for ``load_clip_model``.
+    """
+    key = (model_name, device, quantize and device == "cpu")
+    # Held across the load so concurrent first callers wait rather than load twice
+    with _shared_models_lock:
+        model = _shared_models.get(key)
+        if model is None:
+            model = _shared_models[key] = load_clip_model(model_name, device, quantize=quantize)
+    return model
+
+def encode_images(model: torch.nn.Module, pixel_values: torch.Tensor) -> np.ndarray:
+    """L2-normalized image embeddings for a preprocessed Nx3xHxW batch"""
+    with torch.inference_mode():
+        features = _projected(model.get_image_features(pixel_values=pixel_values))
+        features = features / features.norm(p=2, dim=-1, keepdim=True)
+    return features.cpu().numpy().astype("float32")
+
+def _projected(output: Any) -> torch.Tensor:
+    """Projected embeddings from get_image/text_features (a tensor before transformers 5, a model output after)"""
+    return output if isinstance(output, torch.Tensor) else output.pooler_output
+
+def model_size_mb(model: torch.nn.Module) -> float:
+    """Serialized state dict size in MB (quantized weights are packed, so parameters() undercounts)"""
+    buf = io.BytesIO()
+    torch.save(model.state_dict(), buf)
+    return buf.tell() / 1e6
+
+def time_encoder(model: torch.nn.Module, pixel_values: torch.Tensor, iterations: int = 10) -> Dict[str, float]:
+    """Latency percentiles and throughput of ``encode_images`` on one batch"""
+    encode_images(model, pixel_values)  # warm-up
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        encode_images(model, pixel_values)
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    return {
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "images_per_s": len(pixel_values) / (np.median(timings) / 1000)
+    }
+
+def encoder_agreement(
+    reference: np.ndarray,
+    candidate: np.ndarray,
+    catalog: Any = None,
+    k: int = 10
+) -> Dict[str, Any]:
+    """
+    How closely a candidate encoder reproduces the reference one
+    
+    Args:
+        reference: NxD normalized embeddings from the float32 encoder
+        candidate: NxD normalized embeddings of the same images from the optimized encoder
+        catalog: FAISS index or MxD embedding matrix searched by both; defaults to ``reference``
+        k: Neighbours compared for recall@k
+    
+    Returns:
+        Mean/min cosine similarity between paired embeddings and mean recall@k of
+        the candidate's top-k against the reference's top-k
+    """
+    cosine = np.sum(reference * candidate, axis=1)
+    
+    if catalog is None:
+        catalog = reference
+    if hasattr(catalog, "search"):
+        k = min(k, catalog.ntotal)
+        _, reference_ids = catalog.search(np.ascontiguousarray(reference), k)
+        _, candidate_ids = catalog.search(np.ascontiguousarray(candidate), k)
+    else:
+        k = min(k, len(catalog))
+        reference_ids = np.argsort(-(reference @ catalog.T), axis=1)[:, :k]
+        candidate_ids = np.argsort(-(candidate @ catalog.T), axis=1)[:, :k]
+    
+    recall = np.mean([
+        len(set(ref_row.tolist()) & set(cand_row.tolist())) / k
+        for ref_row, cand_row in zip(reference_ids, candidate_ids)
+    ])
+    return {
+        "cosine_mean": float(cosine.mean()),
+        "cosine_min": float(cosine.min()),
+        "recall_at_k": float(recall),
+        "k": k
+    }
+
+# Prompt templates averaged into one text embedding per label
+ZERO_SHOT_TEMPLATES = (
+    "a photo of a {}.",
+    "a product photo of a {}.",
+    "a close-up photo of a {}.",
+)
+
+class CLIPZeroShotClassifier:
+    """
+    Fashion classifier that scores images against CLIP text embeddings of its labels
+    
+    Label embeddings are computed once at construction, so a prediction costs
+    one image-encoder pass plus a small matrix product.
+    """
+    
+    runtime = "clip-zero-shot"
+    
+    def __init__(
+        self,
+        labels: Sequence[str],
+        model_name: str = CLIP_MODEL_NAME,
+        device: str = "cpu",
+        quantize: bool = False,
+        templates: Sequence[str] = ZERO_SHOT_TEMPLATES
+    ):
+        """
+        Args:
+            labels: Class names, used verbatim as results and lower-cased in prompts
+            model_name: HuggingFace model id
+            device: Torch device
+            quantize: Dynamic int8 quantization of the model's Linear layers (CPU only)
+            templates: Prompt templates, each with one ``{}`` for the label
+        """
+        from transformers import CLIPTokenizer
+        
+        self.class_names = list(labels)
+        self.model_name = model_name
+        self.device = device
+        self.model = get_shared_clip_model(model_name, device, quantize=quantize)
+        self.logit_scale = float(self.model.logit_scale.exp())
+        
+        tokenizer = CLIPTokenizer.from_pretrained(model_name)
+        prompts = [template.format(label.lower()) for label in self.class_names for template in templates]
+        tokens = tokenizer(prompts, padding=True, return_tensors="pt").to(device)
+        with torch.inference_mode():
+            text = _projected(self.model.get_text_features(**tokens))
+            text = text / text.norm(p=2, dim=-1, keepdim=True)
+            text = text.reshape(len(self.class_names), len(templates), -1).mean(dim=1)
+            self.label_embeddings = text / text.norm(p=2, dim=-1, keepdim=True)
+    
+    def predict_batch(self, images: List[Image.Image]) -> List[Dict[str, float]]:
+        """
+        Class probabilities for several images in one forward pass
+        
+        Args:
+            images: Decoded PIL images
+        
+        Returns:
+            Label probabilities per image, in input order
+        """
+        if not images:
+            return []
+        pixel_values = preprocess_clip_images(images).to(self.device)
+        with torch.inference_mode():
+            features = _projected(self.model.get_image_features(pixel_values=pixel_values))
+            features = features / features.norm(p=2, dim=-1, keepdim=True)
+            probabilities = (self.logit_scale * features @ self.label_embeddings.T).softmax(dim=-1)
+        return [
+            {class_name: float(row[i]) for i, class_name in enumerate(self.class_names)}
+            for row in probabilities.cpu().numpy()
+        ]
+    
+    def get_model_info(self) -> Dict[str, Any]:
+        """Get model information"""
+        return {
+            "runtime": self.runtime,
+            "model_name": self.model_name,
+            "num_classes": len(self.class_names),
+            "class_names": self.class_names,
+            "device": self.device
+        }
@@ -0,0 +1,180 @@
+"""
+Colour analysis utilities for fashion recommender
+Dominant colours from a downsampled image via 3D histogram quantization
+"""
+
+import logging
+from typing import Dict, List, Any, Optional
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Fashion-oriented palette that dominant colours are named against
+NAMED_COLORS = {
+    "Black": (0, 0, 0),
+    "Charcoal": (54, 69, 79),
+    "Gray": (128, 128, 128),
+    "Silver": (192, 192, 192),
+    "White": (255, 255, 255),
+    "Cream": (255, 253, 208),
+    "Beige": (222, 198, 160),
+    "Khaki": (195, 176, 145),
+    "Brown": (120, 72, 40),
+    "Tan": (210, 180, 140),
+    "Maroon": (128, 0, 0),
+    "Red": (200, 30, 30),
+    "Pink": (240, 160, 180),
+    "Orange": (240, 130, 30),
+    "Mustard": (225, 173, 1),
+    "Yellow": (250, 220, 50),
+    "Olive": (107, 112, 40),
+    "Green": (40, 140, 60),
+    "Teal": (0, 128, 128),
+    "Light Blue": (150, 190, 230),
+    "Blue": (30, 80, 200),
+    "Navy": (20, 30, 80),
+    "Purple": (110, 50, 150),
+    "Lavender": (190, 170, 220),
+}
+
+# Colours are quantized to this many bits per channel for the histogram
+HISTOGRAM_BITS = 3
+# ... and to this many bits per channel for the colour-name lookup table
+NAME_LUT_BITS = 5
+
+_name_lut: Optional[np.ndarray] = None
+_color_names = list(NAMED_COLORS)
+
+def _get_name_lut() -> np.ndarray:
+    """32x32x32 table mapping a quantized RGB colour to its nearest named colour index"""
+    global _name_lut
+    if _name_lut is None:
+        levels = (np.arange(2 ** NAME_LUT_BITS, dtype=np.float32) + 0.5) * (256 >> NAME_LUT_BITS)
+        grid = np.stack(np.meshgrid(levels, levels, levels, indexing="ij"), axis=-1).reshape(-1, 1, 3)
+        palette = np.array(list(NAMED_COLORS.values()), dtype=np.float32).reshape(1, -1, 3)
+        # Weighted RGB distance approximates perceived difference better than plain Euclidean
+        weights = np.array([0.3, 0.59, 0.11], dtype=np.float32)
+        distances = (((grid - palette) ** 2) * weights).sum(axis=-1)
+        _name_lut = distances.argmin(axis=1).astype(np.uint8).reshape((2 ** NAME_LUT_BITS,) * 3)
+    return _name_lut
+
+def color_name(rgb) -> str:
+    """Nearest named colour for an RGB triple"""
+    shift = 8 - NAME_LUT_BITS
+    r, g, b = (int(channel) >> shift for channel in rgb)
+    return _color_names[_get_name_lut()[r, g, b]]
+
+def rgb_to_hex(rgb) -> str:
+    """Convert an RGB triple to a hex colour"""
+    return "#{:02x}{:02x}{:02x}".format(*(int(channel) for channel in rgb))
+
+def _foreground_mask(pixels: np.ndarray, width: int, height: int, threshold: float) -> Optional[np.ndarray]:
+    """
+    Mask out pixels close to the border colour (product shots on plain backgrounds)
+    
+    Returns None when the border is not uniform or the mask would drop most of the image.
+    """
+    grid = pixels.reshape(height, width, 3).astype(np.int32)
+    border = np.concatenate([grid[0], grid[-1], grid[:, 0], grid[:, -1]])
+    background = np.median(border, axis=0)
+    
+    # A busy border means there is no plain background to remove
+    if np.mean(np.abs(border - background).sum(axis=1) < threshold) < 0.6:
+        return None
+    
+    mask = np.abs(pixels.astype(np.int32) - background).sum(axis=1) >= threshold
+    return mask if mask.mean() >= 0.1 else None
+
+def dominant_colors(
+    image: Image.Image,
+    n_colors: int = 5,
+    sample_size: int = 96,
+    mask_background: bool = True,
+    merge_distance: float = 48.0
+) -> List[Dict[str, Any]]:
+    """
+    Find the dominant colours of an image
+    
+    The image is reduced to at most ``sample_size`` pixels per side, pixels are
+    binned into a 3D RGB histogram, and the most populated bins (merged when
+    their mean colours are close) become the palette. The result is
+    deterministic for a given image.
+    
+    Args:
+        image: Decoded PIL image
+        n_colors: Maximum number of colours returned
+        sample_size: Longest side of the analysed thumbnail
+        mask_background: Ignore a uniform border-coloured background
+        merge_distance: Sum of absolute channel differences under which bins are merged
+    
+    Returns:
+        List of dicts with rgb, hex, name and percentage, most dominant first
+    """
+    sample = image
+    if max(image.size) > sample_size:
+        # Shrink before any mode conversion so nothing touches the full-size pixels twice
+        scale = sample_size / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        sample = image.resize(size, Image.Resampling.BOX)
+    if sample.mode != "RGB":
+        sample = sample.convert("RGB")
+    
+    width, height = sample.size
+    pixels = np.asarray(sample, dtype=np.uint8).reshape(-1, 3)
+    
+    if mask_background:
+        mask = _foreground_mask(pixels, width, height, threshold=merge_distance)
+        if mask is not None:
+            pixels = pixels[mask]
+    
+    if not len(pixels):
+        return []
+    
+    # Bin index from the top HISTOGRAM_BITS bits of each channel
+    shift = 8 - HISTOGRAM_BITS
+    quantized = (pixels >> shift).astype(np.int32)
+    bins = (quantized[:, 0] << (2 * HISTOGRAM_BITS)) | (quantized[:, 1] << HISTOGRAM_BITS) | quantized[:, 2]
+    n_bins = 2 ** (3 * HISTOGRAM_BITS)
+    
+    counts = np.bincount(bins, minlength=n_bins)
+    sums = np.stack([
+        np.bincount(bins, weights=pixels[:, channel], minlength=n_bins)
+        for channel in range(3)
+    ], axis=1)
+    
+    # Greedily fold populated bins into at most max_clusters clusters, largest first
+    max_clusters = 4 * n_colors
+    counts_list = counts.tolist()
+    sums_list = sums.tolist()
+    clusters: List[List[float]] = []  # [summed r, summed g, summed b, count]
+    for index in np.argsort(-counts, kind="stable").tolist():
+        count = counts_list[index]
+        if count == 0:
+            break
+        r, g, b = sums_list[index]
+        mean = (r / count, g / count, b / count)
+        for cluster in clusters:
+            n = cluster[3]
+            if abs(cluster[0] / n - mean[0]) + abs(cluster[1] / n - mean[1]) + abs(cluster[2] / n - mean[2]) < merge_distance:
+                cluster[0] += r
+                cluster[1] += g
+                cluster[2] += b
+                cluster[3] += count
+                break
+        else:
+            if len(clusters) < max_clusters:
+                clusters.append([r, g, b, count])
+    
+    clusters.sort(key=lambda cluster: -cluster[3])
+    total = float(len(pixels))
+    palette = []
+    for r, g, b, count in clusters[:n_colors]:
+        rgb = [min(255, max(0, int(round(channel / count)))) for channel in (r, g, b)]
+        palette.append({
+            "rgb": rgb,
+            "hex": rgb_to_hex(rgb),
+            "name": color_name(rgb),
+            "percentage": count / total * 100
+        })
+    return palette
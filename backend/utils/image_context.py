@@ -0,0 +1,108 @@
+"""
+Request-scoped image context for fashion recommender
+Decodes an uploaded image once and derives model inputs from it on demand
+"""
+
+import base64
+import hashlib
+import logging
+from typing import Any, Dict, Optional, Tuple, Union
+import numpy as np
+from PIL import Image
+
+from .image_decode import decode_image, DEFAULT_MAX_PIXELS
+
+logger = logging.getLogger(__name__)
+
+# Largest input any consumer in the pipeline needs (classifier, CLIP, features)
+DEFAULT_MIN_SIZE = 224
+
+class ImageContext:
+    """
+    One uploaded image and everything derived from it during a request
+    
+    The encoded bytes are decoded the first time ``image`` is accessed; resized,
+    grayscale and normalized forms are produced on first access and then shared
+    by every consumer (classification, colour analysis, features, embeddings).
+    Not thread-safe: create one per request.
+    """
+    
+    def __init__(
+        self,
+        data: bytes,
+        min_size: Optional[int] = DEFAULT_MIN_SIZE,
+        max_pixels: int = DEFAULT_MAX_PIXELS
+    ):
+        """
+        Args:
+            data: Encoded image bytes
+            min_size: Smallest side any consumer needs; decoding may downscale to it.
+                None decodes at full resolution.
+            max_pixels: Decompression-bomb limit passed to the decoder
+        """
+        self.data = data
+        self.min_size = min_size
+        self.max_pixels = max_pixels
+        self._image: Optional[Image.Image] = None
+        self._content_hash: Optional[str] = None
+        self._derived: Dict[Tuple[Any, ...], Any] = {}
+    
+    @classmethod
+    def from_file(cls, file, **kwargs) -> "ImageContext":
+        """Read an uploaded file stream once, rewinding it if something already read it"""
+        if hasattr(file, 'seek'):
+            file.seek(0)
+        return cls(file.read(), **kwargs)
+    
+    @classmethod
+    def from_data(cls, image_data: Union[str, bytes, "ImageContext"], **kwargs) -> "ImageContext":
+        """Wrap raw bytes or base64 (optionally a data URL); an existing context is returned as is"""
+        if isinstance(image_data, ImageContext):
+            return image_data
+        if isinstance(image_data, str):
+            image_data = base64.b64decode(image_data[image_data.find(',') + 1:])
+        return cls(image_data, **kwargs)
+    
+    @property
+    def content_hash(self) -> str:
+        """sha256 of the encoded bytes (usable as a cache key without decoding)"""
+        if self._content_hash is None:
+            self._content_hash = hashlib.sha256(self.data).hexdigest()
+        return self._content_hash
+    
+    @property
+    def image(self) -> Image.Image:
+        """Decoded, EXIF-oriented RGB image"""
+        if self._image is None:
+            self._image = decode_image(self.data, target_size=self.min_size, max_pixels=self.max_pixels)
+        return self._image
+    
+    def _get(self, key: Tuple[Any, ...], factory):
+        value = self._derived.get(key)
+        if value is None:
+            value = self._derived[key] = factory()
+        return value
+    
+    @property
+    def rgb_array(self) -> np.ndarray:
+        """HxWx3 uint8 array of the decoded image"""
+        return self._get(("rgb",), lambda: np.asarray(self.image))
+    
+    def resized(self, size: Tuple[int, int] = (DEFAULT_MIN_SIZE, DEFAULT_MIN_SIZE)) -> Image.Image:
+        """Decoded image resized (not cropped) to ``size``"""
+        return self._get(("resized", tuple(size)), lambda: self.image.resize(tuple(size)))
+    
+    def resized_array(self, size: Tuple[int, int] = (DEFAULT_MIN_SIZE, DEFAULT_MIN_SIZE)) -> np.ndarray:
+        """uint8 array of ``resized(size)``"""
+        return self._get(("resized_array", tuple(size)), lambda: np.array(self.resized(size)))
+    
+    def grayscale(self, size: Tuple[int, int] = (DEFAULT_MIN_SIZE, DEFAULT_MIN_SIZE)) -> np.ndarray:
+        """uint8 luminance array of ``resized(size)``"""
+        return self._get(("grayscale", tuple(size)), lambda: np.array(self.resized(size).convert('L')))
+    
+    def normalized(self, size: Tuple[int, int] = (DEFAULT_MIN_SIZE, DEFAULT_MIN_SIZE)) -> np.ndarray:
+        """1xHxWx3 float32 array in [0, 1], the classifier input"""
+        return self._get(
+            ("normalized", tuple(size)),
+            lambda: (self.resized_array(size).astype(np.float32) / 255.0)[np.newaxis]
+        )
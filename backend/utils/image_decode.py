@@ -0,0 +1,79 @@
+"""
+Image decode utilities for fashion recommender
+Decodes uploaded photos straight to (near) model input size with EXIF orientation applied
+"""
+
+import io
+import logging
+from typing import Optional, Tuple, Union
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Roughly a 40MP photo; anything larger is rejected before any pixel data is decoded
+DEFAULT_MAX_PIXELS = 40_000_000
+
+class ImageTooLargeError(ValueError):
+    """Raised when an image's declared dimensions exceed the decode pixel budget"""
+
+def _as_size(target_size: Union[int, Tuple[int, int], None]) -> Optional[Tuple[int, int]]:
+    if target_size is None:
+        return None
+    if isinstance(target_size, int):
+        return (target_size, target_size)
+    return tuple(target_size)
+
+def decode_image(
+    data: bytes,
+    target_size: Union[int, Tuple[int, int], None] = None,
+    max_pixels: int = DEFAULT_MAX_PIXELS,
+    mode: str = "RGB"
+) -> Image.Image:
+    """
+    Decode image bytes, downscaling during decode where the format allows it
+    
+    The result is never smaller than ``target_size`` in either dimension (unless
+    the source is), so a model's own resize/center-crop still sees enough pixels.
+    
+    Args:
+        data: Encoded image bytes
+        target_size: Smallest (width, height) the caller needs, or an int for a square;
+            None decodes at full resolution
+        max_pixels: Reject images whose header declares more pixels than this
+        mode: PIL mode of the returned image
+    
+    Returns:
+        Decoded, EXIF-oriented PIL Image in ``mode``
+    """
+    try:
+        # Only the header is read here, so oversized images are rejected before decoding
+        image = Image.open(io.BytesIO(data))
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e))
+    
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageTooLargeError(
+            f"Image is {width}x{height} ({width * height} pixels), limit is {max_pixels}"
+        )
+    
+    target = _as_size(target_size)
+    
+    if target and image.format == "JPEG":
+        # EXIF orientation 5-8 swaps the axes, so the draft request has to be swapped too
+        orientation = image.getexif().get(0x0112, 1)
+        draft_size = (target[1], target[0]) if orientation in (5, 6, 7, 8) else target
+        # DCT scaling: decode at 1/2, 1/4 or 1/8 scale, staying >= target in both dimensions
+        image.draft("RGB", draft_size)
+    
+    image = ImageOps.exif_transpose(image)
+    if image.mode != mode:
+        image = image.convert(mode)
+    
+    if target:
+        # Formats without reduced-resolution decoding get a cheap box reduction instead
+        factor = min(image.width // target[0], image.height // target[1])
+        if factor >= 2:
+            image = image.reduce(factor)
+    
+    return image
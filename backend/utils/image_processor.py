@@ -5,86 +5,60 @@ Handles image preprocessing, feature extraction, and color analysis
 
 import cv2
 import numpy as np
-from PIL import Image
-import io
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Tuple, Any, Optional
 import logging
 
+from .image_context import ImageContext
+from .color_analysis import dominant_colors
+
 logger = logging.getLogger(__name__)
 
+# Longest side of the thumbnail colours are measured on
+COLOR_SAMPLE_SIZE = 96
+
 class ImageProcessor:
     """Image processing utilities for fashion items"""
     
     def __init__(self, target_size: Tuple[int, int] = (224, 224)):
         self.target_size = target_size
     
+    @staticmethod
+    def image_context(source, min_size: Optional[int] = None) -> ImageContext:
+        """Reuse an ImageContext, or read an uploaded file into a new one"""
+        if isinstance(source, ImageContext):
+            return source
+        return ImageContext.from_file(source, min_size=min_size)
+    
     def process_uploaded_image(self, file) -> np.ndarray:
-        """Process uploaded image file for ML prediction"""
+        """Process uploaded image file (or ImageContext) for ML prediction"""
         try:
-            # Read image from file
-            image_data = file.read()
-            image = Image.open(io.BytesIO(image_data))
-            
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Resize image
-            image = image.resize(self.target_size)
+            context = self.image_context(file, min_size=max(self.target_size))
             
-            # Convert to numpy array and normalize
-            image_array = np.array(image) / 255.0
-            
-            # Add batch dimension
-            image_array = np.expand_dims(image_array, axis=0)
-            
-            return image_array
+            # Resized, normalized and with a batch dimension
+            return context.normalized(self.target_size)
             
         except Exception as e:
             logger.error(f"Error processing uploaded image: {e}")
             raise
     
-    def analyze_colors(self, file) -> Dict[str, Any]:
-        """Analyze dominant colors in the image"""
+    def analyze_colors(self, file, n_colors: int = 5, mask_background: bool = True) -> Dict[str, Any]:
+        """Analyze dominant colors in the image (file or ImageContext)"""
         try:
-            # Read image
-            image_data = file.read()
-            image = Image.open(io.BytesIO(image_data))
-            image = image.convert('RGB')
-            
-            # Convert to numpy array
-            image_array = np.array(image)
-            
-            # Reshape image to be a list of pixels
-            pixels = image_array.reshape(-1, 3)
-            
-            # Use K-means to find dominant colors
-            from sklearn.cluster import KMeans
+            # On its own, colour analysis only needs a thumbnail, so decode straight to (near) that size
+            context = self.image_context(file, min_size=COLOR_SAMPLE_SIZE)
             
-            kmeans = KMeans(n_clusters=5, random_state=42)
-            kmeans.fit(pixels)
-            
-            # Get dominant colors
-            dominant_colors = kmeans.cluster_centers_.astype(int)
-            
-            # Calculate color distribution
-            labels = kmeans.labels_
-            color_counts = np.bincount(labels)
-            color_percentages = color_counts / len(labels) * 100
-            
-            # Create color palette
-            color_palette = []
-            for i, color in enumerate(dominant_colors):
-                color_palette.append({
-                    'rgb': color.tolist(),
-                    'hex': self._rgb_to_hex(color),
-                    'percentage': float(color_percentages[i])
-                })
+            # Histogram quantization on the downsampled pixels
+            color_palette = dominant_colors(
+                context.image,
+                n_colors=n_colors,
+                sample_size=COLOR_SAMPLE_SIZE,
+                mask_background=mask_background
+            )
             
             return {
-                'dominant_colors': dominant_colors.tolist(),
+                'dominant_colors': [color['rgb'] for color in color_palette],
                 'color_palette': color_palette,
-                'color_distribution': color_percentages.tolist()
+                'color_distribution': [color['percentage'] for color in color_palette]
             }
             
         except Exception as e:
@@ -96,19 +70,15 @@ class ImageProcessor:
             }
     
     def extract_features(self, file) -> np.ndarray:
-        """Extract features from image for similarity search"""
+        """Extract features from image (file or ImageContext) for similarity search"""
         try:
-            # Read and process image
-            image_data = file.read()
-            image = Image.open(io.BytesIO(image_data))
-            image = image.convert('RGB')
-            image = image.resize(self.target_size)
-            
-            # Convert to numpy array
-            image_array = np.array(image)
+            context = self.image_context(file, min_size=max(self.target_size))
             
             # Extract basic features (in production, use a pre-trained CNN)
-            features = self._extract_basic_features(image_array)
+            features = self._extract_basic_features(
+                context.resized_array(self.target_size),
+                gray=context.grayscale(self.target_size)
+            )
             
             return features
             
@@ -116,53 +86,70 @@ class ImageProcessor:
             logger.error(f"Error extracting features: {e}")
             return np.array([])
     
-    def _extract_basic_features(self, image: np.ndarray) -> np.ndarray:
+    def _extract_basic_features(self, image: np.ndarray, gray: Optional[np.ndarray] = None) -> np.ndarray:
         """Extract basic image features"""
         # Convert to grayscale for some features
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        if gray is None:
+            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
         
         # Extract texture features using LBP
         lbp = self._local_binary_pattern(gray)
         
-        # Extract color histogram
-        hist_r = cv2.calcHist([image], [0], None, [32], [0, 256])
-        hist_g = cv2.calcHist([image], [1], None, [32], [0, 256])
-        hist_b = cv2.calcHist([image], [2], None, [32], [0, 256])
+        # Extract color histogram (R, G and B, 32 bins each)
+        color_hist = np.concatenate([
+            cv2.calcHist([image], [channel], None, [32], [0, 256]).ravel() for channel in range(3)
+        ])
+        # L1-normalised like the LBP histogram, so raw pixel counts don't drown out texture
+        color_hist /= max(color_hist.sum(), 1.0)
         
         # Combine features
-        features = np.concatenate([
-            lbp.flatten(),
-            hist_r.flatten(),
-            hist_g.flatten(),
-            hist_b.flatten()
-        ])
+        features = np.concatenate([lbp.ravel(), color_hist])
         
         return features
     
     def _local_binary_pattern(self, image: np.ndarray, radius: int = 1, n_points: int = 8) -> np.ndarray:
-        """Calculate Local Binary Pattern"""
-        # Simple LBP implementation
+        """
+        Calculate a Local Binary Pattern histogram
+        
+        Each neighbour ring position is compared against the centre pixels as one
+        shifted-array comparison, with bilinear sampling for off-grid neighbours.
+        
+        Returns:
+            Normalized histogram of the 2**n_points LBP codes (fixed length for any image size)
+        """
+        image = image.astype(np.float32)
         rows, cols = image.shape
-        lbp = np.zeros_like(image)
+        if rows <= 2 * radius or cols <= 2 * radius:
+            return np.zeros(2 ** n_points, dtype=np.float32)
+        
+        def shifted(dy: int, dx: int) -> np.ndarray:
+            # Window of the image offset by (dy, dx) relative to the centre region
+            return image[radius + dy:rows - radius + dy, radius + dx:cols - radius + dx]
+        
+        center = shifted(0, 0)
+        codes = np.zeros(center.shape, dtype=np.uint32)
         
-        for i in range(radius, rows - radius):
-            for j in range(radius, cols - radius):
-                center = image[i, j]
-                binary_string = ''
-                
-                for k in range(n_points):
-                    angle = 2 * np.pi * k / n_points
-                    x = int(i + radius * np.cos(angle))
-                    y = int(j + radius * np.sin(angle))
-                    
-                    if x < rows and y < cols:
-                        binary_string += '1' if image[x, y] >= center else '0'
-                    else:
-                        binary_string += '0'
-                
-                lbp[i, j] = int(binary_string, 2)
+        for k in range(n_points):
+            angle = 2 * np.pi * k / n_points
+            # Rounding keeps on-grid neighbours (e.g. cos(pi/2)) from picking up float noise
+            y = round(radius * np.cos(angle), 6)
+            x = round(radius * np.sin(angle), 6)
+            y0, x0 = int(np.floor(y)), int(np.floor(x))
+            fy, fx = y - y0, x - x0
+            
+            neighbour = (1 - fy) * (1 - fx) * shifted(y0, x0)
+            if fx:
+                neighbour += (1 - fy) * fx * shifted(y0, x0 + 1)
+            if fy:
+                neighbour += fy * (1 - fx) * shifted(y0 + 1, x0)
+            if fy and fx:
+                neighbour += fy * fx * shifted(y0 + 1, x0 + 1)
+            
+            # First neighbour is the most significant bit
+            codes |= (neighbour >= center).astype(np.uint32) << (n_points - 1 - k)
         
-        return lbp
+        hist = np.bincount(codes.ravel(), minlength=2 ** n_points).astype(np.float32)
+        return hist / codes.size
     
     def _rgb_to_hex(self, rgb: np.ndarray) -> str:
         """Convert RGB array to hex color"""
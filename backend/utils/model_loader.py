@@ -4,34 +4,211 @@ Handles loading of pre-trained ML models
 """
 
 import os
+import time
 import logging
-from typing import Optional, Any
+import threading
+from typing import Optional, Any, Callable, Dict, Iterable, Tuple
 import numpy as np
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# File extension of each fashion classifier runtime, in the order "auto" tries them
+CLASSIFIER_RUNTIME_FILES = {
+    "tflite": ".tflite",
+    "onnx": ".onnx",
+    "keras": ".h5",
+}
+
+class LazyModel:
+    """Handle to a model that is loaded and warmed up on a background thread"""
+    
+    IDLE = "idle"
+    LOADING = "loading"
+    READY = "ready"
+    UNAVAILABLE = "unavailable"
+    FAILED = "failed"
+    
+    def __init__(self, name: str, load_fn: Callable[[], Optional[Any]], warmup_fn: Optional[Callable[[Any], None]] = None):
+        self.name = name
+        self._load_fn = load_fn
+        self._warmup_fn = warmup_fn
+        self._model = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self.state = self.IDLE
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+    
+    def start(self):
+        """Begin loading in the background (no-op once started)"""
+        with self._lock:
+            if self.state != self.IDLE:
+                return
+            self.state = self.LOADING
+        threading.Thread(target=self._load, name=f"load-{self.name}", daemon=True).start()
+    
+    def _load(self):
+        try:
+            start = time.perf_counter()
+            model = self._load_fn()
+            self.load_seconds = time.perf_counter() - start
+            if model is None:
+                self.state = self.UNAVAILABLE
+                return
+            
+            # Trace/compile before the model is marked ready so no request pays for it
+            if self._warmup_fn:
+                start = time.perf_counter()
+                self._warmup_fn(model)
+                self.warmup_seconds = time.perf_counter() - start
+            
+            self._model = model
+            self.state = self.READY
+            logger.info(f"✅ {self.name} ready (load {self.load_seconds:.2f}s, warm-up {self.warmup_seconds or 0:.2f}s)")
+        except Exception as e:
+            self.error = str(e)
+            self.state = self.FAILED
+            logger.error(f"❌ Error loading {self.name}: {e}")
+        finally:
+            self._done.set()
+    
+    def get(self, timeout: Optional[float] = 0) -> Optional[Any]:
+        """
+        Get the model, starting the load if needed
+        
+        Args:
+            timeout: Seconds to wait for a load in progress (0 returns immediately, None waits)
+        
+        Returns:
+            The ready model, or None if it is still loading or could not be loaded
+        """
+        self.start()
+        if timeout != 0:
+            self._done.wait(timeout)
+        return self._model
+    
+    @property
+    def ready(self) -> bool:
+        return self.state == self.READY
+    
+    def status(self) -> Dict[str, Any]:
+        """Load state and timings"""
+        return {
+            "state": self.state,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds
+        }
+
 class ModelLoader:
     """Utility class for loading ML models"""
     
-    def __init__(self, models_dir: str = "../models"):
+    def __init__(
+        self,
+        models_dir: str = "../models",
+        warmup_batch_sizes: Tuple[int, ...] = (1, 16),
+        classifier_runtime: str = "auto",
+        num_threads: Optional[int] = None
+    ):
         self.models_dir = Path(models_dir)
         self.models_dir.mkdir(exist_ok=True)
+        self.warmup_batch_sizes = warmup_batch_sizes
+        self.classifier_runtime = classifier_runtime
+        self.num_threads = num_threads
+        self._handles: Dict[str, LazyModel] = {}
+        self._handles_lock = threading.Lock()
+    
+    def _warmup_fashion_classifier(self, classifier):
+        """Run dummy batches so graph tracing and kernel setup happen before traffic"""
+        input_shape = tuple(classifier.input_shape)
+        for batch_size in self.warmup_batch_sizes:
+            classifier.predict_batch(np.zeros((batch_size,) + input_shape, dtype=np.float32))
+    
+    def lazy(self, name: str) -> LazyModel:
+        """
+        Get the lazy handle for a model: fashion_classifier, recommendation_model or color_analyzer
+        
+        Nothing is loaded until the handle's start() or get() is called.
+        """
+        loaders = {
+            "fashion_classifier": (self.load_fashion_classifier, self._warmup_fashion_classifier),
+            "recommendation_model": (self.load_recommendation_model, None),
+            "color_analyzer": (self.load_color_analyzer, None),
+        }
+        if name not in loaders:
+            raise ValueError(f"Unknown model: {name}")
+        
+        with self._handles_lock:
+            if name not in self._handles:
+                load_fn, warmup_fn = loaders[name]
+                self._handles[name] = LazyModel(name, load_fn, warmup_fn)
+            return self._handles[name]
+    
+    def preload(self, *names: str):
+        """Start background loading of the named models without blocking"""
+        for name in names:
+            self.lazy(name).start()
+    
+    def readiness(self) -> Dict[str, Dict[str, Any]]:
+        """Status of every model handle created so far"""
+        with self._handles_lock:
+            handles = dict(self._handles)
+        return {name: handle.status() for name, handle in handles.items()}
+    
+    def _resolve_classifier_runtime(self, runtime: str) -> Optional[Tuple[str, Path]]:
+        """Pick the runtime and file to load; "auto" prefers the cheapest export present"""
+        candidates = CLASSIFIER_RUNTIME_FILES if runtime == "auto" else {runtime: CLASSIFIER_RUNTIME_FILES[runtime]}
+        for name, extension in candidates.items():
+            model_path = self.models_dir / f"fashion_classifier{extension}"
+            if model_path.exists():
+                return name, model_path
+        return None
     
-    def load_fashion_classifier(self) -> Optional[Any]:
-        """Load the fashion classification model"""
+    def load_fashion_classifier(self, runtime: Optional[str] = None) -> Optional[Any]:
+        """
+        Load the fashion classification model
+        
+        Args:
+            runtime: "keras", "tflite", "onnx" or "auto" (defaults to the loader's classifier_runtime)
+        
+        Returns:
+            Classifier exposing predict / predict_batch / predict_top_k, or None
+        """
         try:
-            model_path = self.models_dir / "fashion_classifier.h5"
+            runtime = runtime or self.classifier_runtime
+            if runtime != "auto" and runtime not in CLASSIFIER_RUNTIME_FILES:
+                raise ValueError(f"Unsupported classifier runtime: {runtime}")
             
-            if not model_path.exists():
-                logger.warning(f"Fashion classifier model not found at {model_path}")
+            resolved = self._resolve_classifier_runtime(runtime)
+            if resolved is None:
+                logger.warning(f"Fashion classifier model for runtime '{runtime}' not found in {self.models_dir}")
                 return None
+            runtime, model_path = resolved
+            
+            try:
+                from ..models import classifier_runtimes
+            except ImportError:
+                from models import classifier_runtimes
             
-            # Load TensorFlow model
-            import tensorflow as tf
-            model = tf.keras.models.load_model(str(model_path))
+            if runtime == "tflite":
+                model = classifier_runtimes.TFLiteFashionClassifier(str(model_path), num_threads=self.num_threads)
+            elif runtime == "onnx":
+                model = classifier_runtimes.ONNXFashionClassifier(str(model_path), num_threads=self.num_threads)
+            else:
+                # Wrapped so callers get class probabilities and batched, graph-mode inference
+                try:
+                    from ..models.fashion_classifier import FashionClassifier
+                except ImportError:
+                    from models.fashion_classifier import FashionClassifier
+                model = FashionClassifier(model_path=str(model_path))
+                # The wrapper falls back to an untrained network rather than raising
+                if not model.loaded_from_path:
+                    logger.error(f"❌ Could not load fashion classifier weights from {model_path}")
+                    return None
             
-            logger.info("✅ Fashion classifier loaded successfully")
+            logger.info(f"✅ Fashion classifier loaded successfully ({runtime}: {model_path.name})")
             return model
             
         except Exception as e:
@@ -79,9 +256,29 @@ class ModelLoader:
             logger.error(f"❌ Error loading color analyzer: {e}")
             return None
     
-    def save_model(self, model: Any, model_name: str, model_type: str = "tf") -> bool:
-        """Save a model to the models directory"""
+    def save_model(
+        self,
+        model: Any,
+        model_name: str,
+        model_type: str = "tf",
+        quantization: str = "dynamic",
+        representative_data: Optional[Iterable[np.ndarray]] = None
+    ) -> bool:
+        """
+        Save a model to the models directory
+        
+        Args:
+            model: Keras model (or FashionClassifier) for "tf", "tflite" and "onnx"; any picklable model for "sklearn"
+            model_name: File name without extension
+            model_type: "tf" (.h5), "sklearn" (.pkl), "tflite" (.tflite) or "onnx" (.onnx)
+            quantization: TFLite only - "none", "dynamic" (int8 weights) or "int8" (int8 weights and activations)
+            representative_data: TFLite int8 only - sample input batches used to calibrate activation ranges
+        """
         try:
+            if model_type in ("tflite", "onnx"):
+                # Exports need the underlying Keras graph
+                model = getattr(model, "model", model)
+            
             if model_type == "tf":
                 model_path = self.models_dir / f"{model_name}.h5"
                 model.save(str(model_path))
@@ -90,6 +287,15 @@ class ModelLoader:
                 import pickle
                 with open(model_path, 'wb') as f:
                     pickle.dump(model, f)
+            elif model_type == "tflite":
+                model_path = self.models_dir / f"{model_name}.tflite"
+                model_path.write_bytes(self._convert_tflite(model, quantization, representative_data))
+            elif model_type == "onnx":
+                model_path = self.models_dir / f"{model_name}.onnx"
+                import tf2onnx
+                import tensorflow as tf
+                input_signature = [tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name="images")]
+                tf2onnx.convert.from_keras(model, input_signature=input_signature, opset=13, output_path=str(model_path))
             else:
                 raise ValueError(f"Unsupported model type: {model_type}")
             
@@ -100,6 +306,26 @@ class ModelLoader:
             logger.error(f"❌ Error saving model: {e}")
             return False
     
+    @staticmethod
+    def _convert_tflite(model: Any, quantization: str, representative_data: Optional[Iterable[np.ndarray]]) -> bytes:
+        """Convert a Keras model to a TFLite flatbuffer with the requested quantization"""
+        import tensorflow as tf
+        
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        if quantization == "dynamic":
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        elif quantization == "int8":
+            if representative_data is None:
+                raise ValueError("int8 quantization needs representative_data for calibration")
+            samples = list(representative_data)
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = lambda: ([np.asarray(batch, dtype=np.float32)] for batch in samples)
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+            # Float input/output keep the same calling convention as the Keras model
+        elif quantization != "none":
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        return converter.convert()
+    
     def list_available_models(self) -> list:
         """List all available models in the models directory"""
         try:
@@ -119,6 +345,7 @@ class ModelLoader:
     
     def model_exists(self, model_name: str) -> bool:
         """Check if a model exists"""
-        h5_path = self.models_dir / f"{model_name}.h5"
-        pkl_path = self.models_dir / f"{model_name}.pkl"
-        return h5_path.exists() or pkl_path.exists()
+        return any(
+            (self.models_dir / f"{model_name}{extension}").exists()
+            for extension in (".h5", ".pkl", ".tflite", ".onnx")
+        )